@@ -1,8 +1,10 @@
 """
 Simple API for Nigerian City Distance Calculator - Frontend Optimized (v2.0)
 """
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import os
+import threading
 import urllib.parse
 
 # 10 Selected Nigerian states for frontend visualization
@@ -77,6 +79,16 @@ ROADS = {
     ("Anambra", "Oyo"): 220
 }
 
+# Headers sent with every JSON response
+# Longest request body read; longer ones are refused with 413
+MAX_BODY_BYTES = 64 * 1024
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
 def dijkstra_algorithm(cities, roads, start, end):
     """Dijkstra's algorithm implementation for shortest path finding."""
     if start not in cities or end not in cities:
@@ -225,14 +237,7 @@ class handler(BaseHTTPRequestHandler):
                 "total": len(cities_list)
             }
             
-            # Set JSON headers
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            self.wfile.write(json.dumps(response, indent=2).encode())
+            self._send_json(response)
             return
             
         elif path == '/calculate':
@@ -242,14 +247,7 @@ class handler(BaseHTTPRequestHandler):
             
             response = calculate_distance(from_city, to_city)
             
-            # Set JSON headers
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            self.wfile.write(json.dumps(response, indent=2).encode())
+            self._send_json(response)
             return
             
         elif path == '/docs':
@@ -300,11 +298,11 @@ class handler(BaseHTTPRequestHandler):
 </body>
 </html>"""
             
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(swagger_html.encode('utf-8'))
+            self._send_body(
+                swagger_html.encode('utf-8'),
+                'text/html; charset=utf-8',
+                headers={'Cache-Control': 'no-cache'},
+            )
             return
             
         elif path == '/openapi.json':
@@ -447,12 +445,11 @@ class handler(BaseHTTPRequestHandler):
                 }
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(json.dumps(openapi_spec, indent=2).encode('utf-8'))
+            self._send_body(
+                json.dumps(openapi_spec, indent=2).encode('utf-8'),
+                'application/json; charset=utf-8',
+                headers={'Access-Control-Allow-Origin': '*', 'Cache-Control': 'no-cache'},
+            )
             return
             
         else:
@@ -470,61 +467,191 @@ class handler(BaseHTTPRequestHandler):
                 "available_cities": list(CITIES.keys())
             }
             
-            # Set JSON headers
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            self.wfile.write(json.dumps(response, indent=2).encode())
+            self._send_json(response)
             return
     
     def do_POST(self):
         """Handle POST requests"""
-        # Set CORS headers
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        
+        # Read the body before committing to a status line, so a kept-alive
+        # connection is left at the start of the next request
+        body_status, post_data = self._read_body()
         if self.path == '/calculate-route':
-            # Get request body
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            if post_data is None:
+                self._send_json({
+                    "success": False,
+                    "error": ("Request body too large" if body_status == 413
+                              else "Invalid Content-Length header"),
+                    "distance": None,
+                    "distance_unit": "km",
+                    "path": []
+                }, status=body_status)
+                return
             
             try:
                 data = json.loads(post_data.decode('utf-8'))
-                from_city = data.get('from_city')
-                to_city = data.get('to_city')
-                
-                response = calculate_distance(from_city, to_city)
-                
-            except json.JSONDecodeError:
-                response = {
+                if not isinstance(data, dict):
+                    raise ValueError("Request body must be a JSON object")
+            except (UnicodeDecodeError, ValueError):
+                self._send_json({
                     "success": False,
                     "error": "Invalid JSON in request body",
                     "distance": None,
                     "distance_unit": "km",
                     "path": []
-                }
+                }, status=400)
+                return
+            
+            from_city = data.get('from_city')
+            to_city = data.get('to_city')
+            
+            self._send_json(calculate_distance(from_city, to_city))
         else:
-            response = {
+            self._send_json({
                 "success": False,
                 "error": "Endpoint not found",
                 "distance": None,
                 "distance_unit": "km",
                 "path": []
-            }
-        
-        self.wfile.write(json.dumps(response, indent=2).encode())
+            }, status=404)
     
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
\ No newline at end of file
+        self._read_body()
+        self._send_body(b'', None)
+    
+    def _read_body(self):
+        """
+        Read the request body.
+        
+        Returns ``(status, body)``: 200 and the body, or None with 400 when
+        its length is unknown and 413 when it is longer than
+        ``MAX_BODY_BYTES``. The connection is closed after the response when
+        the body is not read, since whatever is left of it would be taken for
+        the next request.
+        """
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            content_length = -1
+        if content_length < 0 or 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+            return 400, None
+        if content_length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return 413, None
+        return 200, self.rfile.read(content_length)
+    
+    def _send_json(self, payload, status=200):
+        """Send a JSON response with CORS headers."""
+        self._send_body(json.dumps(payload, indent=2).encode(), 'application/json', status=status)
+    
+    def _send_body(self, body, content_type, status=200, headers=None):
+        """
+        Send a complete response.
+        
+        Every response carries an exact Content-Length so that HTTP/1.1
+        clients can reuse the connection for the next request.
+        """
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-type', content_type)
+        if headers is None:
+            headers = CORS_HEADERS
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with a cap on concurrent connection threads.
+    
+    ``ThreadingHTTPServer`` starts one thread per accepted connection with
+    no upper bound. Here the accept loop blocks once ``max_threads``
+    connections are being served, leaving further clients waiting in the
+    listen backlog (``request_queue_size``) instead of spawning threads
+    without limit.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, server_address, handler_class, max_threads=32, queue_size=128):
+        self.request_queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(max_threads)
+        super().__init__(server_address, handler_class)
+    
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+class keepalive_handler(handler):
+    """HTTP/1.1 variant of ``handler`` with persistent connections."""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    # Idle keep-alive connections give their thread back after this many seconds
+    timeout = 15
+
+
+def make_server(host='127.0.0.1', port=8002, max_threads=32, queue_size=128, keepalive_timeout=15):
+    """
+    Bind the threaded HTTP/1.1 server that :func:`run` serves.
+    
+    Args:
+        host: Interface to bind
+        port: Port to listen on, or 0 for any free port
+        max_threads: Maximum number of connections served concurrently
+        queue_size: Listen backlog for connections waiting for a free thread
+        keepalive_timeout: Seconds an idle keep-alive connection is held open
+    """
+    handler_class = type('keepalive_handler', (keepalive_handler,), {'timeout': keepalive_timeout})
+    return BoundedThreadingHTTPServer(
+        (host, port), handler_class, max_threads=max_threads, queue_size=queue_size
+    )
+
+
+def run(host='127.0.0.1', port=8002, max_threads=32, queue_size=128, keepalive_timeout=15):
+    """Serve the API locally outside Vercel; takes the arguments of :func:`make_server`."""
+    server = make_server(host, port, max_threads, queue_size, keepalive_timeout)
+    host, port = server.server_address[:2]
+    print(f"🚀 Serving API on http://{host}:{port} "
+          f"(threads: {max_threads}, queue: {queue_size}, keep-alive: {keepalive_timeout}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Run the city distance API with a threaded HTTP/1.1 server')
+    parser.add_argument('--host', default=os.environ.get('API_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', 8002)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('API_MAX_THREADS', 32)),
+                        help='Maximum number of concurrently served connections')
+    parser.add_argument('--queue-size', type=int, default=int(os.environ.get('API_QUEUE_SIZE', 128)),
+                        help='Listen backlog for connections waiting for a thread')
+    parser.add_argument('--keepalive-timeout', type=int, default=int(os.environ.get('API_KEEPALIVE_TIMEOUT', 15)),
+                        help='Seconds an idle keep-alive connection is held open')
+    args = parser.parse_args()
+    
+    run(args.host, args.port, args.threads, args.queue_size, args.keepalive_timeout)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import querycount, signals  # noqa: F401
+        from django.conf import settings
+        if settings.MEMORY_TRACEMALLOC:
+            from .memory import start_tracing
+            start_tracing()
@@ -0,0 +1,74 @@
+"""
+Small thread-safe LRU cache used for rendered route responses.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Least-recently-used cache with hit/miss counters and a byte estimate."""
+
+    def __init__(self, maxsize: int, sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.nbytes -= self.sizeof(previous)
+            self._data[key] = value
+            self.nbytes += self.sizeof(value)
+            while len(self._data) > self.maxsize:
+                self._evict_oldest()
+
+    def evict(self, count: int = 1) -> int:
+        """Drop up to ``count`` least recently used entries; returns how many went."""
+        with self._lock:
+            evicted = 0
+            while self._data and evicted < count:
+                self._evict_oldest()
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'nbytes': self.nbytes,
+        }
+
+    def _evict_oldest(self):
+        _, value = self._data.popitem(last=False)
+        self.nbytes -= self.sizeof(value)
@@ -1,46 +1,341 @@
 """
 Dijkstra's Algorithm implementation for finding shortest paths between Nigerian cities.
+
+The graph is loaded with one column query per table. Rows carry an
+``updated_at`` stamp, so a loaded graph can be brought up to date by reading
+only the rows changed since (see :meth:`DijkstraGraph.refreshed`). Each
+process compares the shared change log with the state its graph was loaded
+at, at most every ``GRAPH_CHANGE_CHECK_SECONDS``, and refreshes the graph
+when another process changed the network.
 """
+import hashlib
 import heapq
-from typing import Dict, List, Tuple, Optional
+import sys
+import threading
+import time
+from datetime import timedelta
+from itertools import chain, count
+from typing import Dict, Iterator, List, Set, Tuple, Optional
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DatabaseError
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from cities.changelog import change_stamp
 from cities.models import City, RoadConnection
+from geo.snapshot import GraphSnapshot
+from . import metrics
+from .executor import leased_executor
+from .geometry import route_geometry
+from .search import DEADLINE_CHECK_POPS, SearchCancelled, SearchStats, collect_trace, current_deadline
+from .spatial import nearest_cities, snap_to_road
+from .timing import note, span
+
+# Columns read by the graph loader. Coordinates and distances are cast to
+# floats by the database rather than converted from Decimals row by row.
+CITY_COLUMNS = ('id', 'name', 'state', 'lat', 'lng', 'population', 'is_capital')
+ROAD_COLUMNS = ('id', 'from_city_id', 'to_city_id', 'km', 'is_bidirectional', 'geometry')
+
+# IDs per query when fetching rows by ID
+ID_CHUNK = 500
+
+_DIGEST_MASK = (1 << 64) - 1
+
+# Creation order of graphs; a later graph holds data at least as new
+_graph_serials = count()
+
+
+def city_rows(queryset):
+    return queryset.order_by().annotate(
+        lat=Cast('latitude', FloatField()), lng=Cast('longitude', FloatField()),
+    ).values_list(*CITY_COLUMNS)
+
+
+def road_rows(queryset):
+    return queryset.order_by().annotate(km=Cast('distance_km', FloatField())).values_list(*ROAD_COLUMNS)
+
+
+def city_record(row: Tuple) -> Dict:
+    """Catalog entry of a ``CITY_COLUMNS`` row."""
+    city_id, name, state, latitude, longitude, population, is_capital = row
+    return {
+        'id': city_id,
+        'name': name,
+        'state': state,
+        'latitude': latitude,
+        'longitude': longitude,
+        'population': population,
+        'is_capital': is_capital,
+    }
+
+
+def _row_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+def city_hash(city: Dict) -> int:
+    return _row_hash(f"c{city['id']}|{city['name']}|{city['state']}|{city['latitude']!r}|{city['longitude']!r}"
+                     f"|{city['population']}|{city['is_capital']}")
+
+
+def edge_hash(connection_id: int, edge: Tuple[int, int, float, bool], geometry: str) -> int:
+    from_id, to_id, distance, bidirectional = edge
+    return _row_hash(f"r{connection_id}|{from_id}|{to_id}|{distance!r}|{bidirectional}|{geometry}")
 
 
 class DijkstraGraph:
     """Graph representation for Dijkstra's algorithm."""
     
-    def __init__(self):
+    def __init__(self, load: bool = True):
+        self.serial = next(_graph_serials)
         self.graph = {}
-        self._build_graph()
+        # City catalog keyed by ID, so request paths never need the ORM
+        self.cities = {}
+        self.name_index = {}
+        # Road connections by ID: (from_id, to_id, distance_km, is_bidirectional)
+        self.edges = {}
+        # Encoded polyline shapes of the connections that store one
+        self.geometries = {}
+        self.connection_count = 0
+        self.version = None
+        self.built_at = None
+        self.build_seconds = 0.0
+        # When the rows were read; the next refresh reads the rows updated since
+        self.synced_at = None
+        # Change log stamp taken before the rows were read
+        self.change_stamp = None
+        # Sum of the row hashes, so the version can be updated row by row
+        self._digest = 0
+        self._snapshot = None
+        self._sorted_city_ids = None
+        # Optional structures derived from this graph (indexes, encoded
+        # fragments), built lazily by other modules and safe to drop
+        self.artifacts = {}
+        if load:
+            self._build_graph()
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: GraphSnapshot) -> 'DijkstraGraph':
+        """
+        Graph over a snapshot's nodes and edges, without touching the database.
+        
+        Used to benchmark searches on imported graphs: only the adjacency and
+        version are filled in, so the city catalog is empty.
+        """
+        started = time.perf_counter()
+        graph = cls(load=False)
+        node_ids, offsets, targets, weights = snapshot.node_ids, snapshot.offsets, snapshot.targets, snapshot.weights
+        for index, node_id in enumerate(node_ids):
+            graph.graph[node_id] = [
+                (node_ids[targets[edge]], weights[edge]) for edge in range(offsets[index], offsets[index + 1])
+            ]
+        graph.connection_count = snapshot.edge_count
+        graph.version = snapshot.version
+        graph.built_at = timezone.now()
+        graph.build_seconds = time.perf_counter() - started
+        graph._snapshot = snapshot
+        return graph
     
     def _build_graph(self):
         """Build the graph from database connections."""
+        started = time.perf_counter()
+        self.change_stamp = change_stamp()
+        synced_at = timezone.now()
+        digest = 0
+        
         # Initialize all cities
-        cities = City.objects.all()
-        for city in cities:
-            self.graph[city.id] = []
+        for row in city_rows(City.objects.all()):
+            city = city_record(row)
+            self.graph[city['id']] = []
+            self.cities[city['id']] = city
+            self.name_index[city['name'].casefold()] = city['id']
+            digest += city_hash(city)
         
         # Add connections
-        connections = RoadConnection.objects.select_related('from_city', 'to_city').all()
-        for connection in connections:
-            from_id = connection.from_city.id
-            to_id = connection.to_city.id
-            distance = float(connection.distance_km)
-            
+        for connection_id, from_id, to_id, distance, bidirectional, geometry in road_rows(RoadConnection.objects.all()):
             # Add forward connection
             self.graph[from_id].append((to_id, distance))
             
             # Add backward connection if bidirectional
-            if connection.is_bidirectional:
+            if bidirectional:
                 self.graph[to_id].append((from_id, distance))
+            
+            edge = self.edges[connection_id] = (from_id, to_id, distance, bidirectional)
+            if geometry:
+                self.geometries[connection_id] = geometry
+            digest += edge_hash(connection_id, edge, geometry)
+        
+        self.connection_count = len(self.edges)
+        self._digest = digest & _DIGEST_MASK
+        self.version = f'{self._digest:016x}'
+        self.synced_at = synced_at
+        self.built_at = timezone.now()
+        self.build_seconds = time.perf_counter() - started
+    
+    def _changed_rows(self, model, rows, known: Dict) -> Tuple[Dict[int, Tuple], Set[int]]:
+        """
+        Rows of ``model`` changed since the last sync by ID, and the IDs of deleted rows.
+        
+        Rows are read back to ``GRAPH_SYNC_OVERLAP_SECONDS`` before the last
+        sync, to catch rows stamped before a slow transaction committed or by
+        a server with a lagging clock. Deletes, and inserts missed
+        anyway, show up as a row count that differs from the graph's; the IDs
+        are then compared to find them.
+        """
+        queryset = model.objects.all()
+        if self.synced_at is not None:
+            since = self.synced_at - timedelta(seconds=settings.GRAPH_SYNC_OVERLAP_SECONDS)
+            queryset = queryset.filter(updated_at__gte=since)
+        changed = {row[0]: row for row in rows(queryset)}
+        expected = len(known) + sum(1 for row_id in changed if row_id not in known)
+        deleted = set()
+        if model.objects.count() != expected:
+            ids = set(model.objects.order_by().values_list('id', flat=True))
+            deleted = known.keys() - ids
+            missing = sorted(ids - known.keys() - changed.keys())
+            for start in range(0, len(missing), ID_CHUNK):
+                chunk = missing[start:start + ID_CHUNK]
+                changed.update((row[0], row) for row in rows(model.objects.filter(id__in=chunk)))
+        return changed, deleted
     
-    def dijkstra(self, start_city_id: int, end_city_id: int) -> Tuple[float, List[int]]:
+    def refreshed(self) -> 'DijkstraGraph':
+        """
+        This graph brought up to date with the database, reading only changed rows.
+        
+        Returns the graph itself when nothing changed. Otherwise returns a new
+        graph that shares the adjacency lists of the cities not touched by the
+        changes, so searches running on this one are not disturbed. Derived
+        artifacts are not carried over.
+        """
+        started = time.perf_counter()
+        stamp = change_stamp()
+        synced_at = timezone.now()
+        changed_cities, deleted_cities = self._changed_rows(City, city_rows, self.cities)
+        changed_roads, deleted_roads = self._changed_rows(RoadConnection, road_rows, self.edges)
+        
+        # Rows read again by the overlap are usually unchanged
+        city_updates = [city for city in map(city_record, changed_cities.values())
+                        if city != self.cities.get(city['id'])]
+        road_updates = [row for row in changed_roads.values()
+                        if row[1:5] != self.edges.get(row[0]) or row[5] != self.geometries.get(row[0], '')]
+        if not (city_updates or road_updates or deleted_cities or deleted_roads):
+            self.synced_at = synced_at
+            self.change_stamp = stamp
+            return self
+        
+        graph = DijkstraGraph(load=False)
+        graph.cities = dict(self.cities)
+        graph.name_index = dict(self.name_index)
+        graph.edges = dict(self.edges)
+        graph.geometries = dict(self.geometries)
+        adjacency = graph.graph = dict(self.graph)
+        copied = set()
+        digest = self._digest
+        
+        def neighbours(city_id):
+            # Copy a shared adjacency list before its first change
+            if city_id not in copied:
+                adjacency[city_id] = list(adjacency.get(city_id, ()))
+                copied.add(city_id)
+            return adjacency[city_id]
+        
+        # Deleted and changed connections leave the adjacency lists first
+        for connection_id in chain(deleted_roads, (row[0] for row in road_updates)):
+            edge = graph.edges.pop(connection_id, None)
+            if edge is None:
+                continue
+            digest -= edge_hash(connection_id, edge, graph.geometries.pop(connection_id, ''))
+            from_id, to_id, distance, bidirectional = edge
+            neighbours(from_id).remove((to_id, distance))
+            if bidirectional:
+                neighbours(to_id).remove((from_id, distance))
+        
+        for city_id in chain(deleted_cities, (city['id'] for city in city_updates)):
+            previous = graph.cities.pop(city_id, None)
+            if previous is None:
+                continue
+            digest -= city_hash(previous)
+            if graph.name_index.get(previous['name'].casefold()) == city_id:
+                del graph.name_index[previous['name'].casefold()]
+        for city_id in deleted_cities:
+            adjacency.pop(city_id, None)
+        # Names are indexed once all old names are gone, in case two cities swapped theirs
+        for city in city_updates:
+            graph.cities[city['id']] = city
+            graph.name_index[city['name'].casefold()] = city['id']
+            adjacency.setdefault(city['id'], [])
+            digest += city_hash(city)
+        
+        for connection_id, from_id, to_id, distance, bidirectional, geometry in road_updates:
+            neighbours(from_id).append((to_id, distance))
+            if bidirectional:
+                neighbours(to_id).append((from_id, distance))
+            edge = graph.edges[connection_id] = (from_id, to_id, distance, bidirectional)
+            if geometry:
+                graph.geometries[connection_id] = geometry
+            digest += edge_hash(connection_id, edge, geometry)
+        
+        graph.connection_count = len(graph.edges)
+        graph._digest = digest & _DIGEST_MASK
+        graph.version = f'{graph._digest:016x}'
+        graph.synced_at = synced_at
+        graph.change_stamp = stamp
+        graph.built_at = timezone.now()
+        graph.build_seconds = time.perf_counter() - started
+        return graph
+    
+    def find_city(self, name: str) -> Optional[Dict]:
+        """Look up a city by name, ignoring case."""
+        city_id = self.name_index.get(name.strip().casefold()) if name else None
+        return self.cities.get(city_id) if city_id is not None else None
+    
+    def sorted_city_ids(self) -> List[int]:
+        """City IDs in ascending order, for keyset pagination over the catalog."""
+        if self._sorted_city_ids is None:
+            self._sorted_city_ids = sorted(self.cities)
+        return self._sorted_city_ids
+    
+    def nbytes(self) -> int:
+        """
+        Estimated memory held by the adjacency lists, catalog and edge tables.
+        
+        Containers are measured exactly; the entries in them are counted at
+        the size of a typical one.
+        """
+        size = sum(sys.getsizeof(table) for table in
+                   (self.graph, self.cities, self.name_index, self.edges, self.geometries))
+        neighbour = sys.getsizeof((0, 0.0)) + sys.getsizeof(0.0)
+        for neighbours in self.graph.values():
+            size += sys.getsizeof(neighbours) + len(neighbours) * neighbour
+        if self.cities:
+            city = next(iter(self.cities.values()))
+            size += len(self.cities) * (sys.getsizeof(city) + sum(sys.getsizeof(value) for value in city.values()))
+            size += sum(sys.getsizeof(name) for name in self.name_index)
+        size += len(self.edges) * (sys.getsizeof((0, 0, 0.0, True)) + sys.getsizeof(0.0))
+        size += sum(sys.getsizeof(shape) for shape in self.geometries.values())
+        return size
+    
+    def stats(self) -> Dict:
+        """Summary statistics for the loaded graph."""
+        return {
+            'version': self.version,
+            'total_cities': len(self.cities),
+            'total_road_connections': self.connection_count,
+            'built_at': self.built_at.isoformat() if self.built_at else None,
+            'build_seconds': round(self.build_seconds, 6),
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+        }
+    
+    def dijkstra(self, start_city_id: int, end_city_id: int,
+                 stats: Optional[SearchStats] = None) -> Tuple[float, List[int]]:
         """
         Find shortest path between two cities using Dijkstra's algorithm.
         
         Args:
             start_city_id: ID of the starting city
             end_city_id: ID of the destination city
+            stats: Filled in with the work done by the search, if given
             
         Returns:
             Tuple of (total_distance, path_city_ids)
@@ -51,6 +346,9 @@ class DijkstraGraph:
         if start_city_id == end_city_id:
             return 0.0, [start_city_id]
         
+        started = time.perf_counter()
+        deadline = current_deadline()
+        
         # Initialize distances and previous nodes
         distances = {city_id: float('inf') for city_id in self.graph}
         previous = {city_id: None for city_id in self.graph}
@@ -59,9 +357,17 @@ class DijkstraGraph:
         # Priority queue: (distance, city_id)
         pq = [(0, start_city_id)]
         visited = set()
+        # Counted per pop and per settled city rather than per edge, which
+        # keeps them off the inner loop; the heap peaks right after a
+        # settled city's edges are relaxed
+        pops = relaxed = 0
+        max_heap = 1
         
         while pq:
             current_distance, current_city = heapq.heappop(pq)
+            pops += 1
+            if deadline is not None and not pops % DEADLINE_CHECK_POPS and time.perf_counter() >= deadline:
+                raise SearchCancelled
             
             if current_city in visited:
                 continue
@@ -73,7 +379,9 @@ class DijkstraGraph:
                 break
             
             # Check all neighbors
-            for neighbor_id, edge_distance in self.graph[current_city]:
+            edges = self.graph[current_city]
+            relaxed += len(edges)
+            for neighbor_id, edge_distance in edges:
                 if neighbor_id in visited:
                     continue
                 
@@ -83,6 +391,16 @@ class DijkstraGraph:
                     distances[neighbor_id] = new_distance
                     previous[neighbor_id] = current_city
                     heapq.heappush(pq, (new_distance, neighbor_id))
+            
+            if len(pq) > max_heap:
+                max_heap = len(pq)
+        
+        if stats is not None:
+            stats.settled = len(visited)
+            stats.relaxed = relaxed
+            stats.pushes = pops + len(pq) - 1
+            stats.max_heap = max_heap
+            stats.seconds = time.perf_counter() - started
         
         # Reconstruct path
         if distances[end_city_id] == float('inf'):
@@ -97,90 +415,616 @@ class DijkstraGraph:
         path.reverse()
         return distances[end_city_id], path
     
+    def trace(self, start_city_id: int, end_city_id: int,
+              stats: Optional[SearchStats] = None) -> Iterator[Dict]:
+        """
+        Run :meth:`dijkstra` step by step, yielding its search events.
+        
+        See :mod:`api.search` for the events. The last one is ``done`` with
+        the distance and path. Kept apart from :meth:`dijkstra` so untraced
+        searches pay nothing for tracing.
+        """
+        if start_city_id not in self.graph or end_city_id not in self.graph:
+            raise ValueError("Invalid city IDs")
+        
+        started = time.perf_counter()
+        distances = {start_city_id: 0.0}
+        previous = {start_city_id: None}
+        pq = [(0.0, start_city_id)]
+        visited = set()
+        relaxed = pushes = 0
+        max_heap = 1
+        yield {'event': 'push', 'city': start_city_id, 'distance': 0.0, 'via': None}
+        
+        while pq:
+            current_distance, current_city = heapq.heappop(pq)
+            if current_city in visited:
+                continue
+            visited.add(current_city)
+            yield {'event': 'settle', 'city': current_city, 'distance': round(current_distance, 6)}
+            if current_city == end_city_id:
+                break
+            
+            relaxed += len(self.graph[current_city])
+            for neighbor_id, edge_distance in self.graph[current_city]:
+                if neighbor_id in visited:
+                    continue
+                new_distance = current_distance + edge_distance
+                if new_distance < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_distance
+                    previous[neighbor_id] = current_city
+                    heapq.heappush(pq, (new_distance, neighbor_id))
+                    pushes += 1
+                    max_heap = max(max_heap, len(pq))
+                    yield {'event': 'push', 'city': neighbor_id, 'distance': round(new_distance, 6),
+                           'via': current_city}
+        
+        if stats is not None:
+            stats.settled = len(visited)
+            stats.relaxed = relaxed
+            stats.pushes = pushes
+            stats.max_heap = max_heap
+            stats.seconds = time.perf_counter() - started
+        
+        distance = distances.get(end_city_id, float('inf'))
+        path = []
+        if distance != float('inf'):
+            current = end_city_id
+            while current is not None:
+                path.append(current)
+                current = previous[current]
+            path.reverse()
+        yield {'event': 'done', 'distance': round(distance, 6) if path else None, 'path': path}
+    
+    def one_to_many(self, start_city_id: int, end_city_ids: List[int],
+                    with_paths: bool = True) -> Tuple[List[float], Optional[List[List[int]]]]:
+        """
+        Find shortest paths from one city to several destinations in a single search.
+        
+        The search stops once every destination has been settled.
+        
+        Args:
+            start_city_id: ID of the starting city
+            end_city_ids: IDs of the destination cities
+            with_paths: Whether to reconstruct paths as well as distances
+            
+        Returns:
+            Tuple of (distances, paths) aligned with ``end_city_ids``. Unreachable
+            destinations get ``inf`` and an empty path; ``paths`` is None when
+            ``with_paths`` is False.
+        """
+        distances = {start_city_id: 0.0}
+        previous = {start_city_id: None}
+        remaining = set(end_city_ids)
+        remaining.discard(start_city_id)
+        visited = set()
+        pq = [(0.0, start_city_id)]
+        deadline = current_deadline()
+        pops = 0
+        
+        while pq and remaining:
+            current_distance, current_city = heapq.heappop(pq)
+            if deadline is not None:
+                pops += 1
+                if not pops % DEADLINE_CHECK_POPS and time.perf_counter() >= deadline:
+                    raise SearchCancelled
+            
+            if current_city in visited:
+                continue
+            
+            visited.add(current_city)
+            remaining.discard(current_city)
+            
+            for neighbor_id, edge_distance in self.graph[current_city]:
+                if neighbor_id in visited:
+                    continue
+                
+                new_distance = current_distance + edge_distance
+                
+                if new_distance < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_distance
+                    previous[neighbor_id] = current_city
+                    heapq.heappush(pq, (new_distance, neighbor_id))
+        
+        result_distances = [distances.get(city_id, float('inf')) for city_id in end_city_ids]
+        if not with_paths:
+            return result_distances, None
+        
+        paths = []
+        for city_id in end_city_ids:
+            path = []
+            current = city_id if city_id in previous else None
+            while current is not None:
+                path.append(current)
+                current = previous[current]
+            path.reverse()
+            paths.append(path)
+        return result_distances, paths
+    
+    def search_between(self, sources: Dict[int, float],
+                       targets: Dict[int, float]) -> Tuple[float, List[int]]:
+        """
+        Find the cheapest path from any source city to any target city.
+        
+        Used to route between points on roads: ``sources`` maps each city the
+        route may start from to the cost of reaching it from the start point,
+        and ``targets`` maps each city the route may end at to the cost of
+        getting from it to the end point.
+        
+        Returns:
+            Tuple of (total_distance including both offsets, path_city_ids);
+            ``(inf, [])`` when no target is reachable
+        """
+        distances = dict(sources)
+        previous = {city_id: None for city_id in sources}
+        pq = [(distance, city_id) for city_id, distance in sources.items()]
+        heapq.heapify(pq)
+        visited = set()
+        best_distance, best_city = float('inf'), None
+        
+        while pq:
+            current_distance, current_city = heapq.heappop(pq)
+            
+            # Offsets are never negative, so nothing left in the queue can do better
+            if current_distance >= best_distance:
+                break
+            if current_city in visited:
+                continue
+            
+            visited.add(current_city)
+            
+            if current_city in targets and current_distance + targets[current_city] < best_distance:
+                best_distance = current_distance + targets[current_city]
+                best_city = current_city
+            
+            for neighbor_id, edge_distance in self.graph[current_city]:
+                if neighbor_id in visited:
+                    continue
+                
+                new_distance = current_distance + edge_distance
+                
+                if new_distance < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_distance
+                    previous[neighbor_id] = current_city
+                    heapq.heappush(pq, (new_distance, neighbor_id))
+        
+        if best_city is None:
+            return float('inf'), []
+        
+        path = []
+        current = best_city
+        while current is not None:
+            path.append(current)
+            current = previous[current]
+        
+        path.reverse()
+        return best_distance, path
+    
+    def snapshot(self) -> GraphSnapshot:
+        """Compact CSR copy of the graph, built once per graph."""
+        if self._snapshot is None:
+            self._snapshot = GraphSnapshot.from_adjacency(self.graph, self.version)
+        return self._snapshot
+    
     def get_city_details(self, city_ids: List[int]) -> List[Dict]:
         """Get city details for a list of city IDs."""
-        cities = City.objects.filter(id__in=city_ids)
-        city_dict = {city.id: city for city in cities}
-        
-        return [
-            {
-                'id': city_id,
-                'name': city_dict[city_id].name,
-                'state': city_dict[city_id].state,
-                'latitude': float(city_dict[city_id].latitude),
-                'longitude': float(city_dict[city_id].longitude),
-            }
-            for city_id in city_ids
-        ]
+        return [route_city(self.cities[city_id]) for city_id in city_ids]
+
+
+def route_city(city: Dict) -> Dict:
+    """The subset of a catalog entry included in route responses."""
+    return {
+        'id': city['id'],
+        'name': city['name'],
+        'state': city['state'],
+        'latitude': city['latitude'],
+        'longitude': city['longitude'],
+    }
 
 
-def calculate_shortest_route(from_city_name: str, to_city_name: str) -> Dict:
+_shared_graph = None
+_shared_graph_generation = 0
+_shared_graph_lock = threading.Lock()
+# Invalidated graph that the next build refreshes instead of reloading
+_stale_graph = None
+# Version of the last graph installed, kept across invalidations for metrics
+_installed_version = None
+# When get_graph() next compares the change log with the graph's stamp
+_next_change_check = 0.0
+
+
+def _install(graph: DijkstraGraph, previous: Optional[DijkstraGraph]):
+    global _shared_graph, _stale_graph, _installed_version
+    _shared_graph = graph
+    _stale_graph = None
+    if graph is not previous:
+        metrics.graph_built(graph, _installed_version)
+        _installed_version = graph.version
+
+
+def get_graph() -> DijkstraGraph:
+    """
+    Return the process-wide graph, building it on first use.
+    
+    The graph is rebuilt lazily after :func:`invalidate_graph`, by applying
+    the changed rows to the old graph when ``GRAPH_DELTA_SYNC`` is on.
+    Building hits the database, so async callers should run this off the
+    event loop.
+    """
+    graph = _shared_graph
+    if graph is not None:
+        if change_check_due():
+            return _check_changes(graph)
+        return graph
+    
+    with _shared_graph_lock:
+        if _shared_graph is None:
+            generation = _shared_graph_generation
+            base = _stale_graph if settings.GRAPH_DELTA_SYNC else None
+            graph = base.refreshed() if base is not None else DijkstraGraph()
+            # Don't install a graph that was invalidated while it was being built
+            if generation == _shared_graph_generation:
+                _install(graph, base)
+            return graph
+        return _shared_graph
+
+
+def _refresh(graph: DijkstraGraph) -> DijkstraGraph:
+    # Called with the lock held
+    generation = _shared_graph_generation
+    refreshed = graph.refreshed() if settings.GRAPH_DELTA_SYNC else DijkstraGraph()
+    if generation == _shared_graph_generation:
+        _install(refreshed, graph)
+    return refreshed
+
+
+def refresh_graph() -> DijkstraGraph:
+    """
+    Bring the process-wide graph up to date with the database.
+    
+    Only the rows changed since it was loaded are read (or the whole graph
+    without ``GRAPH_DELTA_SYNC``), and requests keep using the current graph
+    until the refreshed one is installed.
+    """
+    with _shared_graph_lock:
+        graph = _shared_graph
+        if graph is not None:
+            return _refresh(graph)
+    return get_graph()
+
+
+def change_check_due() -> bool:
+    """Whether the next :func:`get_graph` call compares the change log with the loaded graph."""
+    return (bool(settings.GRAPH_CHANGE_CHECK_SECONDS) and _shared_graph is not None
+            and time.monotonic() >= _next_change_check)
+
+
+def _check_changes(graph: DijkstraGraph) -> DijkstraGraph:
+    """Refresh ``graph`` if the change log moved since it was loaded; one thread checks at a time."""
+    global _next_change_check
+    if not _shared_graph_lock.acquire(blocking=False):
+        return graph
+    try:
+        if _shared_graph is not graph:
+            return _shared_graph or graph
+        try:
+            stamp = change_stamp()
+        except SynchronousOnlyOperation:
+            # Called on an event loop; the FastAPI app checks from a thread
+            return graph
+        except DatabaseError:
+            # Keep serving the loaded graph while the database is unavailable
+            stamp = graph.change_stamp
+        _next_change_check = time.monotonic() + settings.GRAPH_CHANGE_CHECK_SECONDS
+        if stamp == graph.change_stamp:
+            return graph
+        return _refresh(graph)
+    finally:
+        _shared_graph_lock.release()
+
+
+def current_graph() -> Optional[DijkstraGraph]:
+    """Return the process-wide graph if it is already built, without building it."""
+    return _shared_graph
+
+
+def invalidate_graph():
+    """Drop the process-wide graph so the next request rebuilds it."""
+    global _shared_graph, _shared_graph_generation, _stale_graph
+    _shared_graph_generation += 1
+    if _shared_graph is not None:
+        _stale_graph = _shared_graph
+    _shared_graph = None
+
+
+def route_error(message: str) -> Dict:
+    """Route response for a failed calculation."""
+    return {
+        'success': False,
+        'error': message,
+        'total_distance': None,
+        'path': [],
+        'cities': []
+    }
+
+
+def route_result(graph: DijkstraGraph, from_city: Dict, to_city: Dict,
+                 total_distance: float, path_city_ids: List[int]) -> Dict:
+    """Route response for a completed search."""
+    if total_distance == float('inf'):
+        return route_error('No route found between the specified cities')
+    
+    return {
+        'success': True,
+        'total_distance': round(total_distance, 2),
+        'path': path_city_ids,
+        'cities': graph.get_city_details(path_city_ids),
+        'from_city': route_city(from_city),
+        'to_city': route_city(to_city),
+    }
+
+
+def city_not_found(city_name: str) -> Dict:
+    return route_error(f'City "{city_name}" not found in database')
+
+
+def calculate_shortest_route(from_city_name: str, to_city_name: str,
+                             geometry: bool = False, zoom: Optional[int] = None,
+                             trace: bool = False) -> Dict:
     """
     Calculate shortest route between two cities.
     
     Args:
         from_city_name: Name of the starting city
         to_city_name: Name of the destination city
+        geometry: Whether to include the route shape as an encoded polyline
+        zoom: Map zoom level to simplify the shape for; implies ``geometry``
+        trace: Whether to include the search's statistics and events
         
     Returns:
         Dictionary containing route information
     """
     try:
+        with span('graph'):
+            graph = get_graph()
+        
         # Get city objects
-        from_city = City.objects.get(name__iexact=from_city_name)
-        to_city = City.objects.get(name__iexact=to_city_name)
+        from_city = graph.find_city(from_city_name)
+        to_city = graph.find_city(to_city_name)
         
-        # Create graph and find shortest path
-        graph = DijkstraGraph()
-        total_distance, path_city_ids = graph.dijkstra(from_city.id, to_city.id)
+        for city, city_name in ((from_city, from_city_name), (to_city, to_city_name)):
+            if city is None:
+                return city_not_found(city_name)
         
-        if total_distance == float('inf'):
-            return {
-                'success': False,
-                'error': 'No route found between the specified cities',
-                'total_distance': None,
-                'path': [],
-                'cities': []
-            }
+        result = route_between(graph, from_city, to_city, trace)
+        if result['success'] and (geometry or zoom is not None):
+            with span('geometry'):
+                result['geometry'] = route_geometry(graph, result['path'], zoom)
+        return result
         
-        # Get city details for the path
-        path_cities = graph.get_city_details(path_city_ids)
+    except Exception as e:
+        return route_error(f'An error occurred: {str(e)}')
+
+
+def record_search(stats: SearchStats):
+    """Report a finished search to the request timing and metrics."""
+    note('settled', stats.settled)
+    metrics.search_done(stats)
+
+
+def route_between(graph: DijkstraGraph, from_city: Dict, to_city: Dict, trace: bool = False) -> Dict:
+    """
+    Search for and describe the route between two catalog cities.
+    
+    With ``trace``, the result also holds the search statistics and its
+    first ``ROUTE_TRACE_MAX_EVENTS`` events under ``trace``.
+    """
+    stats = SearchStats()
+    with span('search'):
+        if trace:
+            events, truncated, total_distance, path_city_ids = collect_trace(
+                graph.trace(from_city['id'], to_city['id'], stats), settings.ROUTE_TRACE_MAX_EVENTS
+            )
+        else:
+            total_distance, path_city_ids = graph.dijkstra(from_city['id'], to_city['id'], stats)
+    record_search(stats)
+    with span('details'):
+        result = route_result(graph, from_city, to_city, total_distance, path_city_ids)
+    if trace:
+        result['trace'] = {'stats': stats.as_dict(), 'events': events, 'truncated': truncated}
+    return result
+
+
+def snapped_point(snap: Dict) -> Dict:
+    """Describe where a coordinate was snapped onto the road network."""
+    return {
+        'connection_id': snap['connection_id'],
+        'from_city_id': snap['from_city_id'],
+        'to_city_id': snap['to_city_id'],
+        'latitude': round(snap['latitude'], 6),
+        'longitude': round(snap['longitude'], 6),
+        'distance_km': round(snap['distance_km'], 3),
+        'fraction': round(snap['fraction'], 4),
+    }
+
+
+def nearest_snapped_city(graph: DijkstraGraph, snap: Dict) -> Dict:
+    """The catalog city nearest to a point snapped onto the road network."""
+    city = nearest_cities(graph, snap['latitude'], snap['longitude'], 1)[0]
+    return route_city(graph.cities[city['id']])
+
+
+def route_between_snaps(graph: DijkstraGraph, origin: Dict, destination: Dict) -> Tuple[float, List[int]]:
+    """
+    Shortest route between two points snapped onto road connections.
+    
+    Each point acts as a virtual node splitting its connection in two, with
+    the connection's distance shared out in proportion to ``fraction``.
+    One-way connections can only be left towards their end city and entered
+    from their start city.
+    """
+    from_id, to_id, distance, bidirectional = graph.edges[origin['connection_id']]
+    sources = {to_id: (1 - origin['fraction']) * distance}
+    if bidirectional:
+        sources[from_id] = origin['fraction'] * distance
+    
+    from_id, to_id, distance, bidirectional = graph.edges[destination['connection_id']]
+    targets = {from_id: destination['fraction'] * distance}
+    if bidirectional:
+        targets[to_id] = (1 - destination['fraction']) * distance
+    
+    total_distance, path = graph.search_between(sources, targets)
+    
+    # Both points on the same road: travelling along it may beat leaving it
+    if origin['connection_id'] == destination['connection_id']:
+        along = destination['fraction'] - origin['fraction']
+        if along >= 0 or bidirectional:
+            direct = abs(along) * distance
+            if direct <= total_distance:
+                return direct, []
+    
+    return total_distance, path
+
+
+def calculate_route_from_coordinates(from_lat: float, from_lng: float,
+                                     to_lat: float, to_lng: float) -> Dict:
+    """
+    Calculate the shortest route between two coordinates over the road network.
+    
+    Each coordinate is snapped to the nearest point on a road connection and
+    the route starts and ends part-way along those connections. Returns the
+    same dictionary as :func:`calculate_shortest_route` (``path`` and
+    ``cities`` list the cities passed through, which is empty when both
+    points lie on the same stretch of road; ``from_city`` and ``to_city``
+    are the catalog cities nearest to each snapped point), plus a
+    ``snapped`` entry describing both snapped points.
+    """
+    try:
+        graph = get_graph()
+        origin = snap_to_road(graph, from_lat, from_lng)
+        destination = snap_to_road(graph, to_lat, to_lng)
+        if origin is None or destination is None:
+            return route_error('No roads available to snap to')
+        
+        total_distance, path_city_ids = route_between_snaps(graph, origin, destination)
+        if total_distance == float('inf'):
+            return route_error('No route found between the specified points')
         
         return {
             'success': True,
             'total_distance': round(total_distance, 2),
             'path': path_city_ids,
-            'cities': path_cities,
-            'from_city': {
-                'id': from_city.id,
-                'name': from_city.name,
-                'state': from_city.state,
-                'latitude': float(from_city.latitude),
-                'longitude': float(from_city.longitude),
+            'cities': graph.get_city_details(path_city_ids),
+            'from_city': nearest_snapped_city(graph, origin),
+            'to_city': nearest_snapped_city(graph, destination),
+            'snapped': {
+                'from': snapped_point(origin),
+                'to': snapped_point(destination),
             },
-            'to_city': {
-                'id': to_city.id,
-                'name': to_city.name,
-                'state': to_city.state,
-                'latitude': float(to_city.latitude),
-                'longitude': float(to_city.longitude),
-            }
         }
         
-    except City.DoesNotExist as e:
-        city_name = str(e).split("'")[1] if "'" in str(e) else "Unknown"
-        return {
-            'success': False,
-            'error': f'City "{city_name}" not found in database',
-            'total_distance': None,
-            'path': [],
-            'cities': []
-        }
     except Exception as e:
+        return route_error(f'An error occurred: {str(e)}')
+
+
+def search_groups(graph: DijkstraGraph, groups: List[Tuple[int, List[int]]],
+                  with_paths: bool = True,
+                  in_process: bool = False) -> List[Tuple[List[float], Optional[List[List[int]]]]]:
+    """
+    Run one one-to-many search per ``(source_id, target_ids)`` group.
+    
+    Groups are fanned out to the routing process pool when one is configured,
+    otherwise (or with ``in_process``) they are searched in this process.
+    """
+    if len(groups) > 1 and not in_process:
+        with leased_executor(graph) as executor:
+            if executor is not None:
+                return executor.search(groups, with_paths)
+    return [graph.one_to_many(source_id, target_ids, with_paths) for source_id, target_ids in groups]
+
+
+def calculate_routes(queries: List[Tuple[str, str]], in_process: bool = False) -> List[Dict]:
+    """
+    Calculate several routes at once.
+    
+    Queries sharing a starting city are answered by a single search.
+    
+    Args:
+        queries: List of (from_city_name, to_city_name) pairs
+        in_process: Search in this process even if a routing pool is configured
+        
+    Returns:
+        One route dictionary per query, in the same format and order as
+        :func:`calculate_shortest_route` would return them
+    """
+    try:
+        graph = get_graph()
+        results = [None] * len(queries)
+        groups = {}
+        
+        for position, (from_city_name, to_city_name) in enumerate(queries):
+            from_city = graph.find_city(from_city_name)
+            to_city = graph.find_city(to_city_name)
+            if from_city is None:
+                results[position] = city_not_found(from_city_name)
+            elif to_city is None:
+                results[position] = city_not_found(to_city_name)
+            else:
+                groups.setdefault(from_city['id'], []).append((position, to_city))
+        
+        group_items = list(groups.items())
+        answers = search_groups(
+            graph,
+            [(source_id, [to_city['id'] for _, to_city in members]) for source_id, members in group_items],
+            in_process=in_process,
+        )
+        
+        for (source_id, members), (distances, paths) in zip(group_items, answers):
+            from_city = graph.cities[source_id]
+            for (position, to_city), distance, path in zip(members, distances, paths):
+                results[position] = route_result(graph, from_city, to_city, distance, path)
+        
+        return results
+        
+    except Exception as e:
+        return [route_error(f'An error occurred: {str(e)}') for _ in queries]
+
+
+def calculate_route_matrix(from_city_names: List[str], to_city_names: List[str]) -> Dict:
+    """
+    Calculate the distance between every pair of source and destination cities.
+    
+    Args:
+        from_city_names: Names of the starting cities (matrix rows)
+        to_city_names: Names of the destination cities (matrix columns)
+        
+    Returns:
+        Dictionary with the resolved cities and a ``distances`` matrix;
+        unreachable pairs are None
+    """
+    try:
+        graph = get_graph()
+        sources = []
+        targets = []
+        for names, resolved in ((from_city_names, sources), (to_city_names, targets)):
+            for city_name in names:
+                city = graph.find_city(city_name)
+                if city is None:
+                    return {**city_not_found(city_name), 'distances': []}
+                resolved.append(city)
+        
+        target_ids = [city['id'] for city in targets]
+        answers = search_groups(graph, [(city['id'], target_ids) for city in sources], with_paths=False)
+        
         return {
-            'success': False,
-            'error': f'An error occurred: {str(e)}',
-            'total_distance': None,
-            'path': [],
-            'cities': []
+            'success': True,
+            'sources': [route_city(city) for city in sources],
+            'targets': [route_city(city) for city in targets],
+            'distances': [
+                [round(distance, 2) if distance != float('inf') else None for distance in distances]
+                for distances, _ in answers
+            ],
         }
+        
+    except Exception as e:
+        return {**route_error(f'An error occurred: {str(e)}'), 'distances': []}
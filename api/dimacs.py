@@ -0,0 +1,120 @@
+"""
+DIMACS shortest-path challenge graph files.
+
+A ``.gr`` file holds the graph (``p sp <nodes> <arcs>`` then one
+``a <from> <to> <weight>`` line per directed arc) and a ``.co`` file the node
+coordinates (``p aux sp co <nodes>`` then ``v <node> <x> <y>``, with x and y
+in millionths of a degree of longitude and latitude). Nodes are numbered
+from 1 and weights are integers; ``units_per_km`` converts them to and from
+kilometres.
+
+Files are read line by line and graphs go straight into CSR arrays, so
+million-node inputs load without building Python dictionaries.
+
+This module deliberately avoids importing Django.
+"""
+from array import array
+from typing import IO, Iterable, Iterator, Optional, Tuple
+from geo.snapshot import FLOAT_TYPE, INT_TYPE, GraphSnapshot
+
+COORDINATE_SCALE = 10 ** 6
+
+
+class DimacsError(ValueError):
+    """A malformed DIMACS file."""
+
+
+def _lines(path: str, kind: str) -> Iterator[Tuple[int, list]]:
+    with open(path) as handle:
+        for number, line in enumerate(handle, 1):
+            if line.startswith(kind):
+                yield number, line.split()
+
+
+def read_header(path: str) -> Tuple[int, int]:
+    """``(nodes, arcs)`` from the problem line of a ``.gr`` file."""
+    with open(path) as handle:
+        for line in handle:
+            if line.startswith('p'):
+                fields = line.split()
+                if len(fields) != 4 or fields[1] != 'sp':
+                    raise DimacsError(f'{path}: expected "p sp <nodes> <arcs>", got "{line.strip()}"')
+                return int(fields[2]), int(fields[3])
+    raise DimacsError(f'{path}: missing problem line')
+
+
+def read_arcs(path: str) -> Iterator[Tuple[int, int, int]]:
+    """Stream ``(from, to, weight)`` arcs from a ``.gr`` file."""
+    for number, fields in _lines(path, 'a'):
+        try:
+            _, tail, head, weight = fields
+            yield int(tail), int(head), int(weight)
+        except ValueError:
+            raise DimacsError(f'{path}:{number}: malformed arc line')
+
+
+def read_coordinates(path: str) -> Iterator[Tuple[int, float, float]]:
+    """Stream ``(node, latitude, longitude)`` from a ``.co`` file."""
+    for number, fields in _lines(path, 'v'):
+        try:
+            _, node, x, y = fields
+            yield int(node), int(y) / COORDINATE_SCALE, int(x) / COORDINATE_SCALE
+        except ValueError:
+            raise DimacsError(f'{path}:{number}: malformed coordinate line')
+
+
+def read_snapshot(path: str, units_per_km: float = 1000, version: Optional[str] = None) -> GraphSnapshot:
+    """
+    Load a ``.gr`` file straight into a CSR snapshot.
+
+    The file is read twice: once to count each node's arcs, once to place
+    them. Node IDs are the DIMACS node numbers.
+    """
+    node_count, arc_count = read_header(path)
+    offsets = array(INT_TYPE, [0]) * (node_count + 1)
+    for tail, head, _ in read_arcs(path):
+        if not (1 <= tail <= node_count and 1 <= head <= node_count):
+            raise DimacsError(f'{path}: arc {tail} -> {head} outside nodes 1..{node_count}')
+        offsets[tail] += 1
+    # Node k's arcs were counted at offsets[k]; the running sum makes
+    # offsets[k - 1] the start of node k's arcs
+    for index in range(1, node_count + 1):
+        offsets[index] += offsets[index - 1]
+    total = offsets[node_count]
+    if total != arc_count:
+        raise DimacsError(f'{path}: header declares {arc_count} arcs, found {total}')
+
+    targets = array(INT_TYPE, [0]) * total
+    weights = array(FLOAT_TYPE, [0.0]) * total
+    fill = array(INT_TYPE, offsets)
+    for tail, head, weight in read_arcs(path):
+        position = fill[tail - 1]
+        targets[position] = head - 1
+        weights[position] = weight / units_per_km
+        fill[tail - 1] = position + 1
+
+    node_ids = array(INT_TYPE, range(1, node_count + 1))
+    return GraphSnapshot(node_ids, offsets, targets, weights, version)
+
+
+def write_graph(handle: IO[str], node_count: int, arcs: Iterable[Tuple[int, int, float]],
+                arc_count: int, units_per_km: float = 1000, comment: str = ''):
+    """Write ``(from, to, km)`` arcs over nodes ``1..node_count`` as a ``.gr`` file."""
+    if comment:
+        handle.write(f'c {comment}\n')
+    handle.write(f'p sp {node_count} {arc_count}\n')
+    handle.writelines(
+        f'a {tail} {head} {round(km * units_per_km)}\n' for tail, head, km in arcs
+    )
+
+
+def write_coordinates(handle: IO[str], coordinates: Iterable[Tuple[int, float, float]],
+                      node_count: int, comment: str = ''):
+    """Write ``(node, latitude, longitude)`` triples as a ``.co`` file."""
+    if comment:
+        handle.write(f'c {comment}\n')
+    handle.write(f'p aux sp co {node_count}\n')
+    handle.writelines(
+        f'v {node} {round(lng * COORDINATE_SCALE)} {round(lat * COORDINATE_SCALE)}\n'
+        for node, lat, lng in coordinates
+    )
@@ -0,0 +1,182 @@
+"""
+Process pool for CPU-bound route searches.
+
+Route searches are pure Python, so threads serialize on the GIL. When
+``ROUTING_PROCESSES`` is set, batch and matrix searches are split into
+chunks by source city and solved by a pool of worker processes. Workers
+attach to one shared memory copy of the graph when they start, so tasks
+only carry node indices and results come back as typed arrays.
+
+Pools are leased for each search (:func:`leased_executor`). When a newer
+graph replaces the one a pool was started for, the old pool is retired and
+only stopped once the searches still using it have finished.
+"""
+import atexit
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+from typing import Iterator, List, Optional, Tuple
+from django.conf import settings
+from geo.snapshot import attach_worker, solve_chunk
+
+
+class RoutingExecutor:
+    """Pool of worker processes sharing one graph snapshot."""
+
+    def __init__(self, graph, processes: int, chunks_per_process: int = 4):
+        self.version = graph.version
+        self.serial = graph.serial
+        # Searches holding a lease, and whether a newer pool replaced this one
+        self.users = 0
+        self.retired = False
+        self.processes = processes
+        self.chunks_per_process = chunks_per_process
+        # Index lookups use the private snapshot; the shared copy only feeds workers
+        self.local_snapshot = graph.snapshot()
+        self.snapshot, handle = self.local_snapshot.to_shared_memory()
+        # Spawned workers never inherit locks or connections from server threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=attach_worker,
+            initargs=(handle,),
+        )
+
+    def search(self, groups: List[Tuple[int, List[int]]],
+               with_paths: bool = True) -> List[Tuple[List[float], Optional[List[List[int]]]]]:
+        """
+        Solve one one-to-many search per ``(source_id, target_ids)`` group.
+
+        Returns results in the same shape as ``DijkstraGraph.one_to_many``.
+        """
+        snapshot = self.local_snapshot
+        tasks = [
+            (snapshot.index_of(source_id), [snapshot.index_of(target_id) for target_id in target_ids])
+            for source_id, target_ids in groups
+        ]
+        chunk_size = max(1, math.ceil(len(tasks) / (self.processes * self.chunks_per_process)))
+        chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+        node_ids = snapshot.node_ids
+        results = []
+        for chunk_results in self.pool.map(solve_chunk, chunks, repeat(with_paths)):
+            for distances, path_nodes, path_offsets in chunk_results:
+                if path_nodes is None:
+                    results.append((distances.tolist(), None))
+                    continue
+                paths = [
+                    [node_ids[node] for node in path_nodes[path_offsets[i]:path_offsets[i + 1]]]
+                    for i in range(len(distances))
+                ]
+                results.append((distances.tolist(), paths))
+        return results
+
+    def close(self):
+        """Stop the workers and free the shared snapshot."""
+        self.pool.shutdown(wait=True)
+        self.snapshot.release(unlink=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Held while a pool starts, so concurrent searches start one pool between them
+_executor_start_lock = threading.Lock()
+
+
+def _serves_newer(graph) -> bool:
+    # Called with _executor_lock held
+    return _executor is not None and graph.serial < _executor.serial
+
+
+def _lease(graph, drained: List[RoutingExecutor]) -> Optional[RoutingExecutor]:
+    """
+    Lease the pool for ``graph``, or return None if none is running; called with ``_executor_lock`` held.
+
+    A pool for another graph version is retired, and added to ``drained``
+    when no search still uses it.
+    """
+    global _executor
+    if _executor is not None and _executor.version != graph.version:
+        _executor.retired = True
+        if _executor.users == 0:
+            drained.append(_executor)
+        _executor = None
+    if _executor is not None:
+        _executor.users += 1
+    return _executor
+
+
+def _acquire(graph) -> Optional[RoutingExecutor]:
+    global _executor
+    processes = getattr(settings, 'ROUTING_PROCESSES', 0)
+    if processes <= 0:
+        return None
+
+    # Pools are started and stopped outside _executor_lock, so searches
+    # leasing and returning the current pool never wait for one
+    drained = []
+    try:
+        with _executor_lock:
+            if _serves_newer(graph):
+                # A request still holding an older graph; its data is not in any pool
+                return None
+            executor = _lease(graph, drained)
+        if executor is None:
+            with _executor_start_lock:
+                with _executor_lock:
+                    if _serves_newer(graph):
+                        return None
+                    executor = _lease(graph, drained)
+                if executor is None:
+                    executor = RoutingExecutor(graph, processes)
+                    executor.users = 1
+                    with _executor_lock:
+                        _executor = executor
+        return executor
+    finally:
+        for retired in drained:
+            retired.close()
+
+
+def _release(executor: RoutingExecutor):
+    with _executor_lock:
+        executor.users -= 1
+        drained = executor.retired and executor.users == 0
+    if drained:
+        executor.close()
+
+
+@contextmanager
+def leased_executor(graph) -> Iterator[Optional[RoutingExecutor]]:
+    """
+    The process pool for ``graph`` for the duration of the block, or None.
+
+    None means pooling is disabled, or ``graph`` is older than the graph the
+    current pool serves and should be searched in this process. The pool is
+    started on first use and replaced when a newer graph version arrives, so
+    workers never search a stale snapshot.
+    """
+    executor = _acquire(graph)
+    try:
+        yield executor
+    finally:
+        if executor is not None:
+            _release(executor)
+
+
+@atexit.register
+def shutdown_executor():
+    """Stop the process pool, if one was started."""
+    global _executor
+    drained = []
+    with _executor_lock:
+        if _executor is not None:
+            _executor.retired = True
+            if _executor.users == 0:
+                drained.append(_executor)
+            _executor = None
+    for executor in drained:
+        executor.close()
@@ -0,0 +1,126 @@
+"""
+Road geometry for route responses.
+
+Road connections may store their shape as an encoded polyline. Route
+geometry is assembled by joining the encoded shape of each connection on
+the path, without decoding them. Simplified shapes for each configured zoom
+level are computed once per graph version and kept in ``graph.artifacts``,
+unless dropped to stay within the memory budget (see :mod:`api.memory`), in
+which case shapes are encoded per request. Connections without a stored
+shape are drawn as a straight line.
+"""
+import bisect
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from geo import polyline
+from . import memory
+
+
+def connection_points(graph, connection_id: int) -> List[Tuple[float, float]]:
+    """Points along a road connection, from its start city to its end city."""
+    encoded = graph.geometries.get(connection_id)
+    if encoded:
+        return polyline.decode(encoded)
+    from_id, to_id = graph.edges[connection_id][:2]
+    start, end = graph.cities[from_id], graph.cities[to_id]
+    return [(start['latitude'], start['longitude']), (end['latitude'], end['longitude'])]
+
+
+def geometry_level(zoom: Optional[int]) -> Optional[int]:
+    """
+    The precomputed zoom level to serve for a requested zoom.
+
+    That is the most detailed configured level not above ``zoom`` (or the
+    coarsest level for very low zooms), and None for full detail.
+    """
+    if zoom is None:
+        return None
+    levels = sorted(settings.ROUTE_GEOMETRY_ZOOM_LEVELS)
+    if not levels or zoom > levels[-1]:
+        return None
+    position = bisect.bisect_right(levels, zoom)
+    return levels[max(position - 1, 0)]
+
+
+def encode_connection(graph, connection_id: int,
+                      level: Optional[int]) -> Tuple[polyline.EncodedLine, polyline.EncodedLine]:
+    """Encoded shape of a connection at a geometry level, in both directions."""
+    points = connection_points(graph, connection_id)
+    if level is not None:
+        points = polyline.simplify(points, polyline.zoom_tolerance(level))
+    return polyline.encoded_line(points), polyline.encoded_line(points[::-1])
+
+
+class ConnectionLines:
+    """Stand-in for a level of ``route_geometry`` that encodes each connection on access."""
+
+    def __init__(self, graph, level: Optional[int]):
+        self.graph = graph
+        self.level = level
+
+    def __getitem__(self, connection_id: int) -> Tuple[polyline.EncodedLine, polyline.EncodedLine]:
+        return encode_connection(self.graph, connection_id, self.level)
+
+
+def connection_lines(graph, level: Optional[int]) -> Dict[int, Tuple[polyline.EncodedLine, polyline.EncodedLine]]:
+    """
+    Encoded shape of every connection at a geometry level, in both directions.
+
+    Built on first use for each level and cached on the graph.
+    """
+    if not memory.may_build(graph, 'route_geometry'):
+        return ConnectionLines(graph, level)
+    by_level = graph.artifacts.setdefault('route_geometry', {})
+    lines = by_level.get(level)
+    if lines is None:
+        lines = {connection_id: encode_connection(graph, connection_id, level) for connection_id in graph.edges}
+        by_level[level] = lines
+        memory.enforce(graph)
+    return lines
+
+
+def edge_lookup(graph) -> Dict[Tuple[int, int], Tuple[int, bool]]:
+    """
+    The connection used to travel between two adjacent cities.
+
+    Maps ``(from_id, to_id)`` to ``(connection_id, forward)``, where
+    ``forward`` is False when a bidirectional connection is travelled from
+    its end city to its start city. Where two connections join the same
+    cities the shorter one wins, as it does in the search.
+    """
+    lookup = graph.artifacts.get('edge_lookup')
+    if lookup is None:
+        lookup = {}
+        best = {}
+        for connection_id, (from_id, to_id, distance, bidirectional) in graph.edges.items():
+            directions = [((from_id, to_id), True)]
+            if bidirectional:
+                directions.append(((to_id, from_id), False))
+            for key, forward in directions:
+                if distance < best.get(key, float('inf')):
+                    best[key] = distance
+                    lookup[key] = (connection_id, forward)
+        graph.artifacts['edge_lookup'] = lookup
+        memory.enforce(graph)
+    return lookup
+
+
+def route_geometry(graph, path_city_ids: List[int], zoom: Optional[int] = None) -> Optional[str]:
+    """
+    Encoded polyline along a route's cities, simplified for ``zoom`` if given.
+
+    Returns None for an empty path.
+    """
+    if not path_city_ids:
+        return None
+    if len(path_city_ids) == 1:
+        city = graph.cities[path_city_ids[0]]
+        return polyline.encode([(city['latitude'], city['longitude'])])
+
+    lines = connection_lines(graph, geometry_level(zoom))
+    lookup = edge_lookup(graph)
+    pieces = []
+    for from_id, to_id in zip(path_city_ids, path_city_ids[1:]):
+        connection_id, forward = lookup[(from_id, to_id)]
+        pieces.append(lines[connection_id][0 if forward else 1])
+    return polyline.join(pieces)
@@ -0,0 +1,67 @@
+"""
+HTTP validators for cacheable GET route responses.
+
+Route responses depend only on the graph and the query, so an ETag built
+from the graph version and the canonical form of the query identifies the
+response body. Only successful answers are cacheable. Clients, CDNs and reverse proxies can revalidate with
+``If-None-Match`` and get a 304 without the server doing any routing work.
+
+No ``Last-Modified`` is sent: the only timestamp at hand is when this
+process built its graph, which differs between workers and restarts, so
+``If-Modified-Since`` would miss or, worse, match across data changes.
+"""
+import hashlib
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlencode
+from django.conf import settings
+from django.utils.http import parse_etags
+
+# Query parameters that name cities and are matched case-insensitively
+CITY_PARAMS = ('from_city', 'to_city')
+
+
+def canonical_route_query(params: Mapping[str, str]) -> str:
+    """
+    Canonical form of a route query string.
+
+    City names are stripped and casefolded and parameters are sorted, so
+    equivalent queries share a cache entry and an ETag.
+    """
+    items = []
+    for name, value in params.items():
+        value = value.strip()
+        if name in CITY_PARAMS:
+            value = value.casefold()
+        items.append((name, value))
+    return urlencode(sorted(items))
+
+
+def route_validators(graph_version: str, canonical_query: str) -> Dict:
+    """
+    ETag for a route query answered at ``graph_version``.
+
+    Precomputed answers carry the version of the graph their row was
+    computed from, so they share the engine's ETag for the same data.
+    """
+    query_hash = hashlib.blake2b(canonical_query.encode(), digest_size=8).hexdigest()
+    return {
+        'etag': f'"{graph_version}-{query_hash}"',
+    }
+
+
+def cache_headers(validators: Dict) -> Dict[str, str]:
+    """Response headers advertising the validators and the cache lifetime."""
+    return {
+        'ETag': validators['etag'],
+        'Cache-Control': f'public, max-age={settings.ROUTE_HTTP_MAX_AGE}',
+    }
+
+
+def is_not_modified(if_none_match: Optional[str], validators: Dict) -> bool:
+    """Whether a conditional GET can be answered with 304 Not Modified."""
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    # Weak comparison: W/"x" matches "x"
+    etags = [etag[2:] if etag.startswith('W/') else etag for etag in etags]
+    return '*' in etags or validators['etag'] in etags
@@ -0,0 +1,143 @@
+"""
+Keyset-paginated and streaming listings of cities and road connections.
+
+Rows are read with ``values_list`` and encoded directly, in the same shape
+as ``CitySerializer`` and ``RoadConnectionSerializer``, so large tables never
+pass through model instances or serializer fields. Pages are keyed on the
+primary key (``after_id``/``limit``), which stays fast at any offset.
+"""
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from cities.models import City, RoadConnection
+
+CITY_FIELDS = ('id', 'name', 'state', 'latitude', 'longitude', 'population', 'is_capital')
+
+CONNECTION_FIELDS = (
+    'id', 'from_city_id', 'to_city_id', 'from_city__name', 'to_city__name',
+    'distance_km', 'road_type', 'is_bidirectional',
+)
+
+
+def city_row(values: Tuple) -> Dict:
+    """Encode a ``CITY_FIELDS`` row like ``CitySerializer`` does."""
+    city_id, name, state, latitude, longitude, population, is_capital = values
+    return {
+        'id': city_id,
+        'name': name,
+        'state': state,
+        'latitude': '{:f}'.format(latitude),
+        'longitude': '{:f}'.format(longitude),
+        'population': population,
+        'is_capital': is_capital,
+    }
+
+
+def connection_row(values: Tuple) -> Dict:
+    """Encode a ``CONNECTION_FIELDS`` row like ``RoadConnectionSerializer`` does."""
+    (connection_id, from_city, to_city, from_city_name, to_city_name,
+     distance_km, road_type, is_bidirectional) = values
+    return {
+        'id': connection_id,
+        'from_city': from_city,
+        'to_city': to_city,
+        'from_city_name': from_city_name,
+        'to_city_name': to_city_name,
+        'distance_km': '{:f}'.format(distance_km),
+        'road_type': road_type,
+        'is_bidirectional': is_bidirectional,
+    }
+
+
+LISTINGS = {
+    'cities': (City, CITY_FIELDS, city_row),
+    'connections': (RoadConnection, CONNECTION_FIELDS, connection_row),
+}
+
+
+def parse_page_params(params) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Read ``after_id`` and ``limit`` from query parameters.
+
+    Returns ``(None, None)`` when neither is given. Raises ValueError for
+    malformed or out-of-range values.
+    """
+    after_id = params.get('after_id')
+    limit = params.get('limit')
+    if after_id in (None, '') and limit in (None, ''):
+        return None, None
+
+    try:
+        after_id = int(after_id) if after_id not in (None, '') else 0
+        limit = int(limit) if limit not in (None, '') else settings.LISTING_DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError('"after_id" and "limit" must be integers')
+    if after_id < 0:
+        raise ValueError('"after_id" must not be negative')
+    if not 1 <= limit <= settings.LISTING_MAX_LIMIT:
+        raise ValueError(f'"limit" must be between 1 and {settings.LISTING_MAX_LIMIT}')
+    return after_id, limit
+
+
+def wants_stream(params) -> bool:
+    """Whether the ``stream`` query parameter asks for a streamed response."""
+    return params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def _rows(kind: str, after_id: int = 0):
+    model, fields, _ = LISTINGS[kind]
+    return model.objects.filter(id__gt=after_id).order_by('id').values_list(*fields)
+
+
+def full_listing(kind: str) -> List[Dict]:
+    """Every row in the model's default ordering, as the serializers would encode it."""
+    model, fields, encode = LISTINGS[kind]
+    return [encode(row) for row in model.objects.values_list(*fields)]
+
+
+def keyset_page(kind: str, after_id: int, limit: int) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Return up to ``limit`` rows with IDs greater than ``after_id``.
+
+    Returns the encoded rows and the ``after_id`` for the next page, or None
+    on the last page.
+    """
+    encode = LISTINGS[kind][2]
+    # Fetch one extra row to learn whether another page follows
+    rows = list(_rows(kind, after_id)[:limit + 1])
+    next_after_id = rows[limit - 1][0] if len(rows) > limit else None
+    return [encode(row) for row in rows[:limit]], next_after_id
+
+
+def stream_listing(kind: str, count: int, after_id: int = 0,
+                   limit: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield a listing response body as JSON fragments, one row at a time.
+
+    Produces the same ``{"success": true, "<kind>": [...], "count": N}``
+    document as the buffered views. Rows are fetched in batches of
+    ``LISTING_STREAM_CHUNK_SIZE`` through a server-side iterator, so memory use
+    does not grow with the table.
+    """
+    encode = LISTINGS[kind][2]
+    rows = _rows(kind, after_id)
+    if limit is not None:
+        rows = rows[:limit]
+
+    chunk_size = settings.LISTING_STREAM_CHUNK_SIZE
+    yield b'{"success":true,"' + kind.encode() + b'":['
+    batch = []
+    separator = b''
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(_dumps(encode(row)))
+        if len(batch) >= chunk_size:
+            yield separator + b','.join(batch)
+            batch = []
+            separator = b','
+    if batch:
+        yield separator + b','.join(batch)
+    yield b'],"count":' + str(count).encode() + b'}'
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,229 @@
+"""
+Per-process memory accounting and budget.
+
+The large structures a process keeps are measured here: the routing graph,
+registered caches (the rendered route cache) and the artifacts derived from
+the graph and stored in ``graph.artifacts`` (spatial indexes, encoded
+geometries, JSON fragments). With ``MEMORY_BUDGET_MB`` set, :func:`enforce`
+keeps their total under the budget: least recently used cache entries are
+evicted first, then optional artifacts are dropped in :data:`DROP_ORDER`.
+A dropped artifact is not rebuilt for the rest of its graph version; its
+users fall back to slower paths that hold no extra memory, such as linear
+scans or encoding on the fly (see :func:`may_build`).
+
+Sizes are estimates from ``sys.getsizeof`` that sample large containers,
+computed once per structure. :func:`breakdown` reports them next to
+``tracemalloc`` statistics so they can be checked against real allocations.
+"""
+import logging
+import math
+import os
+import sys
+import threading
+import tracemalloc
+from itertools import islice
+from typing import Dict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Artifacts that can be dropped, cheapest to lose first. Others (edge_lookup)
+# have no reasonable fallback and are only accounted for.
+DROP_ORDER = ('route_geometry', 'road_index', 'city_fragments', 'city_index')
+
+# Container entries measured when estimating a size
+SAMPLE_SIZE = 32
+MAX_DEPTH = 12
+
+
+def estimate_nbytes(value, depth: int = 0) -> int:
+    """
+    Approximate memory held by ``value`` and everything it references.
+
+    Containers are measured exactly and their entries are extrapolated from
+    a sample of the first :data:`SAMPLE_SIZE`; objects shared between
+    entries are counted once per reference.
+    """
+    size = sys.getsizeof(value)
+    if depth >= MAX_DEPTH or isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(value, dict):
+        items = list(islice(value.items(), SAMPLE_SIZE))
+        if items:
+            sampled = sum(estimate_nbytes(key, depth + 1) + estimate_nbytes(item, depth + 1) for key, item in items)
+            size += sampled * len(value) // len(items)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = list(islice(value, SAMPLE_SIZE))
+        if items:
+            sampled = sum(estimate_nbytes(item, depth + 1) for item in items)
+            size += sampled * len(value) // len(items)
+    elif hasattr(value, '__dict__'):
+        size += estimate_nbytes(vars(value), depth + 1)
+    return size
+
+
+class MemoryAccountant:
+    """Sizes of the registered structures and the budget they are kept under."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.caches = {}
+        self.version = None
+        self.dropped = set()
+        self.evicted = 0
+        self.sizes = {}
+        self.warned = False
+        self.lock = threading.Lock()
+
+    def register_cache(self, name: str, cache):
+        """Account for a cache with ``nbytes``, ``__len__`` and ``evict(count)``, like LRUCache."""
+        self.caches[name] = cache
+
+    def _follow(self, graph):
+        # Dropped artifacts and sizes belong to one graph version
+        if graph.version != self.version:
+            self.version = graph.version
+            self.dropped = set()
+            self.sizes = {}
+            self.warned = False
+
+    def _size(self, name: str, value) -> int:
+        # Structures are immutable once built, apart from containers that gain entries
+        signature = (id(value), len(value) if hasattr(value, '__len__') else None)
+        known = self.sizes.get(name)
+        if known is None or known[0] != signature:
+            size = value.nbytes() if name == 'graph' else estimate_nbytes(value)
+            known = self.sizes[name] = (signature, size)
+        return known[1]
+
+    def sizes_of(self, graph) -> Dict[str, Dict[str, int]]:
+        """Estimated bytes of the graph, each artifact and each cache."""
+        self._follow(graph)
+        return {
+            'graph': {'graph': self._size('graph', graph)},
+            'artifacts': {name: self._size(name, value) for name, value in list(graph.artifacts.items())},
+            'caches': {name: cache.nbytes for name, cache in self.caches.items()},
+        }
+
+    def total(self, graph) -> int:
+        return sum(size for group in self.sizes_of(graph).values() for size in group.values())
+
+    def may_build(self, graph, name: str) -> bool:
+        self._follow(graph)
+        return name not in self.dropped
+
+    def enforce(self, graph):
+        """Evict cache entries, then drop artifacts, until the total fits the budget."""
+        if not self.budget_bytes or not self.lock.acquire(blocking=False):
+            return
+        try:
+            over = self.total(graph) - self.budget_bytes
+            if over <= 0:
+                return
+            for cache in self.caches.values():
+                while over > 0 and len(cache):
+                    entry_bytes = max(1, cache.nbytes // len(cache))
+                    before = cache.nbytes
+                    evicted = cache.evict(max(1, math.ceil(over / entry_bytes)))
+                    if not evicted:
+                        break
+                    self.evicted += evicted
+                    over -= before - cache.nbytes
+            for name in DROP_ORDER:
+                if over <= 0:
+                    break
+                value = graph.artifacts.pop(name, None)
+                if value is not None:
+                    self.dropped.add(name)
+                    over -= self._size(name, value)
+                    self.sizes.pop(name, None)
+                    logger.warning("Dropped the %s artifact to stay within the memory budget", name)
+            if over > 0 and not self.warned:
+                self.warned = True
+                logger.warning("The routing graph and its required indexes exceed the memory budget "
+                               "by %d bytes", over)
+        finally:
+            self.lock.release()
+
+
+ACCOUNTANT = MemoryAccountant(int(settings.MEMORY_BUDGET_MB * 1024 * 1024))
+
+
+def register_cache(name: str, cache):
+    ACCOUNTANT.register_cache(name, cache)
+
+
+def may_build(graph, name: str) -> bool:
+    """Whether an optional artifact may be built, i.e. it was not dropped to stay within the budget."""
+    return ACCOUNTANT.may_build(graph, name)
+
+
+def enforce(graph):
+    """Keep this process's structures within ``MEMORY_BUDGET_MB``; call after one has grown."""
+    if ACCOUNTANT.budget_bytes:
+        ACCOUNTANT.enforce(graph)
+
+
+def start_tracing(frames: int = 1):
+    """Start tracing allocations; only those made afterwards show up in :func:`breakdown`."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing():
+    tracemalloc.stop()
+
+
+def traced_allocations(limit: int) -> Dict:
+    """Current traced memory, the largest allocation sites and the total per source file."""
+    if not tracemalloc.is_tracing():
+        return {'tracing': False}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    root = str(settings.BASE_DIR)
+    by_file = {}
+    for stat in snapshot.statistics('filename'):
+        filename = stat.traceback[0].filename
+        name = os.path.relpath(filename, root) if filename.startswith(root) else filename
+        by_file[name] = stat.size
+    return {
+        'tracing': True,
+        'traced_bytes': current,
+        'peak_bytes': peak,
+        'top_lines': [
+            {
+                'file': stat.traceback[0].filename,
+                'line': stat.traceback[0].lineno,
+                'bytes': stat.size,
+                'blocks': stat.count,
+            }
+            for stat in snapshot.statistics('lineno')[:limit]
+        ],
+        'by_file': dict(sorted(by_file.items(), key=lambda item: item[1], reverse=True)[:limit]),
+    }
+
+
+def breakdown(graph, limit: int = 20) -> Dict:
+    """Accounted sizes, budget state and tracemalloc statistics of this process."""
+    sizes = ACCOUNTANT.sizes_of(graph)
+    total = sum(size for group in sizes.values() for size in group.values())
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:  # pragma: no cover - not available on Windows
+        max_rss = None
+    return {
+        'pid': os.getpid(),
+        'graph_version': graph.version,
+        'budget_bytes': ACCOUNTANT.budget_bytes or None,
+        'accounted_bytes': total,
+        'structures': sizes,
+        'dropped_artifacts': sorted(ACCOUNTANT.dropped),
+        'evicted_cache_entries': ACCOUNTANT.evicted,
+        'max_rss_bytes': max_rss,
+        'tracemalloc': traced_allocations(limit),
+    }
@@ -0,0 +1,451 @@
+"""
+Prometheus metrics shared by the Django and FastAPI servers.
+
+Counters, gauges and histograms are kept in a small store per process.
+With ``METRICS_DIR`` set, each process keeps its store in a memory-mapped
+file ``<pid>.db`` in that directory, and a scrape served by any worker adds
+up the files of all of them, so gunicorn and uvicorn workers report one set
+of numbers. Without it, metrics cover the serving process only.
+
+Updating a value is a dictionary lookup and an in-place write under a
+per-process lock. Files only grow when a new label combination appears.
+
+The directory should be emptied when the server starts, as files of
+earlier runs are otherwise added in (counters) or shown (gauges of
+processes with recycled PIDs).
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INITIAL_FILE_SIZE = 64 * 1024
+_HEADER = struct.Struct('<I4x')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+
+class MemoryStore:
+    """Metric values of this process, keyed by encoded sample keys."""
+
+    def __init__(self):
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key: str, value: float):
+        with self._lock:
+            self._values[key] = value
+
+    def items(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class FileStore(MemoryStore):
+    """
+    Metric values of this process in a memory-mapped file.
+
+    The file holds a used-length header followed by entries of
+    ``(key length, key, padding, double)``. Entries are only appended, and
+    the header is updated after an entry is complete, so other processes
+    can read the file at any time.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._offsets: Dict[str, int] = {}
+        self._file = open(path, 'a+b')
+        if os.path.getsize(path) < _INITIAL_FILE_SIZE:
+            self._file.truncate(_INITIAL_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        used = _HEADER.unpack_from(self._map, 0)[0]
+        if used == 0:
+            used = _HEADER.size
+            _HEADER.pack_into(self._map, 0, used)
+        for key, value, offset in self._entries(self._map, used):
+            self._values[key] = value
+            self._offsets[key] = offset
+
+    @staticmethod
+    def _entries(data, used: int) -> Iterator[Tuple[str, float, int]]:
+        position = _HEADER.size
+        while position < used:
+            length = _KEY_LENGTH.unpack_from(data, position)[0]
+            key_start = position + _KEY_LENGTH.size
+            value_offset = _padded(key_start + length)
+            yield (bytes(data[key_start:key_start + length]).decode(),
+                   _VALUE.unpack_from(data, value_offset)[0], value_offset)
+            position = value_offset + _VALUE.size
+
+    @classmethod
+    def read(cls, path: str) -> Dict[str, float]:
+        """The values in another process's file."""
+        with open(path, 'rb') as handle:
+            data = handle.read()
+        if len(data) < _HEADER.size:
+            return {}
+        used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+        return {key: value for key, value, _ in cls._entries(data, used)}
+
+    def _write(self, key: str, value: float):
+        offset = self._offsets.get(key)
+        if offset is None:
+            encoded = key.encode()
+            used = _HEADER.unpack_from(self._map, 0)[0]
+            key_start = used + _KEY_LENGTH.size
+            offset = _padded(key_start + len(encoded))
+            end = offset + _VALUE.size
+            if end > len(self._map):
+                size = len(self._map)
+                while size < end:
+                    size *= 2
+                self._map.close()
+                self._file.truncate(size)
+                self._map = mmap.mmap(self._file.fileno(), 0)
+            _KEY_LENGTH.pack_into(self._map, used, len(encoded))
+            self._map[key_start:key_start + len(encoded)] = encoded
+            _VALUE.pack_into(self._map, offset, value)
+            _HEADER.pack_into(self._map, 0, end)
+            self._offsets[key] = offset
+        else:
+            _VALUE.pack_into(self._map, offset, value)
+
+    def add(self, key: str, amount: float):
+        with self._lock:
+            value = self._values.get(key, 0.0) + amount
+            self._values[key] = value
+            self._write(key, value)
+
+    def set(self, key: str, value: float):
+        with self._lock:
+            self._values[key] = value
+            self._write(key, value)
+
+
+class Registry:
+    """The metrics of this process and where their values are stored."""
+
+    def __init__(self, directory: str = ''):
+        self.directory = directory
+        self.metrics: Dict[str, 'Metric'] = {}
+        self._store = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric: 'Metric'):
+        if metric.name in self.metrics:
+            raise ValueError(f'metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+
+    @property
+    def store(self) -> MemoryStore:
+        # Forked workers (gunicorn --preload) must not write to their parent's file
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if self.directory:
+                        os.makedirs(self.directory, exist_ok=True)
+                        self._store = FileStore(os.path.join(self.directory, f'{pid}.db'))
+                    else:
+                        self._store = MemoryStore()
+                    self._pid = pid
+        return self._store
+
+    def samples(self) -> Iterator[Tuple[Optional[int], Dict[str, float]]]:
+        """``(pid, values)`` for every process; pid is None for this process's memory store."""
+        if not self.directory:
+            yield None, dict(self.store.items())
+            return
+        self.store  # make sure this process has a file
+        for name in os.listdir(self.directory):
+            if name.endswith('.db'):
+                try:
+                    yield int(name[:-3]), FileStore.read(os.path.join(self.directory, name))
+                except (OSError, ValueError):
+                    continue
+
+
+def _key(metric: str, sample: str, labels: Iterable[Tuple[str, str]]) -> str:
+    return json.dumps([metric, sample, list(labels)], separators=(',', ':'))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 registry: Optional[Registry] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+        self._keys: Dict[Tuple[str, tuple], str] = {}
+
+    def _key(self, sample: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+        key = self._keys.get((sample, labels))
+        if key is None:
+            key = self._keys[(sample, labels)] = _key(self.name, sample, labels)
+        return key
+
+    def _labels(self, labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def merge(self, samples: List[Tuple[Optional[int], Dict]]) -> Dict:
+        """Combine the per-process values of this metric; counters and histograms add up."""
+        merged = {}
+        for _, values in samples:
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def exposition(self, merged: Dict[Tuple[str, tuple], float]) -> List[str]:
+        lines = []
+        for (sample, labels), value in sorted(merged.items()):
+            rendered = ','.join(f'{name}="{_escape(label)}"' for name, label in labels)
+            lines.append(f'{sample}{{{rendered}}} {_format_value(value)}' if rendered
+                         else f'{sample} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.registry.store.add(self._key(self.name + '_total', self._labels(labels)), amount)
+
+
+class Gauge(Metric):
+    """
+    A value that is set.
+
+    With several processes, ``mode`` decides how their values combine:
+    ``all`` shows each live process under a ``pid`` label, ``sum`` adds
+    the live processes up and ``max`` takes the largest.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 mode: str = 'all', registry: Optional[Registry] = None):
+        if mode not in ('all', 'sum', 'max'):
+            raise ValueError(f'unknown gauge mode "{mode}"')
+        self.mode = mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value: float, **labels):
+        self.registry.store.set(self._key(self.name, self._labels(labels)), value)
+
+    def merge(self, samples):
+        merged = {}
+        for pid, values in samples:
+            if pid is not None and pid != os.getpid() and not _process_alive(pid):
+                continue
+            for (sample, labels), value in values.items():
+                if self.mode == 'all':
+                    key = (sample, labels + (('pid', str(pid if pid is not None else os.getpid())),))
+                    merged[key] = value
+                elif self.mode == 'sum':
+                    merged[(sample, labels)] = merged.get((sample, labels), 0.0) + value
+                else:
+                    merged[(sample, labels)] = max(merged.get((sample, labels), value), value)
+        return merged
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, registry: Optional[Registry] = None):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._bucket_labels = tuple(_format_value(bound) for bound in self.buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        labels = self._labels(labels)
+        store = self.registry.store
+        # Each observation is stored in its own bucket; exposition makes them cumulative
+        bucket = self._bucket_labels[bisect.bisect_left(self.buckets, value)]
+        store.add(self._key(self.name + '_bucket', labels + (('le', bucket),)), 1.0)
+        store.add(self._key(self.name + '_sum', labels), value)
+        store.add(self._key(self.name + '_count', labels), 1.0)
+
+    def exposition(self, merged):
+        series = {}
+        for (sample, labels), value in merged.items():
+            if sample.endswith('_bucket'):
+                base = tuple(label for label in labels if label[0] != 'le')
+                series.setdefault(base, {})[dict(labels)['le']] = value
+        lines = []
+        for base in sorted(series):
+            running = 0.0
+            for bound in self._bucket_labels:
+                running += series[base].get(bound, 0.0)
+                merged[(self.name + '_bucket', base + (('le', bound),))] = running
+        for (sample, labels), value in sorted(merged.items(), key=self._order):
+            rendered = ','.join(f'{name}="{_escape(label)}"' for name, label in labels)
+            lines.append(f'{sample}{{{rendered}}} {_format_value(value)}' if rendered
+                         else f'{sample} {_format_value(value)}')
+        return lines
+
+    def _order(self, item):
+        (sample, labels), _ = item
+        base = tuple(label for label in labels if label[0] != 'le')
+        le = dict(labels).get('le')
+        return base, sample != self.name + '_bucket', self._bucket_labels.index(le) if le else 0, sample
+
+
+ENABLED = settings.METRICS_ENABLED
+
+REGISTRY = Registry(settings.METRICS_DIR)
+
+
+def exposition(registry: Registry = REGISTRY) -> str:
+    """All metrics in the Prometheus text format."""
+    per_metric = {}
+    for pid, values in registry.samples():
+        for key, value in values.items():
+            metric, sample, labels = json.loads(key)
+            per_metric.setdefault(metric, {}).setdefault(pid, {})[(sample, tuple(map(tuple, labels)))] = value
+    lines = []
+    for name, metric in sorted(registry.metrics.items()):
+        lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        samples = list(per_metric.get(name, {}).items())
+        lines.extend(metric.exposition(metric.merge(samples)))
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent serving HTTP requests.', ('server', 'endpoint', 'method'),
+)
+REQUESTS = Counter(
+    'http_requests', 'HTTP requests served.', ('server', 'endpoint', 'method', 'status'),
+)
+SEARCH_SETTLED = Histogram(
+    'route_search_settled_nodes', 'Cities settled per route search.',
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000),
+)
+SEARCH_PUSHES = Histogram(
+    'route_search_heap_pushes', 'Priority queue pushes per route search.',
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000),
+)
+ROUTE_CACHE_LOOKUPS = Counter(
+    'route_cache_lookups', 'Rendered route cache lookups by result (hit or miss).', ('result',),
+)
+ROUTE_CACHE_ENTRIES = Gauge(
+    'route_cache_entries', 'Responses held in the rendered route caches.', mode='sum',
+)
+ROUTE_CACHE_BYTES = Gauge(
+    'route_cache_bytes', 'Bytes of rendered responses held in the route caches.', mode='sum',
+)
+GRAPH_INFO = Gauge(
+    'graph_info', 'Version of the routing graph loaded by each process (1 for the current one).', ('version',),
+)
+GRAPH_BUILD_SECONDS = Histogram(
+    'graph_build_duration_seconds', 'Time spent building the routing graph from the database.',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+GRAPH_NODES = Gauge('graph_nodes', 'Cities in the routing graph.', mode='max')
+GRAPH_CONNECTIONS = Gauge('graph_road_connections', 'Road connections in the routing graph.', mode='max')
+GRAPH_BYTES = Gauge('graph_memory_bytes', 'Estimated memory held by the routing graphs.', mode='sum')
+
+
+def graph_built(graph, previous_version: Optional[str] = None):
+    """Record a newly built process-wide graph."""
+    if not ENABLED:
+        return
+    if previous_version is not None and previous_version != graph.version:
+        GRAPH_INFO.set(0, version=previous_version)
+    GRAPH_INFO.set(1, version=graph.version)
+    GRAPH_BUILD_SECONDS.observe(graph.build_seconds)
+    GRAPH_NODES.set(len(graph.graph))
+    GRAPH_CONNECTIONS.set(graph.connection_count)
+    GRAPH_BYTES.set(graph.nbytes())
+
+
+def request_served(server: str, endpoint: str, method: str, status: int, seconds: float):
+    REQUEST_LATENCY.observe(seconds, server=server, endpoint=endpoint, method=method)
+    REQUESTS.inc(server=server, endpoint=endpoint, method=method, status=status)
+
+
+def search_done(stats):
+    if ENABLED:
+        SEARCH_SETTLED.observe(stats.settled)
+        SEARCH_PUSHES.observe(stats.pushes)
+
+
+def cache_lookup(hit: bool):
+    if ENABLED:
+        ROUTE_CACHE_LOOKUPS.inc(result='hit' if hit else 'miss')
+
+
+def cache_sized(cache):
+    """Record the size of a route cache after a request."""
+    ROUTE_CACHE_ENTRIES.set(len(cache))
+    ROUTE_CACHE_BYTES.set(cache.nbytes)
+
+
+class MetricsMiddleware:
+    """Record latency and status of every Django request."""
+
+    def __init__(self, get_response):
+        if not ENABLED:
+            raise MiddlewareNotUsed
+        from .rendering import route_cache
+        self.route_cache = route_cache
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        endpoint = '/' + match.route if match is not None else 'unmatched'
+        request_served('django', endpoint, request.method, response.status_code, time.perf_counter() - started)
+        cache_sized(self.route_cache)
+        return response
@@ -0,0 +1,143 @@
+"""
+Persisted table of precomputed routes.
+
+``manage.py precompute_routes`` fills :class:`~cities.models.PrecomputedRoute`
+with the shortest route between every ordered pair of cities, searched in
+parallel by a pool of worker processes. Rows record the graph version and
+the newest graph change log entry they were computed at, and are ignored
+once a later change has been logged.
+
+``PRECOMPUTED_ROUTES`` selects when route requests consult the table:
+
+- ``cold``: until the process has loaded its graph, which is then built in
+  the background instead of holding up requests;
+- ``always``: before the engine on every request, so a process whose table
+  covers the network never builds a graph (e.g. serverless instances).
+
+A request the table cannot answer, or one for geometry or a trace, goes to
+the engine.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.db.models import Q
+from cities.changelog import latest_change_seq
+from cities.models import City, PrecomputedRoute
+from .dijkstra import city_not_found, city_record, city_rows, current_graph, get_graph, route_city, route_error
+from .timing import span
+
+MODES = ('', 'cold', 'always')
+
+if settings.PRECOMPUTED_ROUTES not in MODES:
+    raise ImproperlyConfigured(f"PRECOMPUTED_ROUTES must be one of {', '.join(map(repr, MODES))}")
+
+_build_lock = threading.Lock()
+_build_started = False
+
+
+def encode_path(path_city_ids: List[int]) -> str:
+    return ','.join(map(str, path_city_ids))
+
+
+def decode_path(text: str) -> List[int]:
+    return [int(city_id) for city_id in text.split(',')] if text else []
+
+
+def start_background_build():
+    """Build the process-wide graph in a background thread, once."""
+    global _build_started
+    with _build_lock:
+        if _build_started:
+            return
+        _build_started = True
+    threading.Thread(target=get_graph, name='graph-build', daemon=True).start()
+
+
+def wanted(geometry: bool = False, zoom: Optional[int] = None, trace: bool = False) -> bool:
+    """Whether a route request should be looked up in the table before the engine."""
+    mode = settings.PRECOMPUTED_ROUTES
+    if not mode or geometry or zoom is not None or trace:
+        return False
+    if mode == 'always':
+        return True
+    if current_graph() is not None:
+        return False
+    start_background_build()
+    return True
+
+
+def _city_filter(names: List[str]) -> Q:
+    # Names are matched like graph.find_city(), ignoring case
+    query = Q()
+    for name in names:
+        query |= Q(name__iexact=name)
+    return query
+
+
+def missing_cities(city_names: List[str]) -> List[str]:
+    """The names among ``city_names`` of no city in the database, checked without a graph."""
+    names = [name.strip() for name in city_names]
+    found = {name.casefold() for name in City.objects.filter(_city_filter(names)).values_list('name', flat=True)}
+    return [city_name for city_name, name in zip(city_names, names) if name.casefold() not in found]
+
+
+def lookup_route(from_city_name: str, to_city_name: str) -> Optional[Dict]:
+    """
+    Route between two cities from the precomputed table.
+
+    Returns a dictionary in the format of ``calculate_shortest_route``, or
+    None when the table has no current row for the pair.
+    """
+    answer = lookup_versioned_route(from_city_name, to_city_name)
+    return answer[0] if answer is not None else None
+
+
+def lookup_versioned_route(from_city_name: str, to_city_name: str) -> Optional[Tuple[Dict, Optional[str]]]:
+    """
+    Like :func:`lookup_route`, but also returns the graph version the answer holds for.
+
+    The version is that of the graph the row was computed from, which is
+    the version a graph built now would have; it is None for answers that
+    need no row (unknown cities, a route from a city to itself).
+    """
+    try:
+        with span('precomputed'):
+            return _lookup(from_city_name, to_city_name)
+    except DatabaseError:
+        return None
+
+
+def _lookup(from_city_name: str, to_city_name: str) -> Optional[Tuple[Dict, Optional[str]]]:
+    names = [name.strip() for name in (from_city_name or '', to_city_name or '')]
+    catalog = {row[1].casefold(): city_record(row) for row in city_rows(City.objects.filter(_city_filter(names)))}
+    from_city = catalog.get(names[0].casefold())
+    to_city = catalog.get(names[1].casefold())
+    for city, city_name in ((from_city, from_city_name), (to_city, to_city_name)):
+        if city is None:
+            return city_not_found(city_name), None
+
+    if from_city['id'] == to_city['id']:
+        distance, path_city_ids, version = 0.0, [from_city['id']], None
+    else:
+        row = PrecomputedRoute.objects.filter(
+            from_city_id=from_city['id'], to_city_id=to_city['id'], change_seq=latest_change_seq(),
+        ).values_list('distance_km', 'path', 'graph_version').first()
+        if row is None:
+            return None
+        if row[0] is None:
+            return route_error('No route found between the specified cities'), row[2]
+        distance, path_city_ids, version = row[0], decode_path(row[1]), row[2]
+
+    cities = {city['id']: city for city in map(city_record, city_rows(City.objects.filter(id__in=path_city_ids)))}
+    if len(cities) != len(set(path_city_ids)):
+        return None
+    return {
+        'success': True,
+        'total_distance': round(distance, 2),
+        'path': path_city_ids,
+        'cities': [route_city(cities[city_id]) for city_id in path_city_ids],
+        'from_city': route_city(from_city),
+        'to_city': route_city(to_city),
+    }, version
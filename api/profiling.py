@@ -0,0 +1,179 @@
+"""
+On-demand profiling of route queries in the serving process.
+
+:func:`profile_routes` runs route queries against the live in-memory graph
+under ``cProfile`` while a sampling thread records the profiled thread's
+call stacks. The result holds the hot functions, sorted like ``pstats``,
+and the sampled stacks in the collapsed format read by ``flamegraph.pl``
+and speedscope (one ``frame;frame;frame count`` line per distinct stack).
+
+Only one profile runs per process at a time; a second one fails with
+:class:`ProfilerBusy` instead of waiting. Profiles are stopped once their
+time limit passes, even in the middle of a search: the queries run under a
+search deadline (see :mod:`api.search`), which cancels the running search at
+its next check, and the partial profile is returned. Nothing else is
+interrupted, so graph builds, database queries and metrics writes made by
+the queries always run to completion.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+from .dijkstra import calculate_routes, calculate_shortest_route, get_graph
+from .search import SearchCancelled, search_deadline
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process."""
+
+
+def frame_label(code) -> str:
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample the call stack of one thread at a fixed interval.
+
+    Stacks are cut at the ``root`` code object, so server and framework
+    frames below the profiled call do not show up.
+    """
+
+    def __init__(self, thread_id: int, root, interval: float):
+        super().__init__(name='route-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and frame.f_code is not self.root:
+            stack.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        if stack and frame is not None:
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def finish(self):
+        """Stop sampling."""
+        self.stopped.set()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+def hot_functions(profile: cProfile.Profile, sort: str, limit: int) -> List[Dict]:
+    stats = pstats.Stats(profile)
+    stats.sort_stats(sort)
+    rows = []
+    for function in stats.fcn_list[:limit]:
+        primitive_calls, calls, own_seconds, cumulative_seconds, _ = stats.stats[function]
+        filename, line, name = function
+        rows.append({
+            'function': name,
+            'file': filename,
+            'line': line,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_ms': round(own_seconds * 1000, 3),
+            'cumtime_ms': round(cumulative_seconds * 1000, 3),
+        })
+    return rows
+
+
+def _run_queries(queries: List[Tuple[str, str]], batch: bool, repeat: int, deadline: float,
+                 progress: Counter) -> bool:
+    """
+    Run the queries ``repeat`` times or until ``deadline``, counting them in ``progress``.
+
+    Returns whether they all ran; the deadline is checked between queries
+    and by the searches themselves.
+    """
+    with search_deadline(deadline):
+        try:
+            for _ in range(repeat):
+                if batch:
+                    if time.perf_counter() >= deadline:
+                        return False
+                    calculate_routes(queries, in_process=True)
+                    progress['completed'] += len(queries)
+                    continue
+                for from_city, to_city in queries:
+                    if time.perf_counter() >= deadline:
+                        return False
+                    calculate_shortest_route(from_city, to_city)
+                    progress['completed'] += 1
+        except SearchCancelled:
+            return False
+    return True
+
+
+def profile_routes(queries: List[Tuple[str, str]], batch: bool = False, repeat: int = 1,
+                   time_limit: float = 10.0, sort: str = 'cumulative', limit: int = 30,
+                   interval: float = 0.001) -> Dict:
+    """
+    Profile route queries against the live graph.
+
+    Args:
+        queries: (from_city_name, to_city_name) pairs
+        batch: Answer them as one batch (grouped one-to-many searches, always
+            in this process) instead of one route at a time
+        repeat: How many times to run the queries
+        time_limit: Seconds after which the profile is stopped
+        sort: ``pstats`` sort key for the hot functions (one of SORT_KEYS)
+        limit: Number of hot functions returned
+        interval: Seconds between stack samples
+
+    Returns:
+        The hot functions, the collapsed stacks and a summary of the run
+
+    Raises:
+        ProfilerBusy: if a profile is already running in this process
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy('A profile is already running')
+    try:
+        # Build or refresh the graph first, so the profile only covers the queries
+        graph = get_graph()
+        started = time.perf_counter()
+        deadline = started + time_limit
+        sampler = StackSampler(threading.get_ident(), _run_queries.__code__, interval)
+        profile = cProfile.Profile()
+        progress = Counter()
+        sampler.start()
+        profile.enable()
+        try:
+            finished = _run_queries(queries, batch, repeat, deadline, progress)
+        finally:
+            profile.disable()
+            sampler.finish()
+            sampler.join()
+        elapsed = time.perf_counter() - started
+        return {
+            'graph_version': graph.version,
+            'queries': len(queries) * repeat,
+            'completed': progress['completed'],
+            'timed_out': not finished,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'samples': sum(sampler.stacks.values()),
+            'hot_functions': hot_functions(profile, sort, limit),
+            'collapsed': sampler.collapsed(),
+        }
+    finally:
+        _lock.release()
@@ -0,0 +1,87 @@
+"""
+Per-request database query counting.
+
+Every database connection gets an execute wrapper that adds each query to
+the counter of the current context, if there is one. Context variables
+follow a request into the threads that serve it, so queries made from the
+FastAPI routing pool are counted as well as those made by a Django view.
+
+With ``DB_QUERY_COUNT_HEADER`` enabled, both servers report the count in an
+``X-DB-Queries`` response header, which load tests read per request.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+HEADER = 'X-DB-Queries'
+
+
+class QueryCounter:
+    """Number of queries run and seconds spent in them."""
+
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_current: ContextVar[Optional[QueryCounter]] = ContextVar('db_query_counter', default=None)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """
+    Count the queries made in this context (and threads it is copied to).
+
+    Nested blocks share the enclosing counter, so compare its count before
+    and after to get the queries made inside a nested block.
+    """
+    counter = _current.get()
+    if counter is not None:
+        yield counter
+        return
+    counter = QueryCounter()
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    counter = _current.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_counter(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class QueryCountMiddleware:
+    """Add an ``X-DB-Queries`` header to every Django response."""
+
+    def __init__(self, get_response):
+        if not settings.DB_QUERY_COUNT_HEADER:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+        response[HEADER] = str(counter.count)
+        return response
@@ -0,0 +1,184 @@
+"""
+Sampled log of route, matrix and search queries.
+
+With ``QUERY_LOG_PATH`` set, a ``QUERY_LOG_SAMPLE_RATE`` share of the
+requests to the routing and search endpoints of either server is appended
+to that file, one JSON object per line::
+
+    {"ts": 1760870400.123, "server": "django", "kind": "route", "method": "POST",
+     "path": "/api/calculate-route/", "params": {"from_city": "Lagos", "to_city": "Kano"},
+     "status": 200, "latency_ms": 1.234, "graph_version": "bf072e468f22ca54"}
+
+``kind`` is one of :data:`KINDS`; ``params`` holds the query string, path
+parameters and JSON body, so an entry can be replayed against either
+server. Every line is written with one append, so the worker processes of
+a server can share the file.
+
+The log drives ``manage.py replay_queries`` and, with
+``ROUTE_CACHE_WARM_LOG``, the warm-up of the route cache
+(:func:`hottest_routes`).
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from .dijkstra import current_graph
+
+KINDS = ('route', 'coordinates', 'batch', 'matrix', 'search', 'nearest', 'within')
+
+# URL pattern names of the logged Django views
+DJANGO_KINDS = {
+    'calculate_route': 'route',
+    'calculate_route_from_coordinates': 'coordinates',
+    'calculate_route_batch': 'batch',
+    'route_matrix': 'matrix',
+    'search_cities': 'search',
+    'nearest_cities': 'nearest',
+    'cities_within': 'within',
+}
+
+# Route paths of the logged FastAPI endpoints
+FASTAPI_KINDS = {
+    '/calculate-route': 'route',
+    '/calculate-route/from-coordinates': 'coordinates',
+    '/calculate-routes': 'batch',
+    '/route-matrix': 'matrix',
+    '/cities/search/{query}': 'search',
+    '/cities/nearest': 'nearest',
+    '/cities/within': 'within',
+}
+
+# Request bodies longer than this are logged without their body parameters
+MAX_BODY_BYTES = 1024 * 1024
+
+ENABLED = bool(settings.QUERY_LOG_PATH)
+
+
+class QueryLog:
+    """Append-only JSON lines file shared by threads and processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def write(self, entry: Dict):
+        line = (json.dumps(entry, separators=(',', ':'), default=str) + '\n').encode()
+        with self.lock:
+            # Forked workers open their own descriptor
+            if self.pid != os.getpid():
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self.pid = os.getpid()
+            os.write(self.fd, line)
+
+
+LOG = QueryLog(settings.QUERY_LOG_PATH) if ENABLED else None
+
+
+def sampled() -> bool:
+    return random.random() < settings.QUERY_LOG_SAMPLE_RATE
+
+
+def request_params(query_string: str, body: bytes, path_params: Optional[Dict] = None) -> Dict:
+    """Query string, path parameters and JSON object body of a request as one dictionary."""
+    params = dict(parse_qsl(query_string, keep_blank_values=True))
+    if path_params:
+        params.update(path_params)
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            params.update(payload)
+    return params
+
+
+def record(server: str, kind: str, method: str, path: str, params: Dict,
+           status: int, started_at: float, seconds: float):
+    graph = current_graph()
+    LOG.write({
+        'ts': round(started_at, 3),
+        'server': server,
+        'kind': kind,
+        'method': method,
+        'path': path,
+        'params': params,
+        'status': status,
+        'latency_ms': round(seconds * 1000, 3),
+        'graph_version': graph.version if graph is not None else None,
+    })
+
+
+def read_log(path: str) -> Iterator[Dict]:
+    """The entries of a query log, skipping lines that are not entries."""
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get('kind') in KINDS:
+                entry.setdefault('params', {})
+                yield entry
+
+
+def is_flag(value) -> bool:
+    """Truth of a JSON or query string boolean."""
+    return value is True or str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def hottest_routes(entries: Iterator[Dict], count: int) -> List[Tuple[Tuple[str, str, bool, Optional[int]], int]]:
+    """
+    The ``count`` most requested successful routes with their request counts.
+
+    Routes are ``(from_city, to_city, geometry, zoom)`` tuples, the arguments
+    of a route request.
+    """
+    routes = Counter()
+    for entry in entries:
+        params = entry['params']
+        if entry['kind'] != 'route' or entry.get('status') != 200 or is_flag(params.get('trace')):
+            continue
+        if not params.get('from_city') or not params.get('to_city'):
+            continue
+        zoom = params.get('zoom')
+        try:
+            zoom = int(zoom) if zoom not in (None, '') else None
+        except (TypeError, ValueError):
+            continue
+        routes[(params['from_city'], params['to_city'], is_flag(params.get('geometry')), zoom)] += 1
+    return routes.most_common(count)
+
+
+class QueryLogMiddleware:
+    """Log a sample of the Django requests to the routing and search endpoints."""
+
+    def __init__(self, get_response):
+        if not ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started_at = time.time()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        params = getattr(request, '_query_log_params', None)
+        if params is not None:
+            record('django', DJANGO_KINDS[request.resolver_match.url_name], request.method,
+                   request.path, params, response.status_code, started_at, time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.url_name in DJANGO_KINDS and sampled():
+            # Reading the body here keeps it available to the view
+            request._query_log_params = request_params(request.META.get('QUERY_STRING', ''),
+                                                       request.body, view_kwargs)
+        return None
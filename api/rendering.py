@@ -0,0 +1,207 @@
+"""
+Fast-path JSON rendering for hot endpoints.
+
+Route responses are assembled from pre-encoded fragments instead of being
+built as dictionaries and run through DRF's renderer. Each city's route
+payload is encoded once per graph version, so a route body is just the
+distance and path plus a concatenation of cached city fragments. Finished
+route bodies are kept in a small LRU cache keyed by graph version. With
+``ROUTE_CACHE_WARM_LOG`` set, the routes requested most often in that query
+log are rendered into the cache in the background whenever a new graph
+version is first used. The route cache counts towards ``MEMORY_BUDGET_MB``
+(see :mod:`api.memory`); once the city fragments are dropped to stay within
+it, they are encoded per response.
+
+The output is byte-for-byte what ``rest_framework.renderers.JSONRenderer``
+produces for the same data with the default settings. orjson is used for
+encoding when it is installed and falls back to the standard library.
+"""
+import json
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from . import memory
+from .cache import LRUCache
+from .dijkstra import get_graph, record_search, route_city, route_error
+from .geometry import geometry_level, route_geometry
+from .metrics import cache_lookup
+from .precomputed import lookup_route, wanted as precomputed_wanted
+from .querylog import hottest_routes, read_log
+from .search import SearchStats
+from .timing import note, span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _escape_line_separators(data: bytes) -> bytes:
+    # Mirror JSONRenderer, which escapes U+2028/U+2029 for JavaScript safety
+    if b'\xe2\x80' in data:
+        data = data.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    return data
+
+
+if orjson is not None:
+    def dumps(value) -> bytes:
+        """Encode a value as compact UTF-8 JSON."""
+        return _escape_line_separators(orjson.dumps(value))
+else:
+    def dumps(value) -> bytes:
+        """Encode a value as compact UTF-8 JSON."""
+        return _escape_line_separators(
+            json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        )
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Falls back to the standard renderer for pretty-printed output and for
+    data orjson cannot encode natively.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return _escape_line_separators(orjson.dumps(data))
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class CityFragments:
+    """Stand-in for the ``city_fragments`` artifact that encodes each city on access."""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, city_id: int) -> bytes:
+        return dumps(route_city(self.graph.cities[city_id]))
+
+
+def city_fragments(graph) -> Dict[int, bytes]:
+    """Encoded route payload for every city in ``graph``, built once per graph."""
+    fragments = graph.artifacts.get('city_fragments')
+    if fragments is None:
+        if not memory.may_build(graph, 'city_fragments'):
+            return CityFragments(graph)
+        fragments = {city_id: dumps(route_city(city)) for city_id, city in graph.cities.items()}
+        graph.artifacts['city_fragments'] = fragments
+        memory.enforce(graph)
+    return fragments
+
+
+logger = logging.getLogger(__name__)
+
+route_cache = LRUCache(settings.ROUTE_CACHE_SIZE, sizeof=lambda entry: len(entry[1]))
+memory.register_cache('route_cache', route_cache)
+
+_warmed_version = None
+_warm_lock = threading.Lock()
+
+
+def warm_route_cache(count: int) -> int:
+    """Render the ``count`` routes requested most often in ``ROUTE_CACHE_WARM_LOG``; returns how many."""
+    try:
+        routes = hottest_routes(read_log(settings.ROUTE_CACHE_WARM_LOG), count)
+    except OSError as e:
+        logger.warning("Route cache warm-up skipped: %s", e)
+        return 0
+    for (from_city_name, to_city_name, geometry, zoom), _ in routes:
+        render_route(from_city_name, to_city_name, geometry, zoom)
+    logger.info("Warmed the route cache with %d routes", len(routes))
+    return len(routes)
+
+
+def start_warm_up(graph):
+    """Warm the route cache for ``graph`` in the background, once per graph version."""
+    global _warmed_version
+    with _warm_lock:
+        if _warmed_version == graph.version:
+            return
+        _warmed_version = graph.version
+    count = min(settings.ROUTE_CACHE_WARM_ROUTES, settings.ROUTE_CACHE_SIZE)
+    threading.Thread(target=warm_route_cache, args=(count,), name='route-cache-warm-up', daemon=True).start()
+
+
+def render_precomputed(result: Dict) -> Tuple[int, bytes]:
+    """Render a route answered from the precomputed table as ``(http_status, body)``."""
+    note('source', 'precomputed')
+    return (status.HTTP_200_OK if result['success'] else status.HTTP_404_NOT_FOUND), dumps(result)
+
+
+def render_route(from_city_name: str, to_city_name: str,
+                 geometry: bool = False, zoom: Optional[int] = None,
+                 precomputed: bool = True) -> Tuple[int, bytes]:
+    """
+    Calculate a route and render its JSON response body.
+
+    Equivalent to rendering ``calculate_shortest_route(...)`` with
+    JSONRenderer, returning ``(http_status, body)``. The precomputed table is
+    consulted first when wanted, unless ``precomputed`` is False because the
+    caller already did.
+    """
+    with_geometry = geometry or zoom is not None
+    try:
+        if precomputed and precomputed_wanted(geometry, zoom):
+            result = lookup_route(from_city_name, to_city_name)
+            if result is not None:
+                return render_precomputed(result)
+        
+        with span('graph'):
+            graph = get_graph()
+        if settings.ROUTE_CACHE_WARM_LOG and graph.version != _warmed_version:
+            start_warm_up(graph)
+        from_city = graph.find_city(from_city_name)
+        to_city = graph.find_city(to_city_name)
+        for city, city_name in ((from_city, from_city_name), (to_city, to_city_name)):
+            if city is None:
+                return (status.HTTP_404_NOT_FOUND,
+                        dumps(route_error(f'City "{city_name}" not found in database')))
+
+        # Zooms sharing a precomputed geometry level share a cache entry
+        key = (graph.version, from_city['id'], to_city['id'],
+               geometry_level(zoom) if with_geometry else False)
+        cached = route_cache.get(key)
+        note('cache', 'miss' if cached is None else 'hit')
+        cache_lookup(cached is not None)
+        if cached is not None:
+            return cached
+
+        stats = SearchStats()
+        with span('search'):
+            total_distance, path_city_ids = graph.dijkstra(from_city['id'], to_city['id'], stats)
+        record_search(stats)
+        if total_distance == float('inf'):
+            rendered = (status.HTTP_404_NOT_FOUND,
+                        dumps(route_error('No route found between the specified cities')))
+        else:
+            shape = b''
+            if with_geometry:
+                with span('geometry'):
+                    shape = b',"geometry":' + dumps(route_geometry(graph, path_city_ids, zoom))
+            with span('render'):
+                fragments = city_fragments(graph)
+                rendered = (status.HTTP_200_OK, b''.join((
+                    b'{"success":true,"total_distance":', dumps(round(total_distance, 2)),
+                    b',"path":', dumps(path_city_ids),
+                    b',"cities":[', b','.join(fragments[city_id] for city_id in path_city_ids),
+                    b'],"from_city":', fragments[from_city['id']],
+                    b',"to_city":', fragments[to_city['id']],
+                    shape,
+                    b'}',
+                )))
+        route_cache.set(key, rendered)
+        memory.enforce(graph)
+        return rendered
+
+    except Exception as e:
+        return status.HTTP_404_NOT_FOUND, dumps(route_error(f'An error occurred: {str(e)}'))
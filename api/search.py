@@ -0,0 +1,96 @@
+"""
+Statistics and trace events of a single route search.
+
+A :class:`SearchStats` passed to a search is filled in once it finishes;
+searches without one only keep a few local counters. Traced searches yield
+events instead, for visualizing how the frontier grows:
+
+- ``{"event": "push", "city": id, "distance": d, "via": id}`` when a city's
+  tentative distance improves and it joins the frontier,
+- ``{"event": "settle", "city": id, "distance": d}`` when its distance is
+  final,
+- ``{"event": "done", "distance": d, "path": [ids]}`` once, last, with a
+  null distance and empty path when the target is unreachable.
+
+Searches run inside :func:`search_deadline` check the clock every
+``DEADLINE_CHECK_POPS`` priority queue pops and raise
+:class:`SearchCancelled` once the deadline has passed; elsewhere they only
+pay for one context variable lookup per search.
+
+This module deliberately avoids importing Django.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEADLINE_CHECK_POPS = 1024
+
+_deadline: ContextVar[Optional[float]] = ContextVar('search_deadline', default=None)
+
+
+class SearchCancelled(BaseException):
+    """
+    Raised by a search once the deadline it runs under has passed.
+
+    Not an ``Exception``, so the route functions' error handling lets it
+    through, like ``KeyboardInterrupt``.
+    """
+
+
+@contextmanager
+def search_deadline(deadline: float):
+    """Cancel searches started in this context after ``deadline`` (a ``time.perf_counter()`` value)."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+class SearchStats:
+    """
+    Work done by one search: cities settled, edges scanned from them
+    (``relaxed``), priority queue pushes after the start, the queue's largest
+    size and the search time.
+    """
+
+    __slots__ = ('settled', 'relaxed', 'pushes', 'max_heap', 'seconds')
+
+    def __init__(self):
+        self.settled = 0
+        self.relaxed = 0
+        self.pushes = 0
+        self.max_heap = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'settled': self.settled,
+            'relaxed': self.relaxed,
+            'pushes': self.pushes,
+            'max_heap': self.max_heap,
+            'elapsed_ms': round(self.seconds * 1000, 3),
+        }
+
+
+def collect_trace(events: Iterator[Dict], limit: int) -> Tuple[List[Dict], bool, float, List[int]]:
+    """
+    Run a traced search to the end, keeping its first ``limit`` events.
+
+    The closing ``done`` event is always kept. Returns
+    ``(events, truncated, distance, path)``.
+    """
+    kept = list(islice(events, limit))
+    truncated = False
+    done = kept[-1] if kept else None
+    if done is None or done['event'] != 'done':
+        for done in events:
+            truncated = truncated or done['event'] != 'done'
+        kept.append(done)
+    distance = done['distance'] if done['distance'] is not None else float('inf')
+    return kept, truncated, distance, done['path']
@@ -1,5 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
 from cities.models import City, RoadConnection
+from .dijkstra import get_graph
+from .precomputed import missing_cities, wanted as precomputed_wanted
+from .profiling import SORT_KEYS
 
 
 class CitySerializer(serializers.ModelSerializer):
@@ -25,20 +29,122 @@ class RouteCalculationSerializer(serializers.Serializer):
     """Serializer for route calculation requests."""
     from_city = serializers.CharField(max_length=100, help_text="Name of the starting city")
     to_city = serializers.CharField(max_length=100, help_text="Name of the destination city")
+    geometry = serializers.BooleanField(required=False, default=False,
+                                        help_text="Include the route shape as an encoded polyline")
+    zoom = serializers.IntegerField(required=False, min_value=0, max_value=22,
+                                    help_text="Map zoom level to simplify the route shape for; implies geometry")
+    trace = serializers.BooleanField(required=False, default=False,
+                                     help_text="Include the search statistics and events")
     
-    def validate_from_city(self, value):
-        """Validate that the from_city exists."""
-        if not City.objects.filter(name__iexact=value).exists():
-            raise serializers.ValidationError(f"City '{value}' not found in database")
+    def validate(self, attrs):
+        """Validate that both cities exist."""
+        fields = ('from_city', 'to_city')
+        if precomputed_wanted(attrs['geometry'], attrs.get('zoom'), attrs['trace']):
+            # Answered from the precomputed table, so checked without building the graph
+            missing = set(missing_cities([attrs[field] for field in fields]))
+        else:
+            graph = get_graph()
+            missing = {attrs[field] for field in fields if graph.find_city(attrs[field]) is None}
+        errors = {field: [f"City '{attrs[field]}' not found in database"]
+                  for field in fields if attrs[field] in missing}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class RouteQuerySerializer(serializers.Serializer):
+    """Serializer for a single query inside a batch; unknown cities are reported per result."""
+    from_city = serializers.CharField(max_length=100)
+    to_city = serializers.CharField(max_length=100)
+
+
+class RouteBatchSerializer(serializers.Serializer):
+    """Serializer for batch route calculation requests."""
+    routes = RouteQuerySerializer(many=True, allow_empty=False)
+    
+    def validate_routes(self, value):
+        limit = settings.ROUTE_BATCH_MAX_QUERIES
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} routes can be calculated per request")
         return value
+
+
+class ProfileRequestSerializer(serializers.Serializer):
+    """Serializer for profiling a route (from_city/to_city) or a batch of routes."""
+    from_city = serializers.CharField(max_length=100, required=False)
+    to_city = serializers.CharField(max_length=100, required=False)
+    routes = RouteQuerySerializer(many=True, required=False, allow_empty=False)
+    batch = serializers.BooleanField(required=False, default=False,
+                                     help_text="Answer the routes as one batch instead of one by one")
+    repeat = serializers.IntegerField(required=False, default=1, min_value=1, max_value=100000)
+    time_limit = serializers.FloatField(required=False, min_value=0.01,
+                                        help_text="Seconds; capped at PROFILE_MAX_SECONDS")
+    sort = serializers.ChoiceField(choices=SORT_KEYS, required=False, default='cumulative')
+    limit = serializers.IntegerField(required=False, default=30, min_value=1, max_value=1000,
+                                     help_text="Number of hot functions returned")
+    format = serializers.ChoiceField(choices=('json', 'collapsed'), required=False, default='json')
+    
+    def validate(self, data):
+        if 'routes' in data:
+            queries = [(route['from_city'], route['to_city']) for route in data['routes']]
+        elif data.get('from_city') and data.get('to_city'):
+            queries = [(data['from_city'], data['to_city'])]
+        else:
+            raise serializers.ValidationError("Give either from_city and to_city or routes")
+        limit = settings.ROUTE_BATCH_MAX_QUERIES
+        if len(queries) > limit:
+            raise serializers.ValidationError(f"At most {limit} routes can be profiled per request")
+        data['queries'] = queries
+        data['time_limit'] = min(data.get('time_limit', settings.PROFILE_MAX_SECONDS),
+                                 settings.PROFILE_MAX_SECONDS)
+        return data
+
+
+class RouteMatrixSerializer(serializers.Serializer):
+    """Serializer for distance matrix requests."""
+    sources = serializers.ListField(child=serializers.CharField(max_length=100), allow_empty=False)
+    targets = serializers.ListField(child=serializers.CharField(max_length=100), allow_empty=False)
     
-    def validate_to_city(self, value):
-        """Validate that the to_city exists."""
-        if not City.objects.filter(name__iexact=value).exists():
-            raise serializers.ValidationError(f"City '{value}' not found in database")
+    def validate(self, data):
+        limit = settings.ROUTE_MATRIX_MAX_CELLS
+        if len(data['sources']) * len(data['targets']) > limit:
+            raise serializers.ValidationError(f"A matrix may contain at most {limit} cells")
+        return data
+
+
+class NearestCitiesSerializer(serializers.Serializer):
+    """Serializer for nearest-city queries."""
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    k = serializers.IntegerField(min_value=1, required=False, default=1)
+    
+    def validate_k(self, value):
+        if value > settings.SPATIAL_MAX_K:
+            raise serializers.ValidationError(f"At most {settings.SPATIAL_MAX_K} cities can be requested")
         return value
 
 
+class BoundingBoxSerializer(serializers.Serializer):
+    """Serializer for bounding-box (map viewport) queries."""
+    min_lat = serializers.FloatField(min_value=-90, max_value=90)
+    min_lng = serializers.FloatField(min_value=-180, max_value=180)
+    max_lat = serializers.FloatField(min_value=-90, max_value=90)
+    max_lng = serializers.FloatField(min_value=-180, max_value=180)
+    
+    def validate(self, data):
+        if data['min_lat'] > data['max_lat'] or data['min_lng'] > data['max_lng']:
+            raise serializers.ValidationError("Minimum coordinates must not exceed maximum coordinates")
+        return data
+
+
+class CoordinateRouteSerializer(serializers.Serializer):
+    """Serializer for route requests given as coordinates."""
+    from_lat = serializers.FloatField(min_value=-90, max_value=90)
+    from_lng = serializers.FloatField(min_value=-180, max_value=180)
+    to_lat = serializers.FloatField(min_value=-90, max_value=90)
+    to_lng = serializers.FloatField(min_value=-180, max_value=180)
+
+
 class RouteResultSerializer(serializers.Serializer):
     """Serializer for route calculation results."""
     success = serializers.BooleanField()
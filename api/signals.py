@@ -0,0 +1,19 @@
+"""
+Keep the in-memory routing graph in step with the database.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from cities.importing import network_imported
+from cities.models import City, RoadConnection
+from .dijkstra import invalidate_graph
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=RoadConnection)
+@receiver(post_delete, sender=RoadConnection)
+@receiver(network_imported)
+def invalidate_routing_graph(sender, **kwargs):
+    """Rebuild the graph once the change is committed."""
+    transaction.on_commit(invalidate_graph)
@@ -0,0 +1,257 @@
+"""
+Spatial index over city coordinates.
+
+A KD-tree over every city in the graph answers nearest-city and
+bounding-box queries in O(log N) instead of scanning the catalog. It is
+built lazily once per graph version and stored in ``graph.artifacts``;
+the tree itself lives in :mod:`geo.kdtree`.
+"""
+import heapq
+import math
+from typing import Dict, Iterator, List, Optional, Tuple
+from geo.distance import haversine_km
+from geo.kdtree import KM_PER_DEGREE, KDTree
+from . import memory
+from .geometry import connection_points
+
+class CityScan:
+    """
+    Linear-scan stand-in for the city KD-tree, with the same queries.
+
+    Used once the tree has been dropped to stay within the memory budget.
+    """
+
+    def __init__(self, graph):
+        self.cities = graph.cities
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> List[Tuple[float, object]]:
+        return heapq.nsmallest(k, (
+            (haversine_km(lat, lng, city['latitude'], city['longitude']), city_id)
+            for city_id, city in self.cities.items()
+        ), key=lambda item: item[0])
+
+    def within(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[object]:
+        return [
+            city_id for city_id, city in self.cities.items()
+            if min_lat <= city['latitude'] <= max_lat and min_lng <= city['longitude'] <= max_lng
+        ]
+
+
+def city_index(graph):
+    """KD-tree over the cities of ``graph``, built once per graph version."""
+    index = graph.artifacts.get('city_index')
+    if index is None:
+        if not memory.may_build(graph, 'city_index'):
+            return CityScan(graph)
+        index = KDTree([(city['latitude'], city['longitude'], city_id) for city_id, city in graph.cities.items()])
+        graph.artifacts['city_index'] = index
+        memory.enforce(graph)
+    return index
+
+
+def nearest_cities(graph, lat: float, lng: float, k: int = 1) -> List[Dict]:
+    """The ``k`` cities nearest to a point, each with its ``distance_km``."""
+    return [
+        {**graph.cities[city_id], 'distance_km': round(distance, 3)}
+        for distance, city_id in city_index(graph).nearest(lat, lng, k)
+    ]
+
+
+def cities_within(graph, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Dict]:
+    """Cities inside a bounding box, ordered by name."""
+    city_ids = city_index(graph).within(min_lat, min_lng, max_lat, max_lng)
+    return sorted((graph.cities[city_id] for city_id in city_ids), key=lambda city: city['name'])
+
+
+class SegmentTree:
+    """
+    Static R-tree over line segments, bulk-loaded with Sort-Tile-Recursive.
+
+    Each entry is a segment ``((lat1, lng1), (lat2, lng2), key)``. Leaves hold
+    up to ``capacity`` segments and are tiled by longitude and then latitude,
+    so sibling boxes barely overlap. Nearest-segment queries walk the tree
+    best-first by bounding-box distance.
+
+    Distances are measured on a plane tangent at the query point
+    (equirectangular), which is accurate at road-segment scale; segments
+    crossing the antimeridian are not supported.
+    """
+
+    def __init__(self, segments: List[Tuple[Tuple[float, float], Tuple[float, float], object]],
+                 capacity: int = 16):
+        self.size = len(segments)
+        self.capacity = capacity
+        level = [(self._segment_box(start, end), (start, end, key)) for start, end, key in segments]
+        self.root = None
+        if not level:
+            return
+        leaf = True
+        while True:
+            nodes = self._pack(level, leaf)
+            leaf = False
+            if len(nodes) == 1:
+                self.root = nodes[0]
+                break
+            level = [(node[0], node) for node in nodes]
+
+    @staticmethod
+    def _segment_box(start, end):
+        return (min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]), max(start[1], end[1]))
+
+    def _pack(self, items, leaf: bool):
+        """Group ``(box, child)`` items into nodes ``(box, is_leaf, children)``."""
+        capacity = self.capacity
+        node_count = math.ceil(len(items) / capacity)
+        slice_size = capacity * math.ceil(math.sqrt(node_count))
+        items.sort(key=lambda item: item[0][1] + item[0][3])
+        nodes = []
+        for i in range(0, len(items), slice_size):
+            vertical = sorted(items[i:i + slice_size], key=lambda item: item[0][0] + item[0][2])
+            for j in range(0, len(vertical), capacity):
+                group = vertical[j:j + capacity]
+                box = (
+                    min(item[0][0] for item in group), min(item[0][1] for item in group),
+                    max(item[0][2] for item in group), max(item[0][3] for item in group),
+                )
+                nodes.append((box, leaf, [child for _, child in group]))
+        return nodes
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[float, object, float, float, float]]:
+        """
+        The segment closest to ``(lat, lng)``.
+
+        Returns ``(distance_km, key, fraction, lat, lng)`` where ``fraction``
+        is how far along the segment (0 at its start, 1 at its end) the
+        closest point lies, and ``lat``/``lng`` is that point; None when the
+        tree is empty.
+        """
+        if self.root is None:
+            return None
+        project = tangent_projection(lat, lng)
+
+        def box_distance(box):
+            min_x, min_y = project(box[0], box[1])
+            max_x, max_y = project(box[2], box[3])
+            dx = max(min_x, 0.0, -max_x)
+            dy = max(min_y, 0.0, -max_y)
+            return math.hypot(dx, dy)
+
+        best = None
+        counter = 0
+        heap = [(0.0, counter, self.root)]
+        while heap:
+            bound, _, node = heapq.heappop(heap)
+            if best is not None and bound >= best[0]:
+                break
+            _, is_leaf, children = node
+            if is_leaf:
+                best = closest_segment(project, children, best)
+            else:
+                for child in children:
+                    counter += 1
+                    heapq.heappush(heap, (box_distance(child[0]), counter, child))
+        return best
+
+
+def tangent_projection(lat: float, lng: float):
+    """Map points to kilometres east and north of ``(lat, lng)`` on the plane tangent there."""
+    lng_scale = KM_PER_DEGREE * math.cos(math.radians(lat))
+
+    def project(point_lat, point_lng):
+        return (point_lng - lng) * lng_scale, (point_lat - lat) * KM_PER_DEGREE
+    return project
+
+
+def closest_segment(project, segments, best=None):
+    """
+    The segment nearest to the origin of ``project``, in the format of
+    :meth:`SegmentTree.nearest`, or ``best`` if none is closer than it.
+    """
+    for start, end, key in segments:
+        ax, ay = project(*start)
+        bx, by = project(*end)
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        fraction = min(1.0, max(0.0, -(ax * dx + ay * dy) / length)) if length else 0.0
+        distance = math.hypot(ax + fraction * dx, ay + fraction * dy)
+        if best is None or distance < best[0]:
+            best = (
+                distance, key, fraction,
+                start[0] + fraction * (end[0] - start[0]),
+                start[1] + fraction * (end[1] - start[1]),
+            )
+    return best
+
+
+class SegmentScan:
+    """
+    Linear-scan stand-in for the road R-tree, with the same query.
+
+    Used once the tree has been dropped to stay within the memory budget;
+    segments are generated again for every query.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[float, object, float, float, float]]:
+        return closest_segment(tangent_projection(lat, lng), road_segments(self.graph))
+
+
+def road_segments(graph) -> Iterator[Tuple[Tuple[float, float], Tuple[float, float], Tuple[int, float, float]]]:
+    """
+    Every segment of every road connection in ``graph``.
+
+    Segment keys are ``(connection_id, start_fraction, end_fraction)``: the
+    share of the connection's length covered before each end of the segment.
+    """
+    for connection_id in graph.edges:
+        shape = connection_points(graph, connection_id)
+        lengths = [0.0]
+        for (lat1, lng1), (lat2, lng2) in zip(shape, shape[1:]):
+            lengths.append(lengths[-1] + haversine_km(lat1, lng1, lat2, lng2))
+        total = lengths[-1]
+        last = len(shape) - 1
+        for i in range(last):
+            if total:
+                fractions = (lengths[i] / total, lengths[i + 1] / total)
+            else:
+                fractions = (i / last, (i + 1) / last)
+            yield shape[i], shape[i + 1], (connection_id,) + fractions
+
+
+def road_index(graph):
+    """R-tree over the segments of every road connection in ``graph`` (see :func:`road_segments`)."""
+    index = graph.artifacts.get('road_index')
+    if index is None:
+        if not memory.may_build(graph, 'road_index'):
+            return SegmentScan(graph)
+        index = SegmentTree(list(road_segments(graph)))
+        graph.artifacts['road_index'] = index
+        memory.enforce(graph)
+    return index
+
+
+def snap_to_road(graph, lat: float, lng: float) -> Optional[Dict]:
+    """
+    The point on the road network nearest to ``(lat, lng)``.
+
+    Returns the road connection, the snapped point, its distance from the
+    query point and ``fraction``, the share of the connection's length
+    between its start city and the snapped point; None when there are no
+    roads.
+    """
+    found = road_index(graph).nearest(lat, lng)
+    if found is None:
+        return None
+    distance, (connection_id, start_fraction, end_fraction), fraction, point_lat, point_lng = found
+    from_id, to_id = graph.edges[connection_id][:2]
+    return {
+        'connection_id': connection_id,
+        'from_city_id': from_id,
+        'to_city_id': to_id,
+        'latitude': point_lat,
+        'longitude': point_lng,
+        'distance_km': distance,
+        'fraction': start_fraction + fraction * (end_fraction - start_fraction),
+    }
@@ -0,0 +1,482 @@
+"""
+Tests of the routing graph, its spatial indexes, DIMACS files and traces,
+and of the standalone ``api.py`` server.
+
+Run with ``python manage.py test api geo``.
+"""
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from cities.models import City, GraphChange, PrecomputedRoute, RoadConnection
+from geo.polyline import encode
+from geo.snapshot import GraphSnapshot
+from . import dijkstra
+from .dijkstra import DijkstraGraph
+from .dimacs import DimacsError, read_coordinates, read_header, read_snapshot, write_coordinates, write_graph
+from .precomputed import lookup_route, missing_cities
+from .search import collect_trace
+from .signals import invalidate_routing_graph
+from .spatial import SegmentTree, closest_segment, tangent_projection
+
+
+def create_network():
+    """Five cities joined by five roads, one of them one-way; returns both keyed by name."""
+    cities = {}
+    for index, name in enumerate(('Lagos', 'Ibadan', 'Abuja', 'Kano', 'Jos')):
+        cities[name] = City.objects.create(
+            name=name, state=name, latitude=Decimal(6 + index), longitude=Decimal(3 + index),
+        )
+    roads = {}
+    for from_name, to_name, distance, bidirectional in (
+        ('Lagos', 'Ibadan', '128.00', True),
+        ('Ibadan', 'Abuja', '540.50', True),
+        ('Abuja', 'Kano', '350.00', False),
+        ('Abuja', 'Jos', '180.25', True),
+        ('Jos', 'Kano', '240.00', True),
+    ):
+        roads[from_name, to_name] = RoadConnection.objects.create(
+            from_city=cities[from_name], to_city=cities[to_name],
+            distance_km=Decimal(distance), is_bidirectional=bidirectional,
+        )
+    return cities, roads
+
+
+def reset_graph():
+    # Forget the process-wide graph, as in a freshly started process
+    dijkstra._shared_graph = dijkstra._stale_graph = None
+
+
+def adjacency(graph: DijkstraGraph):
+    # Adjacency lists are compared as sets of arcs: a delta sync appends
+    # changed roads, where a rebuild reads them in table order
+    return {city_id: sorted(neighbours) for city_id, neighbours in graph.graph.items()}
+
+
+class GraphRefreshTests(TestCase):
+    """``DijkstraGraph.refreshed()`` must give the graph a full rebuild would."""
+
+    def setUp(self):
+        self.cities, self.roads = create_network()
+        self.graph = DijkstraGraph()
+
+    def assertSameGraph(self, graph, rebuilt):
+        self.assertEqual(adjacency(graph), adjacency(rebuilt))
+        self.assertEqual(graph.cities, rebuilt.cities)
+        self.assertEqual(graph.name_index, rebuilt.name_index)
+        self.assertEqual(graph.edges, rebuilt.edges)
+        self.assertEqual(graph.geometries, rebuilt.geometries)
+        self.assertEqual(graph.connection_count, rebuilt.connection_count)
+        self.assertEqual(graph.version, rebuilt.version)
+
+    def assertRefreshMatchesRebuild(self):
+        before = adjacency(self.graph)
+        refreshed = self.graph.refreshed()
+        self.assertIsNot(refreshed, self.graph)
+        self.assertSameGraph(refreshed, DijkstraGraph())
+        # The old graph is left as it was for searches still running on it
+        self.assertEqual(adjacency(self.graph), before)
+        return refreshed
+
+    def test_unchanged_graph_is_returned_as_is(self):
+        self.assertIs(self.graph.refreshed(), self.graph)
+
+    def test_save(self):
+        road = self.roads['Ibadan', 'Abuja']
+        road.distance_km = Decimal('499.75')
+        road.is_bidirectional = False
+        road.geometry = encode([(7.0, 4.0), (7.5, 4.5), (8.0, 5.0)])
+        road.save()
+        city = self.cities['Jos']
+        city.name = 'Jos North'
+        city.population = 900000
+        city.save()
+        refreshed = self.assertRefreshMatchesRebuild()
+        self.assertIsNone(refreshed.find_city('Jos'))
+        self.assertEqual(refreshed.find_city('jos north')['id'], city.id)
+
+    def test_swapped_names(self):
+        lagos, ibadan = self.cities['Lagos'], self.cities['Ibadan']
+        lagos.name = 'Swap'
+        lagos.save()
+        ibadan.name = 'Lagos'
+        ibadan.save()
+        lagos.name = 'Ibadan'
+        lagos.save()
+        self.assertRefreshMatchesRebuild()
+
+    def test_delete(self):
+        self.roads['Abuja', 'Jos'].delete()
+        self.assertRefreshMatchesRebuild()
+
+    def test_insert(self):
+        city = City.objects.create(name='Enugu', state='Enugu', latitude=Decimal('6.45'), longitude=Decimal('7.5'))
+        RoadConnection.objects.create(from_city=city, to_city=self.cities['Abuja'], distance_km=Decimal('400'))
+        RoadConnection.objects.create(from_city=self.cities['Lagos'], to_city=city, distance_km=Decimal('560'),
+                                      is_bidirectional=False)
+        refreshed = self.assertRefreshMatchesRebuild()
+        self.assertEqual(refreshed.dijkstra(self.cities['Lagos'].id, city.id)[0], 560.0)
+
+    def test_cascade(self):
+        # Deleting a city deletes its roads with it
+        self.cities['Abuja'].delete()
+        refreshed = self.assertRefreshMatchesRebuild()
+        self.assertNotIn(self.cities['Abuja'].pk, refreshed.graph)
+
+    def test_successive_refreshes(self):
+        self.roads['Lagos', 'Ibadan'].delete()
+        graph = self.graph.refreshed()
+        City.objects.create(name='Kaduna', state='Kaduna', latitude=Decimal('10.5'), longitude=Decimal('7.4'))
+        self.cities['Kano'].delete()
+        self.graph = graph
+        self.assertRefreshMatchesRebuild()
+
+
+@override_settings(GRAPH_CHANGE_CHECK_SECONDS=5)
+class ChangeLogTests(TransactionTestCase):
+    """Changes committed by other processes, seen through the change log."""
+
+    def setUp(self):
+        self.cities, self.roads = create_network()
+        reset_graph()
+        self.addCleanup(reset_graph)
+
+    def test_change_from_another_process_is_picked_up(self):
+        graph = dijkstra.get_graph()
+        self.assertIs(dijkstra.get_graph(), graph)
+        # Another process saves a road: it is logged, but this process's graph isn't invalidated
+        post_save.disconnect(invalidate_routing_graph, sender=RoadConnection)
+        try:
+            road = self.roads['Lagos', 'Ibadan']
+            road.distance_km = Decimal('100.00')
+            road.save()
+        finally:
+            post_save.connect(invalidate_routing_graph, sender=RoadConnection)
+        self.assertIs(dijkstra.get_graph(), graph)
+
+        later = dijkstra.time.monotonic() + 6
+        with mock.patch.object(dijkstra.time, 'monotonic', return_value=later):
+            refreshed = dijkstra.get_graph()
+        self.assertIsNot(refreshed, graph)
+        self.assertNotEqual(refreshed.version, graph.version)
+        self.assertEqual(adjacency(refreshed), adjacency(DijkstraGraph()))
+        self.assertIn((self.cities['Ibadan'].id, 100.0), adjacency(refreshed)[self.cities['Lagos'].id])
+
+    def test_prune_keeps_newest_entries(self):
+        GraphChange.objects.bulk_create(GraphChange(kind='import') for _ in range(10))
+        newest = list(GraphChange.objects.order_by('-seq').values_list('seq', flat=True)[:3])
+        call_command('prune_graph_changes', keep=3, stdout=StringIO())
+        self.assertEqual(sorted(GraphChange.objects.values_list('seq', flat=True)), sorted(newest))
+        with self.assertRaises(CommandError):
+            call_command('prune_graph_changes', keep=0, stdout=StringIO())
+
+
+class RouteHttpCacheTests(TestCase):
+    """Conditional GETs of ``calculate-route``."""
+
+    url = '/api/calculate-route/'
+
+    def setUp(self):
+        self.cities, _ = create_network()
+        reset_graph()
+        self.addCleanup(reset_graph)
+
+    def test_successful_route_is_revalidated(self):
+        response = self.client.get(self.url, {'from_city': 'Lagos', 'to_city': 'Kano'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get(self.url, {'from_city': 'lagos ', 'to_city': 'Kano'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_trace_is_never_revalidated(self):
+        response = self.client.get(self.url, {'from_city': 'Lagos', 'to_city': 'Kano', 'trace': 1},
+                                   HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_invalid_query_is_rejected_before_revalidation(self):
+        response = self.client.get(self.url, {'from_city': '', 'zoom': 'abc'}, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_route_is_not_cacheable(self):
+        # Kano has no road out: Abuja -> Kano is one-way and Jos -> Kano is the only other
+        RoadConnection.objects.filter(from_city=self.cities['Jos'], to_city=self.cities['Kano']).delete()
+        reset_graph()
+        response = self.client.get(self.url, {'from_city': 'Kano', 'to_city': 'Lagos'})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Cache-Control', response)
+
+
+@override_settings(PRECOMPUTED_ROUTES='always')
+class PrecomputedRouteTests(TestCase):
+    """Routes answered from the table filled by ``precompute_routes``."""
+
+    url = '/api/calculate-route/'
+
+    def setUp(self):
+        self.cities, self.roads = create_network()
+        call_command('precompute_routes', processes=0, stdout=StringIO())
+        reset_graph()
+        self.addCleanup(reset_graph)
+
+    def test_get_needs_no_graph(self):
+        query = {'from_city': 'Lagos', 'to_city': 'Kano'}
+        response = self.client.get(self.url, query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_distance'], 1018.5)
+        response = self.client.get(self.url, query, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIsNone(dijkstra.current_graph())
+        # The engine tags the same answer alike
+        with override_settings(PRECOMPUTED_ROUTES=''):
+            engine_response = self.client.get(self.url, query)
+        self.assertEqual(engine_response['ETag'], response['ETag'])
+
+    def test_table_matches_engine(self):
+        self.assertEqual(PrecomputedRoute.objects.count(), 5 * 4)
+        for from_name in self.cities:
+            for to_name in self.cities:
+                expected = dijkstra.calculate_shortest_route(from_name, to_name)
+                result = lookup_route(from_name.lower(), to_name)
+                self.assertEqual(result['success'], expected['success'], (from_name, to_name))
+                if expected['success']:
+                    self.assertEqual(result['total_distance'], expected['total_distance'])
+                    self.assertEqual(result['path'], expected['path'])
+
+    def test_logged_change_retires_table(self):
+        self.assertIsNotNone(lookup_route('Lagos', 'Kano'))
+        road = self.roads['Abuja', 'Kano']
+        road.distance_km = Decimal('900.00')
+        road.save()
+        self.assertIsNone(lookup_route('Lagos', 'Kano'))
+        # Unknown cities and a city to itself need no row
+        self.assertFalse(lookup_route('Lagos', 'Atlantis')['success'])
+        self.assertEqual(lookup_route('Jos', 'jos')['total_distance'], 0)
+
+    def test_missing_cities_without_graph(self):
+        self.assertEqual(missing_cities([' lagos', 'Atlantis', 'KANO', '']), ['Atlantis', ''])
+        response = self.client.get(self.url, {'from_city': 'Lagos', 'to_city': 'Atlantis'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to_city', response.json()['details'])
+        self.assertIsNone(dijkstra.current_graph())
+
+
+class SegmentTreeTests(SimpleTestCase):
+    """The road R-tree must find the same segment as a scan of every segment."""
+
+    def test_nearest(self):
+        rng = random.Random(3)
+        segments = []
+        for key in range(1500):
+            lat, lng = rng.uniform(4, 14), rng.uniform(3, 15)
+            segments.append(((lat, lng), (lat + rng.uniform(-0.3, 0.3), lng + rng.uniform(-0.3, 0.3)), key))
+        # Degenerate segments are single points
+        segments += [((9.0, 9.0), (9.0, 9.0), 'point')]
+        for capacity in (2, 16):
+            tree = SegmentTree(list(segments), capacity=capacity)
+            for _ in range(300):
+                lat, lng = rng.uniform(3, 15), rng.uniform(2, 16)
+                expected = closest_segment(tangent_projection(lat, lng), segments)
+                found = tree.nearest(lat, lng)
+                self.assertAlmostEqual(found[0], expected[0], places=9)
+                self.assertEqual(found[1], expected[1])
+                self.assertEqual(found[2:], expected[2:])
+
+    def test_empty(self):
+        self.assertIsNone(SegmentTree([]).nearest(0.0, 0.0))
+
+
+class DimacsTests(SimpleTestCase):
+    """Graphs and coordinates written as DIMACS files must read back unchanged."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_graph_round_trip(self):
+        rng = random.Random(5)
+        node_count = 50
+        arcs = [(rng.randint(1, node_count), rng.randint(1, node_count), round(rng.uniform(0.1, 90), 3))
+                for _ in range(300)]
+        with open(self.path('g.gr'), 'w') as handle:
+            write_graph(handle, node_count, arcs, len(arcs), comment='test')
+        self.assertEqual(read_header(self.path('g.gr')), (node_count, len(arcs)))
+
+        snapshot = read_snapshot(self.path('g.gr'), version='test')
+        expected = {node: [] for node in range(1, node_count + 1)}
+        for tail, head, km in arcs:
+            expected[tail].append((head, km))
+        expected = GraphSnapshot.from_adjacency(expected)
+        self.assertEqual(list(snapshot.node_ids), list(expected.node_ids))
+        self.assertEqual(list(snapshot.offsets), list(expected.offsets))
+        self.assertEqual(list(snapshot.targets), list(expected.targets))
+        for weight, expected_weight in zip(snapshot.weights, expected.weights):
+            self.assertAlmostEqual(weight, expected_weight, places=9)
+
+    def test_coordinates_round_trip(self):
+        coordinates = [(1, 6.524379, 3.379206), (2, -33.868820, 151.209296), (3, 0.0, -179.999999)]
+        with open(self.path('g.co'), 'w') as handle:
+            write_coordinates(handle, coordinates, len(coordinates))
+        for (node, lat, lng), (expected_node, expected_lat, expected_lng) in zip(
+                read_coordinates(self.path('g.co')), coordinates):
+            self.assertEqual(node, expected_node)
+            self.assertAlmostEqual(lat, expected_lat, places=6)
+            self.assertAlmostEqual(lng, expected_lng, places=6)
+
+    def test_malformed_files(self):
+        with open(self.path('count.gr'), 'w') as handle:
+            handle.write('p sp 2 2\na 1 2 10\n')
+        with self.assertRaises(DimacsError):
+            read_snapshot(self.path('count.gr'))
+        with open(self.path('range.gr'), 'w') as handle:
+            handle.write('p sp 2 1\na 1 3 10\n')
+        with self.assertRaises(DimacsError):
+            read_snapshot(self.path('range.gr'))
+        with open(self.path('header.gr'), 'w') as handle:
+            handle.write('a 1 2 10\n')
+        with self.assertRaises(DimacsError):
+            read_header(self.path('header.gr'))
+
+
+class TraceTests(SimpleTestCase):
+    """Traced searches must end where untraced ones do."""
+
+    def setUp(self):
+        rng = random.Random(9)
+        self.graph = DijkstraGraph(load=False)
+        self.graph.graph = {city_id: [] for city_id in range(1, 201)}
+        for _ in range(600):
+            from_id, to_id = rng.randint(1, 200), rng.randint(1, 200)
+            self.graph.graph[from_id].append((to_id, round(rng.uniform(1, 100), 2)))
+
+    def test_matches_dijkstra(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            source, target = rng.randint(1, 200), rng.randint(1, 200)
+            distance, path = self.graph.dijkstra(source, target)
+            events, truncated, traced_distance, traced_path = collect_trace(self.graph.trace(source, target), 10 ** 6)
+            self.assertFalse(truncated)
+            self.assertEqual(events[-1]['event'], 'done')
+            self.assertAlmostEqual(traced_distance, distance, places=5)
+            if distance != float('inf'):
+                self.assertAlmostEqual(sum(
+                    min(weight for neighbour, weight in self.graph.graph[a] if neighbour == b)
+                    for a, b in zip(traced_path, traced_path[1:])
+                ), distance, places=5)
+            else:
+                self.assertEqual(traced_path, [])
+
+    def test_truncated(self):
+        full = collect_trace(self.graph.trace(1, 2), 10 ** 6)
+        events, truncated, distance, path = collect_trace(self.graph.trace(1, 2), 3)
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[:3], full[0][:3])
+        self.assertEqual(events[-1], full[0][-1])
+        self.assertEqual(truncated, len(full[0]) > 4)
+        self.assertEqual((distance, path), full[2:])
+
+
+def load_standalone_api():
+    # The top-level api.py shares its name with this package, so it is loaded from its path
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api.py')
+    spec = importlib.util.spec_from_file_location('standalone_api', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_response(reply):
+    """Read one response from a socket file: ``(status, headers, body)``."""
+    status = int(reply.readline().split()[1])
+    headers = http.client.parse_headers(reply)
+    return status, headers, reply.read(int(headers['Content-Length']))
+
+
+class StandaloneServerTests(SimpleTestCase):
+    """Keep-alive, request bodies and the thread cap of the ``api.py`` server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.api = load_standalone_api()
+
+    def serve(self, **options):
+        server = self.api.make_server(port=0, **options)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_address[:2]
+
+    def connect(self, address):
+        connection = socket.create_connection(address, timeout=5)
+        self.addCleanup(connection.close)
+        return connection, connection.makefile('rb')
+
+    def test_keep_alive_reuses_connection(self):
+        connection = http.client.HTTPConnection(*self.serve(), timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('POST', '/calculate-route', json.dumps({'from_city': 'Kano', 'to_city': 'Abuja'}))
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertTrue(json.loads(response.read())['success'])
+        sock = connection.sock
+        connection.request('GET', '/cities')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+        self.assertIs(connection.sock, sock)
+
+    def test_pipelined_requests(self):
+        connection, reply = self.connect(self.serve())
+        # The bodies look like requests; they must be consumed, not served
+        smuggled = b'GET /evil HTTP/1.1\r\nX: y\r\n\r\n'
+        connection.sendall(
+            b'POST /nowhere HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n%s' % (len(smuggled), smuggled)
+            + b'OPTIONS /cities HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n%s' % (len(smuggled), smuggled)
+            + b'GET /cities HTTP/1.1\r\nHost: x\r\n\r\n'
+        )
+        self.assertEqual([read_response(reply)[0] for _ in range(3)], [404, 200, 200])
+
+    def test_unreadable_body_closes_connection(self):
+        address = self.serve()
+        for content_length, expected_status in (('abc', 400), (str(self.api.MAX_BODY_BYTES + 1), 413)):
+            connection, reply = self.connect(address)
+            connection.sendall(b'POST /calculate-route HTTP/1.1\r\nHost: x\r\nContent-Length: %s\r\n\r\n'
+                               b'GET /cities HTTP/1.1\r\n\r\n' % content_length.encode())
+            status, headers, body = read_response(reply)
+            self.assertEqual(status, expected_status)
+            self.assertFalse(json.loads(body)['success'])
+            self.assertEqual(headers['Connection'], 'close')
+            self.assertEqual(reply.read(), b'')
+
+    def test_thread_cap(self):
+        address = self.serve(max_threads=1)
+        # An open keep-alive connection holds the only thread
+        first, first_reply = self.connect(address)
+        first.sendall(b'GET /cities HTTP/1.1\r\nHost: x\r\n\r\n')
+        self.assertEqual(read_response(first_reply)[0], 200)
+        second, second_reply = self.connect(address)
+        second.sendall(b'GET /cities HTTP/1.1\r\nHost: x\r\n\r\n')
+        second.settimeout(0.5)
+        with self.assertRaises(socket.timeout):
+            second.recv(1)
+        second.settimeout(5)
+        first_reply.close()
+        first.close()
+        self.assertEqual(read_response(second_reply)[0], 200)
@@ -0,0 +1,147 @@
+"""
+Per-request timing of the route pipeline.
+
+A request being timed carries a :class:`RequestTiming` in a context
+variable. Code along the pipeline wraps its stages in :func:`span` and
+reports counts with :func:`note`; outside a timed request both return
+immediately, so the instrumentation costs one context variable lookup when
+it is switched off.
+
+Timed responses get a ``Server-Timing`` header, which browser dev tools
+show per request, and one structured log line on the ``api.timing``
+logger. Timing starts switched on or off with the ``SERVER_TIMING`` setting
+and can be toggled at runtime with :func:`set_enabled`.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from .querycount import QueryCounter, count_queries
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Server-Timing'
+
+_enabled = settings.SERVER_TIMING
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Switch request timing on or off for this process."""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class RequestTiming:
+    """Stage durations, counts and database queries recorded for one request."""
+
+    __slots__ = ('spans', 'notes', 'started', 'queries', 'queries_before', 'query_seconds_before')
+
+    def __init__(self, queries: QueryCounter):
+        self.spans: List[Tuple[str, float]] = []
+        self.notes: Dict[str, object] = {}
+        self.started = time.perf_counter()
+        self.queries = queries
+        self.queries_before = queries.count
+        self.query_seconds_before = queries.seconds
+
+    def header(self) -> str:
+        """The ``Server-Timing`` header value for the request so far."""
+        total = time.perf_counter() - self.started
+        query_count = self.queries.count - self.queries_before
+        query_seconds = self.queries.seconds - self.query_seconds_before
+        metrics = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.spans]
+        metrics.append(f'db;dur={query_seconds * 1000:.3f};desc="{query_count} queries"')
+        metrics.extend(f'{name};desc="{value}"' for name, value in self.notes.items())
+        metrics.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(metrics)
+
+    def record(self) -> Dict:
+        """The request's timings as a dictionary of milliseconds and counts."""
+        stages = {}
+        for name, seconds in self.spans:
+            stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 3)
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'stages_ms': stages,
+            'db_queries': self.queries.count - self.queries_before,
+            'db_ms': round((self.queries.seconds - self.query_seconds_before) * 1000, 3),
+            **self.notes,
+        }
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar('request_timing', default=None)
+
+
+class _Span:
+    __slots__ = ('timing', 'name', 'started')
+
+    def __init__(self, timing: RequestTiming, name: str):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timing.spans.append((self.name, time.perf_counter() - self.started))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Time a stage of the current request: ``with span('search'): ...``."""
+    timing = _current.get()
+    return _NO_SPAN if timing is None else _Span(timing, name)
+
+
+def note(name: str, value):
+    """Attach a count or label (``settled``, ``cache``) to the current request."""
+    timing = _current.get()
+    if timing is not None:
+        timing.notes[name] = value
+
+
+@contextmanager
+def time_request(method: str, path: str) -> Iterator[RequestTiming]:
+    """Time everything in the block as one request and log it when it ends."""
+    with count_queries() as queries:
+        timing = RequestTiming(queries)
+        token = _current.set(timing)
+        try:
+            yield timing
+        finally:
+            _current.reset(token)
+            logger.info(json.dumps({'method': method, 'path': path, **timing.record()}, default=str))
+
+
+class ServerTimingMiddleware:
+    """Add a ``Server-Timing`` header to Django responses while timing is enabled."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _enabled:
+            return self.get_response(request)
+        with time_request(request.method, request.path) as timing:
+            response = self.get_response(request)
+            response[HEADER] = timing.header()
+        return response
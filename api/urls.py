@@ -12,10 +12,24 @@ urlpatterns = [
     path('cities/', views.city_list, name='city_list'),
     path('cities/<int:city_id>/', views.city_detail, name='city_detail'),
     path('cities/search/', views.search_cities, name='search_cities'),
+    path('cities/nearest/', views.nearest_city_list, name='nearest_cities'),
+    path('cities/within/', views.cities_in_bounds, name='cities_within'),
     
     # Road connections
     path('connections/', views.road_connections, name='road_connections'),
     
     # Route calculation (main endpoint)
     path('calculate-route/', views.calculate_route, name='calculate_route'),
+    path('calculate-route/from-coordinates/', views.calculate_route_from_coordinates_view,
+         name='calculate_route_from_coordinates'),
+    path('calculate-routes/', views.calculate_route_batch, name='calculate_route_batch'),
+    path('route-matrix/', views.route_matrix, name='route_matrix'),
+    
+    # Prometheus metrics
+    path('metrics/', views.metrics, name='metrics'),
+    
+    # Diagnostics (staff only)
+    path('debug/server-timing/', views.server_timing, name='server_timing'),
+    path('debug/profile/', views.profile, name='profile'),
+    path('debug/memory/', views.memory, name='memory'),
 ]
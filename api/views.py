@@ -1,16 +1,37 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from cities.models import City, RoadConnection
 from .serializers import (
     CitySerializer, 
-    RoadConnectionSerializer, 
     RouteCalculationSerializer,
+    RouteBatchSerializer,
+    ProfileRequestSerializer,
+    RouteMatrixSerializer,
+    NearestCitiesSerializer,
+    BoundingBoxSerializer,
+    CoordinateRouteSerializer,
     RouteResultSerializer
 )
-from .dijkstra import calculate_shortest_route
+from .dijkstra import (
+    calculate_routes,
+    calculate_route_matrix,
+    calculate_route_from_coordinates,
+    calculate_shortest_route,
+    get_graph,
+)
+from .http_cache import cache_headers, canonical_route_query, is_not_modified, route_validators
+from .precomputed import lookup_versioned_route, wanted as precomputed_wanted
+from .rendering import render_precomputed, render_route
+from .spatial import cities_within, nearest_cities
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, exposition
+from .memory import breakdown as memory_breakdown, start_tracing, stop_tracing
+from .profiling import ProfilerBusy, profile_routes
+from .timing import is_enabled as server_timing_enabled, set_enabled as set_server_timing, span
+from .listings import full_listing, keyset_page, parse_page_params, stream_listing, wants_stream
 import logging
 
 logger = logging.getLogger(__name__)
@@ -45,14 +66,14 @@ def root_view(request):
 
 @api_view(['GET'])
 def city_list(request):
-    """Get list of all cities."""
-    cities = City.objects.all()
-    serializer = CitySerializer(cities, many=True)
-    return Response({
-        'success': True,
-        'cities': serializer.data,
-        'count': cities.count()
-    })
+    """
+    Get list of all cities.
+    
+    Pass ``after_id`` and/or ``limit`` to page through cities in ID order; the
+    response then includes ``next_after_id`` for the following page. Pass
+    ``stream=1`` to stream the listing row by row.
+    """
+    return listing_response(request, 'cities', 'total_cities')
 
 
 @api_view(['GET'])
@@ -92,19 +113,95 @@ def search_cities(request):
     })
 
 
+@api_view(['GET'])
+def nearest_city_list(request):
+    """Get the cities nearest to a coordinate (?lat=..&lng=..&k=..)."""
+    serializer = NearestCitiesSerializer(data=request.GET)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    cities = nearest_cities(get_graph(), data['lat'], data['lng'], data['k'])
+    return Response({
+        'success': True,
+        'cities': cities,
+        'count': len(cities)
+    })
+
+
+@api_view(['GET'])
+def cities_in_bounds(request):
+    """Get the cities inside a bounding box (?min_lat=..&min_lng=..&max_lat=..&max_lng=..)."""
+    serializer = BoundingBoxSerializer(data=request.GET)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    cities = cities_within(get_graph(), data['min_lat'], data['min_lng'], data['max_lat'], data['max_lng'])
+    return Response({
+        'success': True,
+        'cities': cities,
+        'count': len(cities)
+    })
+
+
 @api_view(['GET'])
 def road_connections(request):
-    """Get all road connections."""
-    connections = RoadConnection.objects.select_related('from_city', 'to_city').all()
-    serializer = RoadConnectionSerializer(connections, many=True)
+    """
+    Get all road connections.
+    
+    Supports the same ``after_id``, ``limit`` and ``stream`` parameters as
+    the city list.
+    """
+    return listing_response(request, 'connections', 'total_road_connections')
+
+
+def listing_response(request, kind, count_key):
+    """Build a full, paginated or streamed listing of cities or connections."""
+    try:
+        after_id, limit = parse_page_params(request.GET)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Counts come from the cached graph rather than a COUNT(*) per request
+    count = get_graph().stats()[count_key]
+    
+    if wants_stream(request.GET):
+        return StreamingHttpResponse(
+            stream_listing(kind, count, after_id or 0, limit),
+            content_type='application/json'
+        )
+    
+    if after_id is None:
+        return Response({
+            'success': True,
+            kind: full_listing(kind),
+            'count': count
+        })
+    
+    rows, next_after_id = keyset_page(kind, after_id, limit)
     return Response({
         'success': True,
-        'connections': serializer.data,
-        'count': connections.count()
+        kind: rows,
+        'count': count,
+        'next_after_id': next_after_id
     })
 
 
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 def calculate_route(request):
     """
     Calculate shortest route between two cities using Dijkstra's algorithm.
@@ -114,27 +211,59 @@ def calculate_route(request):
         "from_city": "Lagos",
         "to_city": "Abuja"
     }
+    
+    Set "geometry": true to include the route shape as an encoded polyline,
+    or "zoom": <map zoom level> for a shape simplified for that zoom. Set
+    "trace": true to include the search statistics and events under "trace".
+    
+    The same query can be sent as GET /api/calculate-route/?from_city=Lagos&to_city=Abuja.
+    Successful GET responses carry ETag and Cache-Control headers, and
+    conditional requests are answered with 304 before any routing work.
     """
-    serializer = RouteCalculationSerializer(data=request.data)
+    with span('validate'):
+        serializer = RouteCalculationSerializer(data=request.GET if request.method == 'GET' else request.data)
+        valid = serializer.is_valid()
     
-    if not serializer.is_valid():
+    if not valid:
         return Response({
             'success': False,
             'error': 'Invalid input data',
             'details': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    from_city = serializer.validated_data['from_city']
-    to_city = serializer.validated_data['to_city']
+    data = serializer.validated_data
+    
+    if data['trace']:
+        # Traces include timings, so they are neither cached nor revalidated
+        result = calculate_shortest_route(data['from_city'], data['to_city'], data['geometry'],
+                                          data.get('zoom'), trace=True)
+        return Response(result, status=status.HTTP_200_OK if result['success'] else status.HTTP_404_NOT_FOUND)
     
     try:
-        # Calculate route using Dijkstra's algorithm
-        result = calculate_shortest_route(from_city, to_city)
+        # A table answer needs no graph, not even for its ETag
+        answer = None
+        if precomputed_wanted(data['geometry'], data.get('zoom')):
+            answer = lookup_versioned_route(data['from_city'], data['to_city'])
+        
+        validators = None
+        if request.method == 'GET':
+            graph_version = answer[1] if answer is not None else get_graph().version
+            if graph_version is not None:
+                validators = route_validators(graph_version, canonical_route_query(request.GET))
+                if is_not_modified(request.headers.get('If-None-Match'), validators):
+                    return with_headers(HttpResponse(status=status.HTTP_304_NOT_MODIFIED),
+                                        cache_headers(validators))
         
-        if result['success']:
-            return Response(result, status=status.HTTP_200_OK)
+        if answer is not None:
+            response_status, body = render_precomputed(answer[0])
         else:
-            return Response(result, status=status.HTTP_404_NOT_FOUND)
+            # Calculate route using Dijkstra's algorithm
+            response_status, body = render_route(data['from_city'], data['to_city'],
+                                                 data['geometry'], data.get('zoom'), precomputed=False)
+        response = HttpResponse(body, status=response_status, content_type='application/json')
+        if validators is not None and response_status == status.HTTP_200_OK:
+            with_headers(response, cache_headers(validators))
+        return response
             
     except Exception as e:
         logger.error(f"Error calculating route: {str(e)}")
@@ -147,6 +276,100 @@ def calculate_route(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET', 'POST'])
+def calculate_route_from_coordinates_view(request):
+    """
+    Calculate the route between two coordinates, snapped onto the nearest roads.
+    
+    Expected JSON payload (or the same fields as query parameters for GET):
+    {
+        "from_lat": 6.45, "from_lng": 3.39,
+        "to_lat": 12.0, "to_lng": 8.52
+    }
+    """
+    serializer = CoordinateRouteSerializer(data=request.GET if request.method == 'GET' else request.data)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    result = calculate_route_from_coordinates(data['from_lat'], data['from_lng'], data['to_lat'], data['to_lng'])
+    
+    if result['success']:
+        return Response(result, status=status.HTTP_200_OK)
+    return Response(result, status=status.HTTP_404_NOT_FOUND)
+
+
+def with_headers(response, headers):
+    """Set several headers on a response and return it."""
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@api_view(['POST'])
+def calculate_route_batch(request):
+    """
+    Calculate several routes in one request.
+    
+    Expected JSON payload:
+    {
+        "routes": [
+            {"from_city": "Lagos", "to_city": "Abuja"},
+            {"from_city": "Lagos", "to_city": "Kano"}
+        ]
+    }
+    """
+    serializer = RouteBatchSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    queries = [(route['from_city'], route['to_city']) for route in serializer.validated_data['routes']]
+    results = calculate_routes(queries)
+    
+    return Response({
+        'success': True,
+        'results': results,
+        'count': len(results)
+    })
+
+
+@api_view(['POST'])
+def route_matrix(request):
+    """
+    Calculate distances between every source and target city.
+    
+    Expected JSON payload:
+    {
+        "sources": ["Lagos", "Abuja"],
+        "targets": ["Kano", "Enugu"]
+    }
+    """
+    serializer = RouteMatrixSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    result = calculate_route_matrix(serializer.validated_data['sources'], serializer.validated_data['targets'])
+    
+    if result['success']:
+        return Response(result, status=status.HTTP_200_OK)
+    return Response(result, status=status.HTTP_404_NOT_FOUND)
+
+
 @api_view(['GET'])
 def route_info(request):
     """Get information about available routes and cities."""
@@ -175,4 +398,95 @@ def health_check(request):
         'status': 'healthy',
         'service': 'Nigerian City Distance Calculator API',
         'version': '1.0.0'
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def server_timing(request):
+    """
+    Show or switch Server-Timing instrumentation (staff only).
+    
+    POST {"enabled": true} to start timing requests. The switch applies to
+    the process that serves the request.
+    """
+    if request.method == 'POST':
+        enabled = request.data.get('enabled')
+        if not isinstance(enabled, bool):
+            return Response({
+                'success': False,
+                'error': '"enabled" must be true or false'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        set_server_timing(enabled)
+    return Response({'success': True, 'enabled': server_timing_enabled()})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def profile(request):
+    """
+    Profile route queries in this process against its live graph (staff only).
+    
+    Expected JSON payload, for one route or a batch:
+    {
+        "from_city": "Lagos", "to_city": "Kano",
+        "routes": [{"from_city": "Lagos", "to_city": "Kano"}],
+        "batch": false, "repeat": 1, "time_limit": 5,
+        "sort": "cumulative", "limit": 30, "format": "json"
+    }
+    
+    Returns the hot functions and the sampled call stacks in the collapsed
+    format read by flamegraph tools, or only the stacks as plain text with
+    "format": "collapsed". One profile runs at a time per process (409 while
+    busy), for at most PROFILE_MAX_SECONDS.
+    """
+    serializer = ProfileRequestSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'error': 'Invalid input data',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    try:
+        result = profile_routes(data['queries'], batch=data['batch'], repeat=data['repeat'],
+                                time_limit=data['time_limit'], sort=data['sort'], limit=data['limit'])
+    except ProfilerBusy as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    
+    logger.info("Profiled %d route queries in %.1f ms (timed out: %s)",
+                result['completed'], result['elapsed_ms'], result['timed_out'])
+    if data['format'] == 'collapsed':
+        return HttpResponse(result['collapsed'], content_type='text/plain; charset=utf-8')
+    return Response({'success': True, **result})
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def memory(request):
+    """
+    Memory breakdown of this process (staff only).
+    
+    Returns the estimated size of the graph, each derived index and each
+    cache, what was dropped to stay within MEMORY_BUDGET_MB, and the largest
+    allocation sites while tracemalloc is on. POST {"tracemalloc": true} to
+    start tracing allocations in the process that serves the request.
+    """
+    if request.method == 'POST':
+        tracing = request.data.get('tracemalloc')
+        if not isinstance(tracing, bool):
+            return Response({
+                'success': False,
+                'error': '"tracemalloc" must be true or false'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if tracing:
+            start_tracing()
+        else:
+            stop_tracing()
+    return Response({'success': True, **memory_breakdown(get_graph())})
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, in the text exposition format."""
+    return HttpResponse(exposition(), content_type=METRICS_CONTENT_TYPE)
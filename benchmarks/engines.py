@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+"""
+Routing engine benchmark suite.
+
+Runs every registered engine over the same fixed query set on graphs of
+increasing size: synthetic networks, the current database, graph snapshot
+files and DIMACS ``.gr`` files. For each engine and graph it records the
+preprocessing time, peak memory, query latency percentiles and the nodes
+settled per query (when the engine reports them), and checks every distance
+against the CSR snapshot search.
+
+Results are written as JSON. Passing an earlier result file with
+``--compare`` flags engines whose median or p99 latency, preprocessing time
+or peak memory grew by more than ``--threshold``, and exits with status 1
+if any did.
+
+Usage:
+    python -m benchmarks.engines --synthetic 1000,10000,100000 --output results.json
+    python -m benchmarks.engines --db --snapshot ny.snap --compare results.json
+
+The legacy engines scan every road for each settled city, so they only run
+on graphs up to ``--legacy-max-nodes`` nodes.
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'city_distance_calculator.settings')
+django.setup()
+
+import dijkstra_algorithm  # noqa: E402
+import dijkstra_general_pseudocode  # noqa: E402
+from api.dijkstra import DijkstraGraph  # noqa: E402
+from api.dimacs import read_snapshot  # noqa: E402
+from api.search import SearchStats  # noqa: E402
+from geo.snapshot import GraphSnapshot  # noqa: E402
+from benchmarks.stats import percentile  # noqa: E402
+from cities.synthetic import SyntheticNetwork  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Relative difference at which two engines' distances count as disagreeing
+DISTANCE_TOLERANCE = 1e-6
+
+# name -> (prepare, legacy); see register_engine
+ENGINES = {}
+
+
+class EngineUnsupported(Exception):
+    """Raised by an engine's prepare function for a graph it cannot answer correctly."""
+
+
+def register_engine(name, legacy=False):
+    """
+    Register an engine under ``name``.
+
+    The decorated function takes a GraphSnapshot and returns a query function
+    ``query(source, target) -> (distance, settled)`` over node indices, with
+    ``math.inf`` for unreachable targets and ``settled`` None when the engine
+    does not count them. Preprocessing happens in the decorated function, so
+    it is timed separately from the queries. It raises
+    :class:`EngineUnsupported` for graphs the engine cannot handle, which
+    skips it.
+    """
+    def decorator(prepare):
+        ENGINES[name] = (prepare, legacy)
+        return prepare
+    return decorator
+
+
+def arcs(snapshot):
+    """``(tail, head, weight)`` over node indices for every arc."""
+    offsets, targets, weights = snapshot.offsets, snapshot.targets, snapshot.weights
+    for tail in range(snapshot.node_count):
+        for edge in range(offsets[tail], offsets[tail + 1]):
+            yield tail, targets[edge], weights[edge]
+
+
+def shortest_arcs(snapshot):
+    """``{(tail, head): weight}`` keeping the lightest of parallel arcs."""
+    roads = {}
+    for tail, head, weight in arcs(snapshot):
+        if weight < roads.get((tail, head), math.inf):
+            roads[(tail, head)] = weight
+    return roads
+
+
+def is_symmetric(roads):
+    return all(roads.get((head, tail)) == weight for (tail, head), weight in roads.items())
+
+
+@register_engine('snapshot')
+def snapshot_engine(snapshot):
+    def query(source, target):
+        distances, _ = snapshot.shortest_paths(source, [target])
+        return distances.get(target, math.inf), None
+    return query
+
+
+@register_engine('graph')
+def graph_engine(snapshot):
+    graph = DijkstraGraph.from_snapshot(snapshot)
+    node_ids = snapshot.node_ids
+
+    def query(source, target):
+        stats = SearchStats()
+        distance, _ = graph.dijkstra(node_ids[source], node_ids[target], stats)
+        return distance, stats.settled
+    return query
+
+
+def load_api_server():
+    # api.py shares its name with the api package, so load it by path
+    spec = importlib.util.spec_from_file_location('api_server', ROOT / 'api.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@register_engine('api_py', legacy=True)
+def api_py_engine(snapshot):
+    dijkstra = load_api_server().dijkstra_algorithm
+    roads = shortest_arcs(snapshot)
+    cities = dict.fromkeys(range(snapshot.node_count))
+
+    def query(source, target):
+        distance, _ = dijkstra(cities, roads, source, target)
+        return (math.inf if distance is None else distance), None
+    return query
+
+
+@register_engine('dijkstra_algorithm', legacy=True)
+def dijkstra_algorithm_engine(snapshot):
+    roads = shortest_arcs(snapshot)
+    if not is_symmetric(roads):
+        raise EngineUnsupported('treats every road as bidirectional')
+    # Cities are keyed by name, so nodes are named after their index
+    cities = {str(index): None for index in range(snapshot.node_count)}
+    roads = {(str(tail), str(head)): weight for (tail, head), weight in roads.items()}
+
+    def query(source, target):
+        distance, _ = dijkstra_algorithm.dijkstra_algorithm(cities, roads, str(source), str(target))
+        return (math.inf if distance is None else distance), None
+    return query
+
+
+@register_engine('pseudocode', legacy=True)
+def pseudocode_engine(snapshot):
+    roads = shortest_arcs(snapshot)
+    if not is_symmetric(roads):
+        raise EngineUnsupported('treats every road as bidirectional')
+    edges = [[tail, head, weight] for (tail, head), weight in roads.items() if tail < head]
+    node_count = snapshot.node_count
+
+    def query(source, target):
+        distance, _ = dijkstra_general_pseudocode.dijkstra_with_path(node_count, edges, source, target)
+        return (math.inf if distance == -1 else distance), None
+    return query
+
+
+def query_set(snapshot, count, seed):
+    """A fixed list of ``(source, target)`` node index pairs for a graph."""
+    rng = random.Random(f'{seed}:{snapshot.node_count}:{snapshot.edge_count}')
+    n = snapshot.node_count
+    return [(rng.randrange(n), rng.randrange(n)) for _ in range(count)]
+
+
+def load_graphs(args):
+    """Yield ``(label, snapshot)`` for every graph named on the command line."""
+    for size in args.synthetic:
+        network = SyntheticNetwork(size, seed=args.seed, oneway_fraction=args.oneway)
+        yield f'synthetic-{size}', network.to_snapshot()
+    if args.db:
+        graph = DijkstraGraph()
+        yield 'database', graph.snapshot()
+    for path in args.snapshot:
+        yield Path(path).name, GraphSnapshot.load(path)
+    for path in args.dimacs:
+        yield Path(path).name, read_snapshot(path, version=Path(path).name)
+
+
+def run_engine(name, snapshot, queries, reference):
+    """Benchmark one engine on one graph; ``reference`` holds expected distances."""
+    prepare, _ = ENGINES[name]
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        query = prepare(snapshot)
+    except EngineUnsupported as e:
+        tracemalloc.stop()
+        return {'engine': name, 'skipped': str(e)}
+    preprocess_seconds = time.perf_counter() - started
+    # Peak memory covers preprocessing and a few queries, so search state is included
+    for source, target in queries[:10]:
+        query(source, target)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    settled = []
+    mismatches = 0
+    for index, (source, target) in enumerate(queries):
+        started = time.perf_counter()
+        distance, settled_count = query(source, target)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if settled_count is not None:
+            settled.append(settled_count)
+        expected = reference[index] if reference is not None else distance
+        if not (distance == expected or abs(distance - expected) <= DISTANCE_TOLERANCE * max(1.0, expected)):
+            mismatches += 1
+
+    return {
+        'engine': name,
+        'queries': len(queries),
+        'preprocess_seconds': round(preprocess_seconds, 6),
+        'peak_memory_mb': round(peak / 2 ** 20, 3),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 4),
+            'p50': round(percentile(latencies, 50), 4),
+            'p90': round(percentile(latencies, 90), 4),
+            'p99': round(percentile(latencies, 99), 4),
+            'max': round(max(latencies), 4),
+        },
+        'settled_nodes': {
+            'mean': round(statistics.mean(settled), 1),
+            'p50': percentile(settled, 50),
+            'max': max(settled),
+        } if settled else None,
+        'mismatches': mismatches,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Regressions of ``results`` against ``baseline`` beyond ``threshold`` (0.2 = 20%)."""
+    previous = {
+        (run['graph'], run['engine']): run for run in baseline['results'] if 'skipped' not in run
+    }
+    regressions = []
+    for run in results:
+        before = previous.get((run['graph'], run['engine']))
+        if before is None or 'skipped' in run:
+            continue
+        metrics = [
+            ('p50 ms', run['latency_ms']['p50'], before['latency_ms']['p50']),
+            ('p99 ms', run['latency_ms']['p99'], before['latency_ms']['p99']),
+            ('preprocess s', run['preprocess_seconds'], before['preprocess_seconds']),
+            ('peak MB', run['peak_memory_mb'], before['peak_memory_mb']),
+        ]
+        for metric, now, then in metrics:
+            if then > 0 and now > then * (1 + threshold):
+                regressions.append(f"{run['graph']} / {run['engine']}: {metric} {then:g} -> {now:g} "
+                                   f"(+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def report(graph, snapshot, runs):
+    print(f"\n{graph}: {snapshot.node_count:,} nodes, {snapshot.edge_count:,} arcs")
+    for run in runs:
+        if 'skipped' in run:
+            print(f"   {run['engine']:<20} skipped: {run['skipped']}")
+            continue
+        latency = run['latency_ms']
+        settled = run['settled_nodes']['mean'] if run['settled_nodes'] else 'n/a'
+        flag = f"  {run['mismatches']} WRONG" if run['mismatches'] else ''
+        print(f"   {run['engine']:<20} prep={run['preprocess_seconds']:8.3f}s mem={run['peak_memory_mb']:8.1f}MB "
+              f"p50={latency['p50']:9.3f}ms p99={latency['p99']:9.3f}ms settled={settled}{flag}")
+
+
+def sizes(text):
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark routing engines on fixed query sets')
+    parser.add_argument('--synthetic', type=sizes, default=[1000, 10000],
+                        help='Comma-separated node counts of synthetic graphs ("" for none)')
+    parser.add_argument('--oneway', type=float, default=0.0, help='One-way fraction of synthetic graphs')
+    parser.add_argument('--db', action='store_true', help='Also benchmark the current database graph')
+    parser.add_argument('--snapshot', action='append', default=[], help='Graph snapshot file (repeatable)')
+    parser.add_argument('--dimacs', action='append', default=[], help='DIMACS .gr file (repeatable)')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='Comma-separated engines to run')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per graph')
+    parser.add_argument('--legacy-max-nodes', type=int, default=2000,
+                        help='Largest graph the legacy engines are run on')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    engines = [name.strip() for name in args.engines.split(',') if name.strip()]
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)} (available: {', '.join(ENGINES)})")
+
+    results = []
+    for graph, snapshot in load_graphs(args):
+        queries = query_set(snapshot, args.queries, args.seed)
+        reference_query = snapshot_engine(snapshot)
+        reference = [reference_query(source, target)[0] for source, target in queries]
+        runs = []
+        for name in engines:
+            if ENGINES[name][1] and snapshot.node_count > args.legacy_max_nodes:
+                run = {'engine': name, 'skipped': f'more than {args.legacy_max_nodes} nodes'}
+            else:
+                run = run_engine(name, snapshot, queries, reference)
+            runs.append(run)
+        report(graph, snapshot, runs)
+        fingerprint = hashlib.blake2b(repr(queries).encode(), digest_size=8).hexdigest()
+        for run in runs:
+            results.append({'graph': graph, 'nodes': snapshot.node_count, 'arcs': snapshot.edge_count,
+                            'query_set': fingerprint, **run})
+
+    document = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'seed': args.seed,
+            'queries': args.queries,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(document, handle, indent=2)
+        print(f"\nWrote {args.output}")
+
+    failed = any(run.get('mismatches') for run in results)
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+        if regressions:
+            print(f"\nRegressions over {args.threshold:.0%} against {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            failed = True
+        else:
+            print(f"\nNo regressions over {args.threshold:.0%} against {args.compare}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
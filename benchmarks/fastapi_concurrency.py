@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Concurrency benchmark for the FastAPI app.
+
+Drives the ASGI app in-process with many concurrent clients issuing a mix of
+route calculations and health checks, once with blocking work run inline on
+the event loop (the old behaviour) and once with it dispatched to the routing
+thread pool. A stalled event loop shows up as a high p99 on the cheap
+endpoints, since every request queues behind the slowest route search.
+
+Usage:
+    python -m benchmarks.fastapi_concurrency --clients 64 --requests 2000
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+from benchmarks.stats import percentile
+from fastapi_app import app, get_graph, set_blocking_pool_size
+
+
+async def run_load(clients, total_requests, route_share, seed):
+    """Fire ``total_requests`` requests from ``clients`` concurrent tasks."""
+    rng = random.Random(seed)
+    names = [city['name'] for city in get_graph().cities.values()]
+    plan = []
+    for _ in range(total_requests):
+        if rng.random() < route_share:
+            plan.append(('route', {'from_city': rng.choice(names), 'to_city': rng.choice(names)}))
+        else:
+            plan.append(('health', None))
+    
+    latencies = {'route': [], 'health': []}
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def worker():
+            while not queue.empty():
+                kind, body = queue.get_nowait()
+                started = time.perf_counter()
+                if kind == 'route':
+                    response = await client.post('/calculate-route', json=body)
+                else:
+                    response = await client.get('/health')
+                response.raise_for_status()
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    
+    return latencies, elapsed
+
+
+def report(label, latencies, elapsed):
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"\n{label}: {total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    for kind, samples in latencies.items():
+        if not samples:
+            continue
+        print(f"   {kind:<7} n={len(samples):<6} mean={statistics.mean(samples):7.2f}ms "
+              f"p50={percentile(samples, 50):7.2f}ms p99={percentile(samples, 99):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--clients', type=int, default=64, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='Total requests per run')
+    parser.add_argument('--route-share', type=float, default=0.5, help='Fraction of requests that are routes')
+    parser.add_argument('--threads', type=int, default=4, help='Routing pool size for the offloaded run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    # Build the graph up front so both runs measure steady-state requests
+    get_graph()
+    
+    for label, threads in (('inline (before)', 0), (f'thread pool x{args.threads} (after)', args.threads)):
+        set_blocking_pool_size(threads)
+        latencies, elapsed = asyncio.run(run_load(args.clients, args.requests, args.route_share, args.seed))
+        report(label, latencies, elapsed)
+
+
+if __name__ == '__main__':
+    main()
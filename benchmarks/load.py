@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+"""
+HTTP load generator for the three servers.
+
+Drives the Django API, the FastAPI app or the api.py handler with a fixed
+number of concurrent clients issuing a weighted mix of requests. The Django
+and FastAPI apps run in-process over ASGI, api.py is started on a local
+port, and ``--url`` points the load at any running server instead.
+
+Route pairs are drawn from a Zipf distribution over the target's cities
+(``--zipf 0`` for uniform), from a weighted pair file or from a recorded
+query log, so hot pairs can be made as hot as real traffic. For every kind
+of request the run reports throughput, p50/p95/p99/p99.9 latency, error
+rates and database queries per request (from the ``X-DB-Queries`` header,
+enabled with ``DB_QUERY_COUNT_HEADER``).
+
+Usage:
+    python -m benchmarks.load --target fastapi --concurrency 64 --requests 5000 --output fastapi.json
+    python -m benchmarks.load --target django --mix route:0.8,cities:0.2 --pairs pairs.csv
+    python -m benchmarks.load --url http://127.0.0.1:8000 --target django --log queries.jsonl
+    python -m benchmarks.load --compare fastapi.json django.json
+
+Pair files are CSV or JSON lines with ``from_city``, ``to_city`` and an
+optional ``weight``; log files are query logs written with ``QUERY_LOG_PATH``
+(or JSON lines with ``from_city`` and ``to_city``), whose route pairs are
+replayed in order. ``manage.py replay_queries`` replays every kind of
+logged query with its original pacing.
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import httpx
+
+from benchmarks.stats import percentile
+
+DB_QUERIES_HEADER = 'X-DB-Queries'
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+def route_body(pair):
+    return {'from_city': pair[0], 'to_city': pair[1]}
+
+
+def matrix_body(pairs):
+    return {'sources': [pair[0] for pair in pairs], 'targets': [pair[1] for pair in pairs]}
+
+
+# Endpoints per target: kind -> (method, path or path builder, body builder, pairs per request)
+TARGETS = {
+    'django': {
+        'cities_path': '/api/cities/',
+        'route': ('POST', lambda pair: '/api/calculate-route/', route_body, 1),
+        'route_get': ('GET', lambda pair: '/api/calculate-route/?' + urlencode(route_body(pair)), None, 1),
+        'matrix': ('POST', lambda pairs: '/api/route-matrix/', matrix_body, 4),
+        'cities': ('GET', lambda _: '/api/cities/?limit=100', None, 0),
+        'health': ('GET', lambda _: '/api/health/', None, 0),
+    },
+    'fastapi': {
+        'cities_path': '/cities',
+        'route': ('POST', lambda pair: '/calculate-route', route_body, 1),
+        'route_get': ('GET', lambda pair: '/calculate-route?' + urlencode(route_body(pair)), None, 1),
+        'matrix': ('POST', lambda pairs: '/route-matrix', matrix_body, 4),
+        'cities': ('GET', lambda _: '/cities', None, 0),
+        'health': ('GET', lambda _: '/health', None, 0),
+    },
+    'api-py': {
+        'cities_path': '/cities',
+        'route': ('POST', lambda pair: '/calculate-route', route_body, 1),
+        'route_get': ('GET', lambda pair: '/calculate?' + urlencode({'from': pair[0], 'to': pair[1]}), None, 1),
+        'cities': ('GET', lambda _: '/cities', None, 0),
+    },
+}
+
+
+def parse_mix(text):
+    """Parse ``"route:0.8,cities:0.2"`` into ``{'route': 0.8, 'cities': 0.2}``."""
+    mix = {}
+    for item in text.split(','):
+        if item.strip():
+            kind, _, weight = item.partition(':')
+            mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def asgi_client(target):
+    """Client for the Django or FastAPI app running in this process."""
+    if target == 'fastapi':
+        from fastapi_app import app
+    else:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'city_distance_calculator.settings')
+        from django.core.asgi import get_asgi_application
+        app = get_asgi_application()
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://load')
+
+
+def start_api_server(threads):
+    """Serve api.py's handler on a free local port; returns its base URL."""
+    from benchmarks.engines import load_api_server
+    module = load_api_server()
+    # Per-request access logging would dominate the measurement
+    handler = type('quiet_handler', (module.keepalive_handler,), {'log_message': lambda self, *args: None})
+    server = module.BoundedThreadingHTTPServer(
+        ('127.0.0.1', 0), handler, max_threads=threads, queue_size=threads * 4
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def city_names(payload):
+    cities = payload if isinstance(payload, list) else payload.get('cities', [])
+    return [city['name'] for city in cities]
+
+
+def read_pairs(path):
+    """``([(from, to)], [weight])`` from a CSV or JSON lines file."""
+    pairs, weights = [], []
+    with open(path, newline='', encoding='utf-8') as handle:
+        if path.endswith('.csv'):
+            rows = csv.DictReader(handle)
+        else:
+            rows = (json.loads(line) for line in handle if line.strip())
+        for row in rows:
+            if 'kind' in row:
+                # Query log entry
+                if row['kind'] != 'route':
+                    continue
+                row = row.get('params') or {}
+            if row.get('from_city') and row.get('to_city'):
+                pairs.append((row['from_city'], row['to_city']))
+                weights.append(float(row.get('weight') or 1))
+    if not pairs:
+        raise SystemExit(f'{path}: no from_city/to_city pairs')
+    return pairs, weights
+
+
+def pair_source(args, names, rng):
+    """An endless iterator of ``(from_city, to_city)`` pairs."""
+    if args.log:
+        pairs, _ = read_pairs(args.log)
+        return itertools.cycle(pairs)
+    if args.pairs:
+        pairs, weights = read_pairs(args.pairs)
+        return (rng.choices(pairs, weights)[0] for _ in itertools.count())
+    # Zipf over a shuffled city order, so the hot cities are not the first by ID
+    ranked = list(names)
+    rng.shuffle(ranked)
+    weights = [1 / (rank ** args.zipf) for rank in range(1, len(ranked) + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    return ((rng.choices(ranked, cum_weights=cumulative)[0], rng.choices(ranked, cum_weights=cumulative)[0])
+            for _ in itertools.count())
+
+
+def build_plan(args, endpoints, names):
+    """The fixed list of ``(kind, method, path, body)`` requests for a run."""
+    rng = random.Random(args.seed)
+    mix = {kind: weight for kind, weight in parse_mix(args.mix).items() if weight > 0}
+    unknown = [kind for kind in mix if kind not in endpoints or kind == 'cities_path']
+    if unknown:
+        available = ', '.join(kind for kind in endpoints if kind != 'cities_path')
+        raise SystemExit(f"{args.target} has no {', '.join(unknown)} endpoint (available: {available})")
+    pairs = pair_source(args, names, rng)
+    kinds = list(mix)
+    plan = []
+    for _ in range(args.warmup + args.requests):
+        kind = rng.choices(kinds, [mix[k] for k in kinds])[0]
+        method, path, body, needed = endpoints[kind]
+        argument = None
+        if needed == 1:
+            argument = next(pairs)
+        elif needed > 1:
+            argument = [next(pairs) for _ in range(needed)]
+        plan.append((kind, method, path(argument), body(argument) if body else None))
+    return plan
+
+
+async def run_load(client, plan, concurrency):
+    """Issue ``plan`` from ``concurrency`` workers; returns samples and elapsed seconds."""
+    samples = []
+    position = iter(range(len(plan)))
+
+    async def worker():
+        for index in position:
+            kind, method, path, body = plan[index]
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                await response.aread()
+                status = response.status_code
+                queries = response.headers.get(DB_QUERIES_HEADER)
+                size = len(response.content)
+            except httpx.HTTPError as e:
+                status, queries, size = type(e).__name__, None, 0
+            samples.append((kind, (time.perf_counter() - started) * 1000, status,
+                            int(queries) if queries is not None else None, size))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    latencies = [sample[1] for sample in samples]
+    statuses = Counter(str(sample[2]) for sample in samples)
+    errors = sum(count for status, count in statuses.items() if not (status.isdigit() and int(status) < 400))
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3) if latencies else 0.0,
+            **{f'p{pct:g}': round(percentile(latencies, pct), 3) for pct in PERCENTILES},
+            'max': round(max(latencies), 3) if latencies else 0.0,
+        },
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'statuses': dict(statuses),
+        'db_queries': {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        } if queries else None,
+        'mean_bytes': round(statistics.mean(sample[4] for sample in samples)) if samples else 0,
+    }
+
+
+def report(document):
+    config = document['config']
+    overall = document['overall']
+    print(f"\n{config['label']}: {overall['requests']} requests at concurrency {config['concurrency']} "
+          f"in {document['elapsed_seconds']:.2f}s ({overall['throughput_rps']:.0f} req/s)")
+    for kind, summary in [('all', overall), *document['endpoints'].items()]:
+        latency = summary['latency_ms']
+        queries = summary['db_queries']['mean'] if summary['db_queries'] else 'n/a'
+        print(f"   {kind:<10} n={summary['requests']:<6} p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms "
+              f"p99={latency['p99']:8.2f}ms p99.9={latency['p99.9']:8.2f}ms "
+              f"errors={summary['error_rate']:.2%} queries={queries}")
+
+
+def compare(paths):
+    """Print several result files side by side."""
+    documents = []
+    for path in paths:
+        with open(path) as handle:
+            documents.append(json.load(handle))
+    width = max(14, *(len(document['config']['label']) for document in documents))
+    print(f"{'':<22}" + ''.join(f"{document['config']['label']:>{width + 2}}" for document in documents))
+    rows = [
+        ('throughput req/s', lambda summary: summary['throughput_rps']),
+        *((f'p{pct:g} ms', lambda summary, pct=pct: summary['latency_ms'][f'p{pct:g}']) for pct in PERCENTILES),
+        ('error rate', lambda summary: summary['error_rate']),
+        ('db queries/req', lambda summary: summary['db_queries']['mean'] if summary['db_queries'] else 'n/a'),
+    ]
+    kinds = ['all'] + sorted({kind for document in documents for kind in document['endpoints']})
+    for kind in kinds:
+        print(kind)
+        for label, value in rows:
+            cells = []
+            for document in documents:
+                summary = document['overall'] if kind == 'all' else document['endpoints'].get(kind)
+                cells.append(value(summary) if summary else '-')
+            print(f"   {label:<19}" + ''.join(f"{cell!s:>{width + 2}}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the Django, FastAPI or api.py server')
+    parser.add_argument('--target', choices=sorted(TARGETS), default='fastapi', help='Server whose API is driven')
+    parser.add_argument('--url', help='Base URL of a running server (default: run the target in-process)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='Measured requests')
+    parser.add_argument('--warmup', type=int, default=100, help='Requests issued before measuring')
+    parser.add_argument('--mix', default='route:0.7,route_get:0.2,cities:0.1',
+                        help='Weighted request kinds: route, route_get, matrix, cities, health')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Skew of the city popularity (0 = uniform)')
+    parser.add_argument('--pairs', help='CSV or JSON lines file of weighted from_city/to_city pairs')
+    parser.add_argument('--log', help='Recorded query log (JSON lines) replayed in order')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', help='Name of this configuration in the output')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS', help='Print result files side by side and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    endpoints = TARGETS[args.target]
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    elif args.target == 'api-py':
+        client = httpx.AsyncClient(base_url=start_api_server(args.concurrency), timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = asgi_client(args.target)
+
+    async def run():
+        async with client:
+            response = await client.get(endpoints['cities_path'])
+            response.raise_for_status()
+            names = city_names(response.json())
+            if not names:
+                raise SystemExit(f'{args.target} has no cities to route between')
+            plan = build_plan(args, endpoints, names)
+            if args.warmup:
+                await run_load(client, plan[:args.warmup], args.concurrency)
+            return await run_load(client, plan[args.warmup:], args.concurrency)
+
+    samples, elapsed = asyncio.run(run())
+    by_kind = {}
+    for sample in samples:
+        by_kind.setdefault(sample[0], []).append(sample)
+
+    document = {
+        'config': {
+            'label': args.label or (args.url or args.target),
+            'target': args.target,
+            'url': args.url,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'mix': parse_mix(args.mix),
+            'pairs': args.log or args.pairs or f'zipf {args.zipf:g}',
+            'seed': args.seed,
+        },
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'overall': summarize(samples, elapsed),
+        'endpoints': {kind: summarize(kind_samples, elapsed) for kind, kind_samples in sorted(by_kind.items())},
+    }
+    report(document)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(document, handle, indent=2)
+        print(f"\nWrote {args.output}")
+    sys.exit(1 if document['overall']['error_rate'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of response rendering per endpoint.
+
+For each endpoint, times the original serializer + JSONRenderer path
+against the fast path in api.rendering / api.listings on the current
+database. The legacy route timing covers only the city lookups and
+rendering that followed the search; the fast route timing includes its
+search, with the route cache cleared each time, so it is a conservative
+comparison.
+
+Usage:
+    python -m benchmarks.rendering --repeat 200
+"""
+import argparse
+import os
+import timeit
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'city_distance_calculator.settings')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import rendering  # noqa: E402
+from api.dijkstra import get_graph, route_city  # noqa: E402
+from api.listings import full_listing  # noqa: E402
+from api.serializers import CitySerializer, RoadConnectionSerializer  # noqa: E402
+from cities.models import City, RoadConnection  # noqa: E402
+
+
+def route_pair(graph):
+    """The pair with the longest path, so rendering has the most cities to encode."""
+    ids = list(graph.cities)
+    best = None
+    for from_id in ids:
+        for to_id in ids:
+            distance, path = graph.dijkstra(from_id, to_id)
+            if distance != float('inf') and (best is None or len(path) > len(best[2])):
+                best = (from_id, to_id, path, distance)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serializer and fast-path rendering per endpoint')
+    parser.add_argument('--repeat', type=int, default=200, help='Renders per measurement')
+    args = parser.parse_args()
+
+    renderer = JSONRenderer()
+    graph = get_graph()
+    from_id, to_id, path, distance = route_pair(graph)
+    from_name, to_name = graph.cities[from_id]['name'], graph.cities[to_id]['name']
+
+    def legacy_route():
+        # What calculate_route used to do after the search
+        details = {city.id: city for city in City.objects.filter(id__in=path)}
+        result = {
+            'success': True,
+            'total_distance': round(distance, 2),
+            'path': path,
+            'cities': [
+                {'id': i, 'name': details[i].name, 'state': details[i].state,
+                 'latitude': float(details[i].latitude), 'longitude': float(details[i].longitude)}
+                for i in path
+            ],
+            'from_city': route_city(graph.cities[from_id]),
+            'to_city': route_city(graph.cities[to_id]),
+        }
+        return renderer.render(result)
+
+    def fast_route():
+        rendering.route_cache.clear()
+        return rendering.render_route(from_name, to_name)[1]
+
+    cases = [
+        ('GET /api/cities/',
+         lambda: renderer.render(CitySerializer(City.objects.all(), many=True).data),
+         lambda: rendering.dumps(full_listing('cities'))),
+        ('GET /api/connections/',
+         lambda: renderer.render(RoadConnectionSerializer(
+             RoadConnection.objects.select_related('from_city', 'to_city').all(), many=True).data),
+         lambda: rendering.dumps(full_listing('connections'))),
+        ('POST /api/calculate-route/', legacy_route, fast_route),
+    ]
+
+    encoder = 'orjson' if rendering.orjson is not None else 'json (stdlib)'
+    print(f"Encoder: {encoder}; {len(graph.cities)} cities, {graph.connection_count} connections; "
+          f"route {from_name} -> {to_name} ({len(path)} cities)")
+    print(f"{'endpoint':<28} {'serializer':>12} {'fast path':>12} {'speedup':>8}")
+    for name, legacy, fast in cases:
+        legacy_ms = min(timeit.repeat(legacy, number=args.repeat, repeat=3)) / args.repeat * 1000
+        fast_ms = min(timeit.repeat(fast, number=args.repeat, repeat=3)) / args.repeat * 1000
+        print(f"{name:<28} {legacy_ms:10.3f}ms {fast_ms:10.3f}ms {legacy_ms / fast_ms:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cities'
+
+    def ready(self):
+        from . import changelog  # noqa: F401
@@ -0,0 +1,51 @@
+"""
+Change log of the road network, shared by every serving process.
+
+Saving or deleting a City or RoadConnection, and every bulk import, appends
+a :class:`~cities.models.GraphChange` in the same transaction. Processes
+read :func:`change_stamp` to tell whether their routing graph is behind the
+database. Writes that send no signals, such as ``QuerySet.update()``, are
+not logged.
+"""
+from typing import Tuple
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .importing import network_imported
+from .models import City, GraphChange, RoadConnection
+
+KINDS = {City: 'city', RoadConnection: 'road'}
+
+
+def change_stamp() -> Tuple[int, int]:
+    """
+    Newest sequence number and number of entries in the log.
+
+    Sequence numbers can be allocated in a different order than their
+    transactions commit, so a late commit below the newest number is told
+    apart by the count.
+    """
+    stamp = GraphChange.objects.aggregate(last=Max('seq'), count=Count('seq'))
+    return stamp['last'] or 0, stamp['count']
+
+
+def latest_change_seq() -> int:
+    """Newest sequence number in the log, read from the primary key index alone."""
+    return GraphChange.objects.aggregate(last=Max('seq'))['last'] or 0
+
+
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=RoadConnection)
+def log_save(sender, instance, **kwargs):
+    GraphChange.objects.create(kind=KINDS[sender], object_id=instance.pk)
+
+
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=RoadConnection)
+def log_delete(sender, instance, **kwargs):
+    GraphChange.objects.create(kind=KINDS[sender], object_id=instance.pk, deleted=True)
+
+
+@receiver(network_imported)
+def log_import(sender, **kwargs):
+    GraphChange.objects.create(kind='import')
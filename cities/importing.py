@@ -0,0 +1,340 @@
+"""
+Bulk import of cities and road connections.
+
+Records are streamed from CSV or GeoJSON files, validated in chunks and
+written with ``bulk_create``, so an import costs a handful of queries per
+chunk instead of several per row. Roads refer to cities by name; the name
+to ID mapping is loaded once after the cities have been written.
+
+``bulk_create`` does not send ``post_save``, so :data:`network_imported` is
+sent once an import has written its rows.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from django.dispatch import Signal
+from geo.distance import haversine_km
+from geo.polyline import decode, encode
+from .models import City, RoadConnection
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional dependency
+    ijson = None
+
+# Sent with ``cities`` and ``roads`` row counts after an import writes rows
+network_imported = Signal()
+
+ROAD_TYPES = {value for value, _ in RoadConnection._meta.get_field('road_type').choices}
+MAX_NAME_LENGTH = City._meta.get_field('name').max_length
+MAX_DISTANCE_KM = Decimal('999999.99')
+
+# Line-delimited GeoJSON: one feature per line, streamed without a parser dependency
+GEOJSON_SEQUENCE_SUFFIXES = ('.geojsonl', '.geojsonseq', '.geojsons', '.ndjson', '.jsonl')
+
+# Columns overwritten by an update import; updated_at marks the rows for graph syncs
+CITY_FIELDS = ['state', 'latitude', 'longitude', 'population', 'is_capital', 'updated_at']
+ROAD_FIELDS = ['distance_km', 'road_type', 'is_bidirectional', 'geometry', 'updated_at']
+
+_TRUE = {'1', 'true', 't', 'yes', 'y'}
+_FALSE = {'0', 'false', 'f', 'no', 'n'}
+
+
+def parse_bool(value, default: bool) -> bool:
+    """Read a boolean from a CSV cell or JSON value."""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f'invalid boolean "{value}"')
+
+
+def parse_coordinate(value, limit: int, label: str) -> Decimal:
+    """Read a latitude or longitude, rounded to the model's six decimal places."""
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f'invalid {label} "{value}"')
+    if not number.is_finite() or not -limit <= number <= limit:
+        raise ValueError(f'{label} {value} out of range')
+    return number.quantize(Decimal('0.000001'))
+
+
+def city_from_record(record: Dict) -> City:
+    """
+    Validate a city record and build an unsaved City.
+
+    Expects ``name``, ``state``, ``latitude``, ``longitude`` and optionally
+    ``population`` and ``is_capital``. Raises ValueError for invalid rows.
+    """
+    name = (record.get('name') or '').strip()
+    if not name:
+        raise ValueError('missing name')
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f'name longer than {MAX_NAME_LENGTH} characters')
+
+    population = record.get('population')
+    if population in (None, ''):
+        population = None
+    else:
+        try:
+            population = int(float(population))
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid population "{population}"')
+        if population < 0:
+            raise ValueError('negative population')
+
+    return City(
+        name=name,
+        state=(record.get('state') or '').strip(),
+        latitude=parse_coordinate(record.get('latitude'), 90, 'latitude'),
+        longitude=parse_coordinate(record.get('longitude'), 180, 'longitude'),
+        population=population,
+        is_capital=parse_bool(record.get('is_capital'), False),
+    )
+
+
+def road_from_record(record: Dict, cities: Dict[str, Tuple[int, float, float]]) -> RoadConnection:
+    """
+    Validate a road record and build an unsaved RoadConnection.
+
+    Expects ``from_city`` and ``to_city`` names, and optionally
+    ``distance_km``, ``road_type``, ``is_bidirectional`` and ``geometry`` (an
+    encoded polyline). A missing distance is taken as the great-circle
+    length of the road's shape. ``cities`` maps names to
+    ``(id, latitude, longitude)``. Raises ValueError for invalid rows.
+    """
+    ends = []
+    for field in ('from_city', 'to_city'):
+        name = (record.get(field) or '').strip()
+        if not name:
+            raise ValueError(f'missing {field}')
+        if name not in cities:
+            raise ValueError(f'unknown city "{name}"')
+        ends.append(cities[name])
+    (from_id, from_lat, from_lng), (to_id, to_lat, to_lng) = ends
+    if from_id == to_id:
+        raise ValueError('road starts and ends at the same city')
+
+    geometry = (record.get('geometry') or '').strip()
+    distance = record.get('distance_km')
+    if distance in (None, ''):
+        try:
+            points = decode(geometry) if geometry else [(from_lat, from_lng), (to_lat, to_lng)]
+        except (IndexError, ValueError):
+            raise ValueError('invalid geometry')
+        distance = sum(haversine_km(*a, *b) for a, b in zip(points, points[1:]))
+    try:
+        distance = Decimal(str(distance).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'invalid distance_km "{distance}"')
+    if not distance.is_finite() or not Decimal(0) <= distance <= MAX_DISTANCE_KM:
+        raise ValueError(f'distance_km {distance} out of range')
+
+    road_type = (record.get('road_type') or 'federal').strip().lower()
+    if road_type not in ROAD_TYPES:
+        raise ValueError(f'unknown road_type "{road_type}"')
+
+    return RoadConnection(
+        from_city_id=from_id,
+        to_city_id=to_id,
+        distance_km=distance,
+        road_type=road_type,
+        is_bidirectional=parse_bool(record.get('is_bidirectional'), True),
+        geometry=geometry,
+    )
+
+
+def read_csv(path: str) -> Iterator[Dict]:
+    """Stream the rows of a CSV file with a header line."""
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        yield from csv.DictReader(handle)
+
+
+def read_geojson_features(path: str) -> Iterator[Dict]:
+    """
+    Stream the features of a GeoJSON file.
+
+    Line-delimited files are read one feature per line. FeatureCollections
+    are streamed with ijson when it is installed and loaded whole otherwise.
+    """
+    if path.lower().endswith(GEOJSON_SEQUENCE_SUFFIXES):
+        with open(path, encoding='utf-8') as handle:
+            for line in handle:
+                # RFC 8142 sequences prefix each feature with a record separator
+                line = line.strip().lstrip('\x1e')
+                if line:
+                    yield json.loads(line)
+    elif ijson is not None:
+        with open(path, 'rb') as handle:
+            yield from ijson.items(handle, 'features.item', use_float=True)
+    else:
+        with open(path, encoding='utf-8') as handle:
+            yield from json.load(handle).get('features', [])
+
+
+def geojson_cities(features: Iterable[Dict]) -> Iterator[Dict]:
+    """City records from the Point features of a GeoJSON stream."""
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        coordinates = geometry.get('coordinates') or [None, None]
+        yield {
+            **(feature.get('properties') or {}),
+            'longitude': coordinates[0],
+            'latitude': coordinates[1],
+        }
+
+
+def geojson_roads(features: Iterable[Dict]) -> Iterator[Dict]:
+    """Road records from the LineString features of a GeoJSON stream."""
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'LineString':
+            continue
+        record = dict(feature.get('properties') or {})
+        coordinates = geometry.get('coordinates') or []
+        if len(coordinates) >= 2:
+            record['geometry'] = encode([(lat, lng) for lng, lat, *_ in coordinates])
+        yield record
+
+
+def chunked(records: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportStats:
+    """Row counts and timing for one kind of record."""
+
+    MAX_ERRORS = 20
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.rows = 0
+        self.written = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def reject(self, row_number: int, error: Exception):
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(f'{self.kind} row {row_number}: {error}')
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.seconds or time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+
+class NetworkImporter:
+    """
+    Write cities and roads in chunks with ``bulk_create``.
+
+    Existing rows are left untouched unless ``update`` is set, in which case
+    they are overwritten (an upsert on the natural key). Callers should wrap
+    an import in a transaction so it is all-or-nothing.
+    """
+
+    def __init__(self, batch_size: int = 5000, update: bool = False,
+                 progress: Optional[Callable[[ImportStats], None]] = None):
+        self.batch_size = batch_size
+        self.update = update
+        self.progress = progress
+
+    def _bulk_create(self, model, objects, unique_fields, update_fields):
+        if self.update:
+            model.objects.bulk_create(objects, batch_size=self.batch_size, update_conflicts=True,
+                                      unique_fields=unique_fields, update_fields=update_fields)
+        else:
+            model.objects.bulk_create(objects, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def import_cities(self, records: Iterable[Dict]) -> ImportStats:
+        """Validate and write city records; repeated names keep the first row."""
+        stats = ImportStats('cities')
+        seen = set()
+        for chunk in chunked(records, self.batch_size):
+            cities = []
+            for record in chunk:
+                stats.rows += 1
+                try:
+                    city = city_from_record(record)
+                except ValueError as error:
+                    stats.reject(stats.rows, error)
+                    continue
+                if city.name in seen:
+                    stats.duplicates += 1
+                    continue
+                seen.add(city.name)
+                cities.append(city)
+            self._bulk_create(City, cities, ['name'], CITY_FIELDS)
+            stats.written += len(cities)
+            self._report(stats)
+        stats.seconds = time.perf_counter() - stats.started
+        return stats
+
+    def import_roads(self, records: Iterable[Dict]) -> ImportStats:
+        """
+        Validate and write road records.
+
+        A road is a duplicate if another row already connects the same
+        cities in the same direction, or if every direction it covers is
+        already covered: a bidirectional road makes a later ``B -> A`` row
+        (or an existing bidirectional ``B -> A`` road) redundant.
+        """
+        stats = ImportStats('roads')
+        cities = {
+            name: (city_id, float(latitude), float(longitude))
+            for name, city_id, latitude, longitude
+            in City.objects.values_list('name', 'id', 'latitude', 'longitude').iterator()
+        }
+        # Directions already served by bidirectional roads in the database
+        covered = {
+            (to_id, from_id) for from_id, to_id
+            in RoadConnection.objects.filter(is_bidirectional=True).values_list('from_city_id', 'to_city_id')
+        }
+        pairs = set()
+
+        for chunk in chunked(records, self.batch_size):
+            roads = []
+            for record in chunk:
+                stats.rows += 1
+                try:
+                    road = road_from_record(record, cities)
+                except ValueError as error:
+                    stats.reject(stats.rows, error)
+                    continue
+                pair = (road.from_city_id, road.to_city_id)
+                directions = [pair, pair[::-1]] if road.is_bidirectional else [pair]
+                if pair in pairs or all(direction in covered for direction in directions):
+                    stats.duplicates += 1
+                    continue
+                pairs.add(pair)
+                covered.update(directions)
+                roads.append(road)
+            self._bulk_create(RoadConnection, roads, ['from_city', 'to_city'], ROAD_FIELDS)
+            stats.written += len(roads)
+            self._report(stats)
+        stats.seconds = time.perf_counter() - stats.started
+        return stats
+
+    def _report(self, stats: ImportStats):
+        if self.progress is not None:
+            self.progress(stats)
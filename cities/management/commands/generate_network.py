@@ -0,0 +1,82 @@
+import time
+from django.core.management.base import CommandError
+from cities.importing import NetworkImporter
+from cities.synthetic import (
+    DEFAULT_DEGREES,
+    DEFAULT_ROAD_TYPES,
+    NIGERIA_BBOX,
+    SyntheticNetwork,
+    parse_weights,
+)
+from .import_road_network import Command as ImportCommand
+
+
+def format_weights(weights):
+    return ','.join(f'{name}:{weight:g}' for name, weight in weights.items())
+
+
+class Command(ImportCommand):
+    help = 'Generate a reproducible synthetic road network into the database or a graph snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10_000, help='Number of cities to generate')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same network')
+        parser.add_argument('--bbox', default=','.join(str(value) for value in NIGERIA_BBOX),
+                            help='min_lat,min_lng,max_lat,max_lng (default: Nigeria)')
+        parser.add_argument('--degrees', default=format_weights(DEFAULT_DEGREES),
+                            help='Node degree distribution as degree:weight pairs')
+        parser.add_argument('--road-types', default=format_weights(DEFAULT_ROAD_TYPES),
+                            help='Road type mix as road_type:weight pairs')
+        parser.add_argument('--oneway', type=float, default=0.0,
+                            help='Fraction of roads outside the spanning tree that are one-way')
+        parser.add_argument('--snapshot', help='Write a graph snapshot file instead of the database')
+        parser.add_argument('--name-prefix', default='Synthetic', help='Cities are named "<prefix> <number>"')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows validated and written per chunk')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll back')
+
+    def handle(self, *args, **options):
+        try:
+            bbox = tuple(float(value) for value in options['bbox'].split(','))
+            if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+                raise ValueError('--bbox must be min_lat,min_lng,max_lat,max_lng')
+            started = time.perf_counter()
+            network = SyntheticNetwork(
+                options['nodes'],
+                seed=options['seed'],
+                bbox=bbox,
+                degrees=parse_weights(options['degrees'], key=int),
+                road_types=parse_weights(options['road_types']),
+                oneway_fraction=options['oneway'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Generated {network.node_count:,} cities and {network.road_count:,} roads "
+            f"({network.version}) in {time.perf_counter() - started:.1f}s"
+        )
+
+        if options['snapshot']:
+            snapshot = network.to_snapshot()
+            try:
+                snapshot.save(options['snapshot'])
+            except OSError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {snapshot.node_count:,} nodes and {snapshot.edge_count:,} arcs to {options['snapshot']}"
+            ))
+            return
+
+        prefix = options['name_prefix']
+
+        def cities():
+            for node, lat, lng in network.nodes():
+                yield {'name': f'{prefix} {node + 1}', 'state': '', 'latitude': round(lat, 6),
+                       'longitude': round(lng, 6)}
+
+        def roads():
+            for tail, head, km, road_type, bidirectional in network.roads():
+                yield {'from_city': f'{prefix} {tail + 1}', 'to_city': f'{prefix} {head + 1}',
+                       'distance_km': km, 'road_type': road_type, 'is_bidirectional': bidirectional}
+
+        importer = NetworkImporter(batch_size=options['batch_size'], progress=self.report_progress)
+        self.run_import([(importer.import_cities, cities), (importer.import_roads, roads)], options['dry_run'])
@@ -0,0 +1,79 @@
+import time
+from django.core.management.base import CommandError
+from api.dimacs import DimacsError, read_arcs, read_coordinates, read_header, read_snapshot
+from cities.importing import NetworkImporter
+from .import_road_network import Command as ImportCommand
+
+
+class Command(ImportCommand):
+    help = 'Import a DIMACS shortest-path challenge graph (.gr/.co) into the database or a graph snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('graph', help='DIMACS graph file (.gr)')
+        parser.add_argument('--coordinates', help='DIMACS coordinate file (.co); required for database imports')
+        parser.add_argument('--snapshot', help='Write a graph snapshot file instead of importing into the database')
+        parser.add_argument('--units-per-km', type=float, default=1000,
+                            help='Arc weight units per kilometre (default: metres)')
+        parser.add_argument('--name-prefix', default='DIMACS', help='Cities are named "<prefix> <node number>"')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows validated and written per chunk')
+        parser.add_argument('--update', action='store_true', help='Overwrite existing cities and roads')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll back')
+
+    def handle(self, *args, **options):
+        if options['units_per_km'] <= 0:
+            raise CommandError('--units-per-km must be positive')
+        try:
+            if options['snapshot']:
+                self.write_snapshot(options)
+            else:
+                self.import_network(options)
+        except DimacsError as e:
+            raise CommandError(str(e))
+
+    def write_snapshot(self, options):
+        """Load the arcs straight into CSR arrays, bypassing the ORM."""
+        started = time.perf_counter()
+        try:
+            snapshot = read_snapshot(options['graph'], options['units_per_km'], version=f"dimacs:{options['graph']}")
+            snapshot.save(options['snapshot'])
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {snapshot.node_count:,} nodes and {snapshot.edge_count:,} arcs to {options['snapshot']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def import_network(self, options):
+        """Import nodes as cities and arcs as one-way roads."""
+        if not options['coordinates']:
+            raise CommandError('--coordinates is required to import into the database (or give --snapshot)')
+        try:
+            node_count, arc_count = read_header(options['graph'])
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Importing {node_count:,} nodes and {arc_count:,} arcs")
+
+        prefix = options['name_prefix']
+        units_per_km = options['units_per_km']
+
+        def cities():
+            for node, lat, lng in read_coordinates(options['coordinates']):
+                yield {'name': f'{prefix} {node}', 'state': '', 'latitude': lat, 'longitude': lng}
+
+        def roads():
+            # DIMACS lists each direction as its own arc
+            for tail, head, weight in read_arcs(options['graph']):
+                yield {
+                    'from_city': f'{prefix} {tail}',
+                    'to_city': f'{prefix} {head}',
+                    'distance_km': weight / units_per_km,
+                    'road_type': 'local',
+                    'is_bidirectional': False,
+                }
+
+        importer = NetworkImporter(
+            batch_size=options['batch_size'],
+            update=options['update'],
+            progress=self.report_progress,
+        )
+        self.run_import([(importer.import_cities, cities), (importer.import_roads, roads)], options['dry_run'])
@@ -0,0 +1,58 @@
+import time
+from xml.etree.ElementTree import ParseError
+from django.core.management.base import CommandError
+from cities.importing import NetworkImporter
+from cities.osm import DEFAULT_PLACE_TYPES, OSMNetwork
+from .import_road_network import Command as ImportCommand
+
+
+class Command(ImportCommand):
+    help = 'Import the road network from an OpenStreetMap XML extract'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='OSM XML file (.osm)')
+        parser.add_argument('--places', default=','.join(DEFAULT_PLACE_TYPES),
+                            help='Comma-separated place=* values imported as named cities')
+        parser.add_argument('--snap-km', type=float, default=5.0,
+                            help='Join places off the road network to junctions within this distance')
+        parser.add_argument('--chunk-size', type=int, default=1_000_000,
+                            help='Node references sorted in memory at a time while scanning ways; '
+                                 'each sorted run is spilled to a temporary file')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows validated and written per chunk')
+        parser.add_argument('--update', action='store_true', help='Overwrite existing cities and roads')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll back')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--batch-size and --chunk-size must be positive')
+
+        network = OSMNetwork(
+            options['path'],
+            place_types=[place.strip() for place in options['places'].split(',') if place.strip()],
+            snap_km=options['snap_km'],
+            chunk_size=options['chunk_size'],
+        )
+        started = time.perf_counter()
+        try:
+            network.scan()
+        except (OSError, ParseError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Scanned {network.way_count:,} roads with {len(network.table):,} nodes and "
+            f"{len(network.places):,} places in {time.perf_counter() - started:.1f}s"
+        )
+        if network.unconnected_places:
+            self.stdout.write(self.style.WARNING(
+                f"{network.unconnected_places:,} places are farther than {options['snap_km']} km "
+                f"from any road and were skipped"
+            ))
+
+        importer = NetworkImporter(
+            batch_size=options['batch_size'],
+            update=options['update'],
+            progress=self.report_progress,
+        )
+        self.run_import([
+            (importer.import_cities, network.city_records),
+            (importer.import_roads, network.road_records),
+        ], options['dry_run'])
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cities.models import City, RoadConnection
+from cities.importing import (
+    NetworkImporter,
+    geojson_cities,
+    geojson_roads,
+    network_imported,
+    read_csv,
+    read_geojson_features,
+)
+
+
+class Command(BaseCommand):
+    help = 'Bulk import cities and road connections from CSV or GeoJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', help='CSV of cities: name,state,latitude,longitude[,population,is_capital]')
+        parser.add_argument('--roads', help='CSV of roads: from_city,to_city[,distance_km,road_type,'
+                                            'is_bidirectional,geometry]')
+        parser.add_argument('--geojson', help='GeoJSON FeatureCollection (or one feature per line) with '
+                                              'Point features for cities and LineString features for roads')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows validated and written per chunk')
+        parser.add_argument('--update', action='store_true', help='Overwrite existing cities and roads')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll back')
+
+    def handle(self, *args, **options):
+        if not (options['cities'] or options['roads'] or options['geojson']):
+            raise CommandError('Give --cities and/or --roads CSV files, or --geojson')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        importer = NetworkImporter(
+            batch_size=options['batch_size'],
+            update=options['update'],
+            progress=self.report_progress,
+        )
+        sources = []
+        if options['cities']:
+            sources.append((importer.import_cities, lambda: read_csv(options['cities'])))
+        if options['geojson']:
+            # Two passes, so roads can refer to cities defined later in the file
+            sources.append((importer.import_cities, lambda: geojson_cities(read_geojson_features(options['geojson']))))
+        if options['roads']:
+            sources.append((importer.import_roads, lambda: read_csv(options['roads'])))
+        if options['geojson']:
+            sources.append((importer.import_roads, lambda: geojson_roads(read_geojson_features(options['geojson']))))
+
+        self.run_import(sources, options['dry_run'])
+
+    def run_import(self, sources, dry_run: bool):
+        """
+        Run ``(import_method, records_factory)`` pairs in one transaction and report.
+        """
+        before = (City.objects.count(), RoadConnection.objects.count())
+        results = []
+        try:
+            with transaction.atomic():
+                for run, records in sources:
+                    results.append(run(records()))
+                written = {'cities': 0, 'roads': 0}
+                for stats in results:
+                    written[stats.kind] += stats.written
+                created = (City.objects.count() - before[0], RoadConnection.objects.count() - before[1])
+                if dry_run:
+                    transaction.set_rollback(True)
+                else:
+                    network_imported.send(sender=NetworkImporter, **written)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for stats in results:
+            for error in stats.errors:
+                self.stderr.write(self.style.WARNING(error))
+            self.stdout.write(
+                f"{stats.kind}: {stats.rows:,} rows, {stats.written:,} accepted, "
+                f"{stats.duplicates:,} duplicates, {stats.invalid:,} invalid "
+                f"in {stats.seconds:.1f}s ({stats.rows_per_second:,.0f} rows/s)"
+            )
+
+        self.stdout.write(f"Created {created[0]:,} cities and {created[1]:,} roads")
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Dry run: no changes were saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Import complete'))
+
+    def report_progress(self, stats):
+        self.stdout.write(f"  {stats.kind}: {stats.rows:,} rows ({stats.rows_per_second:,.0f} rows/s)")
@@ -0,0 +1,83 @@
+import math
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.dijkstra import DijkstraGraph
+from api.executor import RoutingExecutor
+from api.precomputed import encode_path
+from cities.changelog import latest_change_seq
+from cities.models import PrecomputedRoute
+
+
+class Command(BaseCommand):
+    help = ('Fill the precomputed route table with the shortest route between every ordered pair '
+            'of cities, searched in parallel (read with PRECOMPUTED_ROUTES)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes searching routes (0 searches in this process)')
+        parser.add_argument('--sources-per-round', type=int, default=256,
+                            help='Source cities searched before their rows are written')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--max-pairs', type=int, default=5_000_000,
+                            help='Refuse networks with more ordered pairs than this')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 0 or options['sources_per_round'] < 1:
+            raise CommandError('--processes must not be negative and --sources-per-round must be positive')
+
+        started = time.perf_counter()
+        graph = DijkstraGraph()
+        city_ids = sorted(graph.cities)
+        pairs = len(city_ids) * (len(city_ids) - 1)
+        if pairs > options['max_pairs']:
+            raise CommandError(f"{len(city_ids):,} cities make {pairs:,} ordered pairs, more than "
+                               f"--max-pairs {options['max_pairs']:,}")
+        self.stdout.write(f"Graph {graph.version}: {len(city_ids):,} cities, {pairs:,} pairs "
+                          f"(loaded in {graph.build_seconds:.2f}s)")
+
+        processes = options['processes'] if len(city_ids) > 1 else 0
+        executor = RoutingExecutor(graph, processes) if processes else None
+        change_seq = graph.change_stamp[0]
+        per_round = options['sources_per_round']
+        written = 0
+        try:
+            with transaction.atomic():
+                PrecomputedRoute.objects.all().delete()
+                for number in range(math.ceil(len(city_ids) / per_round)):
+                    sources = city_ids[number * per_round:(number + 1) * per_round]
+                    groups = [(source_id, [city_id for city_id in city_ids if city_id != source_id])
+                              for source_id in sources]
+                    if executor is not None:
+                        answers = executor.search(groups)
+                    else:
+                        answers = [graph.one_to_many(source_id, target_ids) for source_id, target_ids in groups]
+                    rows = [
+                        PrecomputedRoute(
+                            from_city_id=source_id,
+                            to_city_id=target_id,
+                            distance_km=distance if distance != float('inf') else None,
+                            path=encode_path(path) if distance != float('inf') else '',
+                            graph_version=graph.version,
+                            change_seq=change_seq,
+                        )
+                        for (source_id, target_ids), (distances, paths) in zip(groups, answers)
+                        for target_id, distance, path in zip(target_ids, distances, paths)
+                    ]
+                    PrecomputedRoute.objects.bulk_create(rows, batch_size=options['batch_size'])
+                    written += len(rows)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"   {written:,}/{pairs:,} routes ({written / elapsed:,.0f}/s)")
+        finally:
+            if executor is not None:
+                executor.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed {written:,} routes in {time.perf_counter() - started:.1f}s"
+        ))
+        if latest_change_seq() != change_seq:
+            self.stdout.write(self.style.WARNING(
+                'The road network changed while the table was filled; its rows will not be used until it is '
+                'filled again'
+            ))
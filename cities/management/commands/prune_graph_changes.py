@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from cities.models import GraphChange
+
+
+class Command(BaseCommand):
+    help = 'Delete all but the newest entries of the graph change log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=1000, help='Newest entries kept')
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+        kept = GraphChange.objects.order_by('-seq').values_list('seq', flat=True)[:options['keep']]
+        cutoff = min(kept, default=None)
+        if cutoff is None:
+            self.stdout.write('Nothing to prune')
+            return
+        deleted, _ = GraphChange.objects.filter(seq__lt=cutoff).delete()
+        self.stdout.write(f"Deleted {deleted:,} change log entries")
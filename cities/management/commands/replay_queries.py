@@ -0,0 +1,240 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+from django.core.management.base import BaseCommand, CommandError
+from api.dijkstra import (
+    calculate_route_from_coordinates,
+    calculate_route_matrix,
+    calculate_routes,
+    calculate_shortest_route,
+    get_graph,
+)
+from api.querylog import KINDS, is_flag, read_log
+from api.spatial import cities_within, nearest_cities
+from benchmarks.stats import percentile
+
+
+def search_text(params):
+    return str(params.get('q') or params.get('query') or '')
+
+
+def query_string(params, keys):
+    return urlencode({key: params[key] for key in keys if key in params})
+
+
+# kind -> (method, path builder) of each server, for replaying over HTTP
+HTTP_ENDPOINTS = {
+    'django': {
+        'route': ('POST', lambda params: '/api/calculate-route/'),
+        'coordinates': ('POST', lambda params: '/api/calculate-route/from-coordinates/'),
+        'batch': ('POST', lambda params: '/api/calculate-routes/'),
+        'matrix': ('POST', lambda params: '/api/route-matrix/'),
+        'search': ('GET', lambda params: '/api/cities/search/?' + urlencode({'q': search_text(params)})),
+        'nearest': ('GET', lambda params: '/api/cities/nearest/?' + query_string(params, ('lat', 'lng', 'k'))),
+        'within': ('GET', lambda params: '/api/cities/within/?' + query_string(
+            params, ('min_lat', 'min_lng', 'max_lat', 'max_lng'))),
+    },
+    'fastapi': {
+        'route': ('POST', lambda params: '/calculate-route'),
+        'coordinates': ('POST', lambda params: '/calculate-route/from-coordinates'),
+        'batch': ('POST', lambda params: '/calculate-routes'),
+        'matrix': ('POST', lambda params: '/route-matrix'),
+        'search': ('GET', lambda params: '/cities/search/' + quote(search_text(params), safe='')),
+        'nearest': ('GET', lambda params: '/cities/nearest?' + query_string(params, ('lat', 'lng', 'k'))),
+        'within': ('GET', lambda params: '/cities/within?' + query_string(
+            params, ('min_lat', 'min_lng', 'max_lat', 'max_lng'))),
+    },
+}
+
+
+def engine_query(kind, params):
+    """Answer a logged query with the routing functions in this process; returns whether it succeeded."""
+    if kind == 'route':
+        zoom = params.get('zoom')
+        return calculate_shortest_route(params['from_city'], params['to_city'], is_flag(params.get('geometry')),
+                                        int(zoom) if zoom not in (None, '') else None)['success']
+    if kind == 'coordinates':
+        return calculate_route_from_coordinates(
+            *(float(params[key]) for key in ('from_lat', 'from_lng', 'to_lat', 'to_lng')))['success']
+    if kind == 'batch':
+        results = calculate_routes([(route['from_city'], route['to_city']) for route in params['routes']])
+        return all(result['success'] for result in results)
+    if kind == 'matrix':
+        return calculate_route_matrix(params['sources'], params['targets'])['success']
+    graph = get_graph()
+    if kind == 'search':
+        needle = search_text(params).casefold()
+        if not needle:
+            return False
+        found = [city for city in graph.cities.values()
+                 if needle in city['name'].casefold() or needle in city['state'].casefold()]
+    elif kind == 'nearest':
+        found = nearest_cities(graph, float(params['lat']), float(params['lng']), int(params.get('k', 1)))
+    else:
+        found = cities_within(graph, *(float(params[key]) for key in ('min_lat', 'min_lng', 'max_lat', 'max_lng')))
+    return found is not None
+
+
+# Relative outliers must also be at least this slow, so sub-millisecond jitter is not flagged
+OUTLIER_MIN_MS = 1.0
+
+
+class Command(BaseCommand):
+    help = ('Replay a query log (QUERY_LOG_PATH) against the routing engine in this process '
+            'or a running server, and flag slow outliers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', help='Query log file (JSON lines)')
+        parser.add_argument('--url', help='Base URL of a running server (default: the engine in this process)')
+        parser.add_argument('--server', choices=sorted(HTTP_ENDPOINTS),
+                            help="API flavour of --url (default: each entry's own server)")
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Pacing relative to the original timestamps (2 = twice as fast, '
+                                 '0 = no pauses)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Queries in flight at once')
+        parser.add_argument('--kinds', default=','.join(KINDS), help='Comma-separated kinds of query to replay')
+        parser.add_argument('--limit', type=int, help='Replay at most this many entries')
+        parser.add_argument('--outlier-factor', type=float, default=5.0,
+                            help='Flag queries slower than this multiple of the median of their kind')
+        parser.add_argument('--slow-ms', type=float, help='Also flag queries slower than this many milliseconds')
+        parser.add_argument('--top', type=int, default=10, help='Outliers listed')
+        parser.add_argument('--output', help='Write every replayed entry with its timings to this JSON lines file')
+
+    def handle(self, *args, **options):
+        kinds = {kind.strip() for kind in options['kinds'].split(',') if kind.strip()}
+        unknown = kinds.difference(KINDS)
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+        if options['speed'] < 0 or options['concurrency'] < 1:
+            raise CommandError('--speed must not be negative and --concurrency must be positive')
+        try:
+            entries = [entry for entry in read_log(options['log']) if entry['kind'] in kinds]
+        except OSError as e:
+            raise CommandError(str(e))
+        entries = entries[:options['limit']] if options['limit'] else entries
+        if not entries:
+            raise CommandError(f"{options['log']}: no entries to replay")
+
+        if options['url']:
+            base_url = options['url'].rstrip('/')
+            query = lambda entry: self.http_query(base_url, options['server'] or entry['server'], entry)  # noqa: E731
+        else:
+            get_graph()
+            query = self.engine_query
+
+        results = self.replay(entries, query, options['speed'], options['concurrency'])
+        self.report(results, options)
+
+    def engine_query(self, entry):
+        try:
+            return ('ok' if engine_query(entry['kind'], entry['params']) else 'failed'), None
+        except (KeyError, TypeError, ValueError) as e:
+            return 'invalid', f'{type(e).__name__}: {e}'
+
+    def http_query(self, base_url, server, entry):
+        method, path = HTTP_ENDPOINTS[server][entry['kind']]
+        body = json.dumps(entry['params']).encode() if method == 'POST' else None
+        request = Request(base_url + path(entry['params']), data=body, method=method,
+                          headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=60) as response:
+                response.read()
+                return 'ok', response.status
+        except HTTPError as e:
+            return 'failed', e.code
+        except (URLError, OSError) as e:
+            return 'error', str(e)
+
+    def replay(self, entries, query, speed, concurrency):
+        """Issue the entries in order, paced by their timestamps; returns one result per entry."""
+        first_ts = entries[0].get('ts') or 0
+        started = time.perf_counter()
+
+        def replay_one(entry, due):
+            begun = time.perf_counter()
+            outcome, detail = query(entry)
+            return {
+                'entry': entry,
+                'outcome': outcome,
+                'detail': detail,
+                'latency_ms': (time.perf_counter() - begun) * 1000,
+                'lag_ms': max(0.0, (begun - started - due) * 1000),
+            }
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for entry in entries:
+                due = ((entry.get('ts') or first_ts) - first_ts) / speed if speed else 0.0
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(replay_one, entry, due))
+        self.elapsed = time.perf_counter() - started
+        return [future.result() for future in futures]
+
+    def report(self, results, options):
+        by_kind = {}
+        for result in results:
+            by_kind.setdefault(result['entry']['kind'], []).append(result)
+
+        self.stdout.write(f"Replayed {len(results):,} queries in {self.elapsed:.2f}s "
+                          f"({len(results) / self.elapsed:.0f}/s)")
+        outliers = []
+        for kind, kind_results in by_kind.items():
+            latencies = [result['latency_ms'] for result in kind_results]
+            median = statistics.median(latencies)
+            for result in kind_results:
+                result['outlier'] = (result['latency_ms'] > max(options['outlier_factor'] * median, OUTLIER_MIN_MS)
+                                     or (options['slow_ms'] is not None and result['latency_ms'] > options['slow_ms']))
+                if result['outlier']:
+                    outliers.append(result)
+            originals = [result['entry']['latency_ms'] for result in kind_results
+                         if isinstance(result['entry'].get('latency_ms'), (int, float))]
+            # Queries that succeeded when logged but not now, or the other way round
+            changed = sum(
+                1 for result in kind_results
+                if isinstance(result['entry'].get('status'), int)
+                and (result['entry']['status'] < 400) != (result['outcome'] == 'ok')
+            )
+            errors = sum(1 for result in kind_results if result['outcome'] in ('error', 'invalid'))
+            self.stdout.write(
+                f"   {kind:<12} n={len(kind_results):<6} p50={median:8.2f}ms p95={percentile(latencies, 95):8.2f}ms "
+                f"p99={percentile(latencies, 99):8.2f}ms max={max(latencies):8.2f}ms "
+                f"logged p50={statistics.median(originals) if originals else float('nan'):8.2f}ms "
+                f"errors={errors} changed={changed}"
+            )
+
+        lags = [result['lag_ms'] for result in results]
+        if options['speed'] and percentile(lags, 99) > 100:
+            self.stdout.write(self.style.WARNING(
+                f"Replay fell behind the requested pacing (p99 lag {percentile(lags, 99):.0f}ms); "
+                f"raise --concurrency or lower --speed"
+            ))
+
+        if outliers:
+            outliers.sort(key=lambda result: result['latency_ms'], reverse=True)
+            self.stdout.write(self.style.WARNING(f"{len(outliers)} slow outliers:"))
+            for result in outliers[:options['top']]:
+                entry = result['entry']
+                params = json.dumps(entry['params'], ensure_ascii=False)
+                self.stdout.write(f"   {result['latency_ms']:9.2f}ms (logged {entry.get('latency_ms', '?')}ms) "
+                                  f"{entry['kind']} {params[:100]}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                for result in results:
+                    handle.write(json.dumps({
+                        **result['entry'],
+                        'replay': {
+                            'outcome': result['outcome'],
+                            'detail': result['detail'],
+                            'latency_ms': round(result['latency_ms'], 3),
+                            'lag_ms': round(result['lag_ms'], 3),
+                            'outlier': result['outlier'],
+                        },
+                    }, ensure_ascii=False) + '\n')
+            self.stdout.write(f"Wrote {options['output']}")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roadconnection',
+            name='geometry',
+            field=models.TextField(blank=True, default='', help_text='Road shape from from_city to to_city as an encoded polyline (precision 5)'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('city', 'City'), ('road', 'Road connection'), ('import', 'Bulk import')], max_length=10)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+            },
+        ),
+    ]
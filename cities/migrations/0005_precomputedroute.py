@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities', '0004_graphchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(null=True)),
+                ('path', models.TextField(blank=True, default='')),
+                ('graph_version', models.CharField(max_length=16)),
+                ('change_seq', models.BigIntegerField()),
+                ('from_city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cities.city')),
+                ('to_city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cities.city')),
+            ],
+            options={
+                'unique_together': {('from_city', 'to_city')},
+            },
+        ),
+    ]
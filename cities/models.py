@@ -1,7 +1,25 @@
-from django.db import models
+from django.db import models, router, transaction
 
 
-class City(models.Model):
+class ChangeLogged(models.Model):
+    """
+    Model whose saves and deletes run in a transaction, so the change log
+    entry written by their signals (see cities.changelog) commits with them.
+    """
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            return super().delete(*args, **kwargs)
+
+
+class City(ChangeLogged):
     """Model representing a Nigerian city."""
     name = models.CharField(max_length=100, unique=True)
     state = models.CharField(max_length=100)
@@ -9,6 +27,8 @@ class City(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     population = models.IntegerField(null=True, blank=True)
     is_capital = models.BooleanField(default=False)
+    # Set on every save, so the routing graph can load only the rows changed since it was built
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         verbose_name_plural = "Cities"
@@ -18,7 +38,7 @@ class City(models.Model):
         return f"{self.name}, {self.state}"
 
 
-class RoadConnection(models.Model):
+class RoadConnection(ChangeLogged):
     """Model representing road connections between cities."""
     from_city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='outgoing_roads')
     to_city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='incoming_roads')
@@ -31,6 +51,11 @@ class RoadConnection(models.Model):
         ('local', 'Local Road'),
     ], default='federal')
     is_bidirectional = models.BooleanField(default=True)
+    geometry = models.TextField(
+        blank=True, default='',
+        help_text="Road shape from from_city to to_city as an encoded polyline (precision 5)"
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         unique_together = ['from_city', 'to_city']
@@ -38,3 +63,53 @@ class RoadConnection(models.Model):
     
     def __str__(self):
         return f"{self.from_city.name} → {self.to_city.name} ({self.distance_km}km)"
+
+
+class GraphChange(models.Model):
+    """
+    Append-only log of changes to cities and road connections.
+    
+    Entries are written in the transaction of the change. Each serving
+    process compares the log with the state its routing graph was loaded at
+    and refreshes the graph when they differ.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=[
+        ('city', 'City'),
+        ('road', 'Road connection'),
+        ('import', 'Bulk import'),
+    ])
+    object_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['seq']
+    
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'saved'
+        return f"#{self.seq} {self.kind} {self.object_id or ''} {action}"
+
+
+class PrecomputedRoute(models.Model):
+    """
+    Shortest route between an ordered pair of cities, filled by ``manage.py precompute_routes``.
+    
+    Answers route requests without a routing graph (see api.precomputed).
+    Rows are only used while ``change_seq``, the newest graph change log
+    entry when they were computed, is still the newest.
+    """
+    from_city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='+')
+    to_city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='+')
+    # Null when to_city cannot be reached
+    distance_km = models.FloatField(null=True)
+    # City IDs along the route, comma-separated
+    path = models.TextField(blank=True, default='')
+    graph_version = models.CharField(max_length=16)
+    change_seq = models.BigIntegerField()
+    
+    class Meta:
+        unique_together = ['from_city', 'to_city']
+    
+    def __str__(self):
+        return f"{self.from_city_id} → {self.to_city_id} ({self.distance_km}km)"
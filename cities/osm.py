@@ -0,0 +1,347 @@
+"""
+Road networks from OpenStreetMap XML extracts.
+
+The extract is streamed with ``iterparse`` three times, discarding each
+element once it has been read, so memory depends on the number of road
+nodes and named places rather than the size of the file:
+
+1. Routable ways: the node references are sorted in runs of at most
+   ``chunk_size`` IDs. Each run is written to a temporary file, and the
+   runs are merged from disk into one sorted table of distinct road nodes,
+   so only one run is ever held in memory. Nodes referenced more than once
+   (junctions) or ending a way become graph nodes.
+2. Nodes: coordinates are kept only for nodes in the table, in typed
+   arrays (the table takes about 17 bytes per road node). Place nodes
+   (``place=city``, ``town``, ...) with a name are collected as cities and
+   kept in memory as dictionaries.
+3. Routable ways again: each way is cut at its graph nodes, and every piece
+   becomes one road whose length is the haversine length of its shape.
+
+Graph nodes become City rows: places keep their names, other junctions are
+named after their OSM node ID. Places that are not on a road are joined to
+the nearest graph node by a short local road.
+"""
+import heapq
+import tempfile
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from geo.distance import haversine_km
+from geo.kdtree import KDTree
+from geo.polyline import encode
+
+# OSM highway classes that carry traffic, mapped onto RoadConnection.road_type
+HIGHWAY_ROAD_TYPES = {
+    'motorway': 'expressway',
+    'motorway_link': 'expressway',
+    'trunk': 'highway',
+    'trunk_link': 'highway',
+    'primary': 'federal',
+    'primary_link': 'federal',
+    'secondary': 'state',
+    'secondary_link': 'state',
+    'tertiary': 'local',
+    'tertiary_link': 'local',
+    'unclassified': 'local',
+    'residential': 'local',
+    'living_street': 'local',
+    'road': 'local',
+}
+
+DEFAULT_PLACE_TYPES = ('city', 'town', 'village')
+
+# capital=* values marking national and state capitals
+CAPITAL_VALUES = {'yes', '2', '4'}
+
+_COORDINATE_SCALE = 10 ** 7
+_MISSING = -2 ** 31
+
+# Node IDs read back from each spilled run at a time while merging
+_RUN_READ_SIZE = 65536
+
+
+def _elements(path: str, tags) -> Iterator[ET.Element]:
+    """Yield finished top-level elements with the given tags, then drop them."""
+    context = ET.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event == 'end' and element.tag in ('node', 'way', 'relation'):
+            if element.tag in tags:
+                yield element
+            root.clear()
+
+
+def _spill_run(node_ids: List[int]) -> BinaryIO:
+    """Write node IDs to a temporary file as one sorted run."""
+    run = tempfile.TemporaryFile()
+    array('q', sorted(node_ids)).tofile(run)
+    run.seek(0)
+    return run
+
+
+def _read_run(run: BinaryIO) -> Iterator[int]:
+    """Read a spilled run back a block at a time."""
+    while True:
+        block = array('q')
+        try:
+            block.fromfile(run, _RUN_READ_SIZE)
+        except EOFError:
+            # The last block is shorter; fromfile keeps what it read
+            yield from block
+            return
+        yield from block
+
+
+def _tags(element: ET.Element) -> Dict[str, str]:
+    return {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+
+
+def _population(tags: Dict[str, str]) -> Optional[int]:
+    value = tags.get('population', '').replace(',', '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def routable_way(element: ET.Element) -> Optional[Tuple[List[int], Dict[str, str]]]:
+    """The node refs and tags of a way if it is a routable road, else None."""
+    tags = _tags(element)
+    if tags.get('highway') not in HIGHWAY_ROAD_TYPES or tags.get('area') == 'yes':
+        return None
+    if tags.get('access') in ('no', 'private'):
+        return None
+    refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+    return (refs, tags) if len(refs) >= 2 else None
+
+
+def way_direction(tags: Dict[str, str]) -> int:
+    """1 for a one-way road along the way, -1 against it, 0 for two-way."""
+    oneway = tags.get('oneway', '')
+    if oneway == '-1':
+        return -1
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == 'no':
+        return 0
+    if tags.get('junction') == 'roundabout' or tags.get('highway') == 'motorway':
+        return 1
+    return 0
+
+
+class NodeTable:
+    """
+    Sorted table of road node IDs with coordinates and a graph-node flag.
+
+    Lookups are binary searches over typed arrays, about 17 bytes per node.
+    """
+
+    def __init__(self, ids: array, graph_nodes: bytearray):
+        self.ids = ids
+        self.graph_nodes = graph_nodes
+        self.lats = array('i', [_MISSING]) * len(ids)
+        self.lngs = array('i', [_MISSING]) * len(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, node_id: int) -> int:
+        """Position of a node in the table, or -1."""
+        position = bisect_left(self.ids, node_id)
+        if position < len(self.ids) and self.ids[position] == node_id:
+            return position
+        return -1
+
+    def set_location(self, position: int, lat: float, lng: float):
+        self.lats[position] = round(lat * _COORDINATE_SCALE)
+        self.lngs[position] = round(lng * _COORDINATE_SCALE)
+
+    def location(self, position: int) -> Optional[Tuple[float, float]]:
+        if self.lats[position] == _MISSING:
+            return None
+        return self.lats[position] / _COORDINATE_SCALE, self.lngs[position] / _COORDINATE_SCALE
+
+
+class OSMNetwork:
+    """
+    Cities and roads read from an OSM XML extract.
+
+    Call :meth:`scan` once, then stream :meth:`city_records` and
+    :meth:`road_records` into a :class:`cities.importing.NetworkImporter`.
+    """
+
+    def __init__(self, path: str, place_types=DEFAULT_PLACE_TYPES,
+                 snap_km: float = 5.0, chunk_size: int = 1_000_000):
+        self.path = path
+        self.place_types = set(place_types)
+        self.snap_km = snap_km
+        self.chunk_size = chunk_size
+        self.table = None
+        # OSM node ID -> city record for named places
+        self.places = {}
+        # Places away from the road network: (place node ID, graph node position, km)
+        self.connectors = []
+        self.unconnected_places = 0
+        self.way_count = 0
+
+    def scan(self):
+        """Read the extract's ways and nodes (passes 1 and 2)."""
+        self.table = self._collect_road_nodes()
+        self._read_nodes()
+        self._connect_places()
+
+    def _collect_road_nodes(self) -> NodeTable:
+        runs = []
+        buffer = []
+        try:
+            for element in _elements(self.path, ('way',)):
+                way = routable_way(element)
+                if way is None:
+                    continue
+                refs = way[0]
+                self.way_count += 1
+                buffer.extend(refs)
+                # Count way ends twice so they always become graph nodes
+                buffer.append(refs[0])
+                buffer.append(refs[-1])
+                if len(buffer) >= self.chunk_size:
+                    runs.append(_spill_run(buffer))
+                    buffer = []
+            if buffer:
+                runs.append(_spill_run(buffer))
+            buffer = None
+
+            ids = array('q')
+            graph_nodes = bytearray()
+            for node_id in heapq.merge(*map(_read_run, runs)):
+                if ids and ids[-1] == node_id:
+                    graph_nodes[-1] = 1
+                else:
+                    ids.append(node_id)
+                    graph_nodes.append(0)
+            return NodeTable(ids, graph_nodes)
+        finally:
+            for run in runs:
+                run.close()
+
+    def _read_nodes(self):
+        table = self.table
+        names = set()
+        for element in _elements(self.path, ('node',)):
+            node_id = int(element.get('id'))
+            position = table.index(node_id)
+            if position >= 0:
+                table.set_location(position, float(element.get('lat')), float(element.get('lon')))
+            if element.find('tag') is None:
+                continue
+            tags = _tags(element)
+            name = (tags.get('name') or '').strip()[:100]
+            if tags.get('place') not in self.place_types or not name:
+                continue
+            # City names are unique, so later places with the same name get their ID appended
+            if name in names:
+                name = f'{name[:70]} (OSM {node_id})'
+            names.add(name)
+            self.places[node_id] = {
+                'name': name,
+                'state': tags.get('is_in:state') or tags.get('addr:state') or '',
+                'latitude': element.get('lat'),
+                'longitude': element.get('lon'),
+                'population': _population(tags),
+                'is_capital': tags.get('capital') in CAPITAL_VALUES,
+            }
+            if position >= 0:
+                table.graph_nodes[position] = 1
+
+    def _connect_places(self):
+        table = self.table
+        off_road = [node_id for node_id in self.places if table.index(node_id) < 0]
+        if not off_road:
+            return
+        points = []
+        for position in range(len(table)):
+            if table.graph_nodes[position]:
+                location = table.location(position)
+                if location is not None:
+                    points.append((location[0], location[1], position))
+        tree = KDTree(points)
+        for node_id in off_road:
+            place = self.places[node_id]
+            found = tree.nearest(float(place['latitude']), float(place['longitude']), 1)
+            if found and found[0][0] <= self.snap_km:
+                self.connectors.append((node_id, found[0][1], found[0][0]))
+            else:
+                self.unconnected_places += 1
+
+    def node_name(self, position: int) -> str:
+        node_id = self.table.ids[position]
+        place = self.places.get(node_id)
+        return place['name'] if place is not None else f'OSM node {node_id}'
+
+    def city_records(self) -> Iterator[Dict]:
+        """One city record per graph node and per place joined to the roads."""
+        table = self.table
+        for position in range(len(table)):
+            if not table.graph_nodes[position]:
+                continue
+            place = self.places.get(table.ids[position])
+            if place is not None:
+                yield place
+                continue
+            location = table.location(position)
+            if location is not None:
+                yield {
+                    'name': self.node_name(position),
+                    'state': '',
+                    'latitude': location[0],
+                    'longitude': location[1],
+                }
+        for node_id, _, _ in self.connectors:
+            yield self.places[node_id]
+
+    def road_records(self) -> Iterator[Dict]:
+        """Road records for every piece of every routable way (pass 3)."""
+        table = self.table
+        for element in _elements(self.path, ('way',)):
+            way = routable_way(element)
+            if way is None:
+                continue
+            refs, tags = way
+            road_type = HIGHWAY_ROAD_TYPES[tags['highway']]
+            direction = way_direction(tags)
+
+            start = None
+            points = []
+            length = 0.0
+            for ref in refs:
+                position = table.index(ref)
+                location = table.location(position) if position >= 0 else None
+                if location is None:
+                    # Node missing from the extract: drop the piece it is in
+                    start, points, length = None, [], 0.0
+                    continue
+                if points:
+                    length += haversine_km(*points[-1], *location)
+                points.append(location)
+                if not table.graph_nodes[position]:
+                    continue
+                if start is not None and start != position:
+                    ends = (start, position) if direction >= 0 else (position, start)
+                    shape = points if direction >= 0 else points[::-1]
+                    yield {
+                        'from_city': self.node_name(ends[0]),
+                        'to_city': self.node_name(ends[1]),
+                        'distance_km': round(length, 2),
+                        'road_type': road_type,
+                        'is_bidirectional': direction == 0,
+                        'geometry': encode(shape),
+                    }
+                start, points, length = position, [location], 0.0
+
+        for node_id, position, distance in self.connectors:
+            place = self.places[node_id]
+            yield {
+                'from_city': place['name'],
+                'to_city': self.node_name(position),
+                'distance_km': round(distance, 2),
+                'road_type': 'local',
+                'is_bidirectional': True,
+            }
@@ -0,0 +1,190 @@
+"""
+Reproducible synthetic road networks for scale testing.
+
+Nodes are scattered on a jittered grid over a bounding box, so the network
+is spread evenly and roads stay short. Every node is first joined to the
+node to its left or above it, which gives a spanning tree and keeps the
+network connected; further roads to grid neighbours (right, below and one
+diagonal per grid square, so roads barely cross) are then added until each
+node reaches a degree drawn from the configured distribution.
+
+The same seed and parameters always produce the same network.
+"""
+import hashlib
+import math
+import random
+from array import array
+from typing import Dict, Iterator, Tuple
+from geo.distance import haversine_km
+from geo.snapshot import FLOAT_TYPE, INT_TYPE, GraphSnapshot
+
+# Nigeria's latitude/longitude extent: (min_lat, min_lng, max_lat, max_lng)
+NIGERIA_BBOX = (4.27, 2.67, 13.89, 14.68)
+
+DEFAULT_DEGREES = {2: 0.25, 3: 0.45, 4: 0.25, 5: 0.05}
+
+DEFAULT_ROAD_TYPES = {'local': 0.5, 'state': 0.25, 'federal': 0.15, 'highway': 0.07, 'expressway': 0.03}
+
+ROAD_TYPE_CODES = ('highway', 'expressway', 'federal', 'state', 'local')
+
+
+def parse_weights(text: str, key=str) -> Dict:
+    """Parse ``"a:0.5,b:0.25"`` into ``{a: 0.5, b: 0.25}``."""
+    weights = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(':')
+        try:
+            weights[key(name.strip())] = float(weight)
+        except ValueError:
+            raise ValueError(f'invalid weight "{item.strip()}", expected name:weight')
+    if not weights or any(weight < 0 for weight in weights.values()) or not sum(weights.values()):
+        raise ValueError(f'"{text}" needs at least one positive weight')
+    return weights
+
+
+class SyntheticNetwork:
+    """
+    A generated road network held in typed arrays.
+
+    Nodes are numbered ``0..node_count - 1``. Each road has a tail, a head,
+    a length in km, an index into :data:`ROAD_TYPE_CODES` and a one-way flag.
+    """
+
+    def __init__(self, node_count: int, seed: int = 0, bbox: Tuple[float, float, float, float] = NIGERIA_BBOX,
+                 degrees: Dict[int, float] = None, road_types: Dict[str, float] = None,
+                 oneway_fraction: float = 0.0, detour: Tuple[float, float] = (1.1, 1.4)):
+        if node_count < 1:
+            raise ValueError('node_count must be positive')
+        unknown = set(road_types or ()) - set(ROAD_TYPE_CODES)
+        if unknown:
+            raise ValueError(f'unknown road types: {", ".join(sorted(unknown))}')
+        if not 0 <= oneway_fraction <= 1:
+            raise ValueError('oneway_fraction must be between 0 and 1')
+
+        self.node_count = node_count
+        self.seed = seed
+        self.bbox = bbox
+        self.degrees = degrees or DEFAULT_DEGREES
+        self.road_types = road_types or DEFAULT_ROAD_TYPES
+        self.oneway_fraction = oneway_fraction
+        self.detour = detour
+
+        self.lats = array(FLOAT_TYPE)
+        self.lngs = array(FLOAT_TYPE)
+        self.tails = array(INT_TYPE)
+        self.heads = array(INT_TYPE)
+        self.lengths = array(FLOAT_TYPE)
+        self.types = bytearray()
+        self.oneway = bytearray()
+        self._generate()
+
+    @property
+    def road_count(self) -> int:
+        return len(self.tails)
+
+    @property
+    def version(self) -> str:
+        """Identifies the network: the same for the same seed and parameters."""
+        parameters = repr((self.node_count, self.seed, self.bbox, sorted(self.degrees.items()),
+                           sorted(self.road_types.items()), self.oneway_fraction, self.detour))
+        return 'synthetic-' + hashlib.blake2b(parameters.encode(), digest_size=8).hexdigest()
+
+    def _generate(self):
+        rng = random.Random(self.seed)
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        height, width = max_lat - min_lat, max_lng - min_lng
+        n = self.node_count
+        columns = max(1, math.ceil(math.sqrt(n * width / height))) if height > 0 else n
+        rows = math.ceil(n / columns)
+        cell_height, cell_width = height / rows, width / columns
+
+        for index in range(n):
+            row, column = divmod(index, columns)
+            self.lats.append(min_lat + (row + 0.15 + 0.7 * rng.random()) * cell_height)
+            self.lngs.append(min_lng + (column + 0.15 + 0.7 * rng.random()) * cell_width)
+
+        degree_values = list(self.degrees)
+        degree_weights = [self.degrees[value] for value in degree_values]
+        target = [rng.choices(degree_values, degree_weights)[0] for _ in range(n)]
+        degree = [0] * n
+        type_names = list(self.road_types)
+        type_weights = [self.road_types[name] for name in type_names]
+        type_codes = [ROAD_TYPE_CODES.index(name) for name in type_names]
+
+        def add(a, b, may_be_oneway):
+            length = haversine_km(self.lats[a], self.lngs[a], self.lats[b], self.lngs[b])
+            oneway = may_be_oneway and rng.random() < self.oneway_fraction
+            if oneway and rng.random() < 0.5:
+                a, b = b, a
+            self.tails.append(a)
+            self.heads.append(b)
+            self.lengths.append(max(0.01, round(length * rng.uniform(*self.detour), 2)))
+            self.types.append(rng.choices(type_codes, type_weights)[0])
+            self.oneway.append(oneway)
+            degree[a] += 1
+            degree[b] += 1
+
+        # Spanning tree: join each node to its left or upper neighbour
+        parent = [-1] * n
+        for index in range(1, n):
+            row, column = divmod(index, columns)
+            if row == 0 or (column > 0 and rng.random() < 0.5):
+                parent[index] = index - 1
+            else:
+                parent[index] = index - columns
+            add(parent[index], index, False)
+
+        # Extra roads to the right, below and across one diagonal per grid
+        # square (chosen at random, so diagonals never cross) until nodes
+        # reach their target degree
+        for index in range(n):
+            column = index % columns
+            right = index + 1 if column + 1 < columns and index + 1 < n else None
+            below = index + columns if index + columns < n else None
+            diagonal = None
+            if right is not None and below is not None:
+                diagonal = below + 1 if rng.random() < 0.5 else None
+            for neighbour in (right, below, diagonal):
+                if neighbour is None or neighbour >= n or parent[neighbour] == index:
+                    continue
+                if degree[index] >= target[index] or degree[neighbour] >= target[neighbour]:
+                    continue
+                add(index, neighbour, True)
+
+    def nodes(self) -> Iterator[Tuple[int, float, float]]:
+        """``(node, latitude, longitude)`` for every node."""
+        for index in range(self.node_count):
+            yield index, self.lats[index], self.lngs[index]
+
+    def roads(self) -> Iterator[Tuple[int, int, float, str, bool]]:
+        """``(tail, head, km, road_type, bidirectional)`` for every road."""
+        for i in range(self.road_count):
+            yield (self.tails[i], self.heads[i], self.lengths[i],
+                   ROAD_TYPE_CODES[self.types[i]], not self.oneway[i])
+
+    def to_snapshot(self) -> GraphSnapshot:
+        """CSR snapshot of the network; node IDs are the node numbers."""
+        n = self.node_count
+        offsets = array(INT_TYPE, [0]) * (n + 1)
+        for i in range(self.road_count):
+            offsets[self.tails[i] + 1] += 1
+            if not self.oneway[i]:
+                offsets[self.heads[i] + 1] += 1
+        for index in range(1, n + 1):
+            offsets[index] += offsets[index - 1]
+        total = offsets[n]
+        targets = array(INT_TYPE, [0]) * total
+        weights = array(FLOAT_TYPE, [0.0]) * total
+        fill = array(INT_TYPE, offsets)
+        for i in range(self.road_count):
+            directions = ((self.tails[i], self.heads[i]),)
+            if not self.oneway[i]:
+                directions += ((self.heads[i], self.tails[i]),)
+            for tail, head in directions:
+                position = fill[tail]
+                targets[position] = head
+                weights[position] = self.lengths[i]
+                fill[tail] = position + 1
+        return GraphSnapshot(array(INT_TYPE, range(n)), offsets, targets, weights, self.version)
@@ -4,7 +4,7 @@ Django settings for city_distance_calculator project.
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,6 +32,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.querycount.QueryCountMiddleware',
+    'api.timing.ServerTimingMiddleware',
+    'api.metrics.MetricsMiddleware',
+    'api.querylog.QueryLogMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -103,13 +107,107 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.rendering.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
 }
 
+# Routing settings
+# Worker threads used by the FastAPI app for blocking work (graph builds and
+# route searches). 0 runs that work inline on the event loop.
+ROUTING_THREADS = config('ROUTING_THREADS', default=4, cast=int)
+
+# Worker processes used for batch and matrix searches. 0 searches in-process.
+ROUTING_PROCESSES = config('ROUTING_PROCESSES', default=0, cast=int)
+
+# Upper bounds on a single batch or matrix request
+ROUTE_BATCH_MAX_QUERIES = config('ROUTE_BATCH_MAX_QUERIES', default=1000, cast=int)
+ROUTE_MATRIX_MAX_CELLS = config('ROUTE_MATRIX_MAX_CELLS', default=10000, cast=int)
+
+# Streaming batch endpoint: query lines grouped per read chunk, and the
+# number of source groups searched concurrently before reading pauses
+ROUTE_STREAM_CHUNK_LINES = config('ROUTE_STREAM_CHUNK_LINES', default=500, cast=int)
+ROUTE_STREAM_MAX_IN_FLIGHT = config('ROUTE_STREAM_MAX_IN_FLIGHT', default=8, cast=int)
+
+# Search events returned at most by a traced route request (trace=1)
+ROUTE_TRACE_MAX_EVENTS = config('ROUTE_TRACE_MAX_EVENTS', default=5000, cast=int)
+
+# Refresh the routing graph after a change by reading only the rows updated
+# since it was loaded, back to GRAPH_SYNC_OVERLAP_SECONDS before the newest
+# row seen (covering slow transactions and clock skew between servers).
+# Writes that bypass save() and bulk_create(), such as QuerySet.update(),
+# must set updated_at themselves or turn this off.
+GRAPH_DELTA_SYNC = config('GRAPH_DELTA_SYNC', default=True, cast=bool)
+GRAPH_SYNC_OVERLAP_SECONDS = config('GRAPH_SYNC_OVERLAP_SECONDS', default=60.0, cast=float)
+
+# How often (seconds) each process checks the change log written with every
+# city and road change, and refreshes its graph if another process changed
+# the network. 0 only refreshes after changes made by the process itself.
+GRAPH_CHANGE_CHECK_SECONDS = config('GRAPH_CHANGE_CHECK_SECONDS', default=1.0, cast=float)
+
+# Answer route requests from the table filled by manage.py precompute_routes:
+# 'cold' until the process has built its graph (built in the background),
+# 'always' before searching, so a full table means no graph is built. Empty
+# to always search.
+PRECOMPUTED_ROUTES = config('PRECOMPUTED_ROUTES', default='')
+
+# Number of rendered route responses kept in each process
+ROUTE_CACHE_SIZE = config('ROUTE_CACHE_SIZE', default=10000, cast=int)
+
+# Query log (see QUERY_LOG_PATH) whose ROUTE_CACHE_WARM_ROUTES most requested
+# routes are rendered into the route cache for every new graph version
+ROUTE_CACHE_WARM_LOG = config('ROUTE_CACHE_WARM_LOG', default='')
+ROUTE_CACHE_WARM_ROUTES = config('ROUTE_CACHE_WARM_ROUTES', default=1000, cast=int)
+
+# Cache-Control max-age (seconds) for GET route responses
+ROUTE_HTTP_MAX_AGE = config('ROUTE_HTTP_MAX_AGE', default=300, cast=int)
+
+# Web map zoom levels with precomputed simplified route geometry; requests
+# for other zooms get the nearest coarser level
+ROUTE_GEOMETRY_ZOOM_LEVELS = config('ROUTE_GEOMETRY_ZOOM_LEVELS', default='6,8,10,12,14', cast=Csv(int))
+
+# Maximum number of cities returned by a nearest-city query
+SPATIAL_MAX_K = config('SPATIAL_MAX_K', default=50, cast=int)
+
+# City and road connection listings: page sizes for keyset pagination and the
+# number of rows fetched per database round trip when streaming
+LISTING_DEFAULT_LIMIT = config('LISTING_DEFAULT_LIMIT', default=100, cast=int)
+LISTING_MAX_LIMIT = config('LISTING_MAX_LIMIT', default=1000, cast=int)
+LISTING_STREAM_CHUNK_SIZE = config('LISTING_STREAM_CHUNK_SIZE', default=2000, cast=int)
+
+# Report the number of database queries per request in an X-DB-Queries
+# response header (read by the load-testing harness)
+DB_QUERY_COUNT_HEADER = config('DB_QUERY_COUNT_HEADER', default=DEBUG, cast=bool)
+
+# Time the stages of each request and report them in a Server-Timing header
+# and on the api.timing logger. Can be switched at runtime with
+# api.timing.set_enabled() or POST /api/debug/server-timing/.
+SERVER_TIMING = config('SERVER_TIMING', default=False, cast=bool)
+
+# Prometheus metrics (/api/metrics/ and the FastAPI app's /metrics). Set
+# METRICS_DIR to a directory shared by all worker processes, emptied on
+# startup, to report their combined numbers from any worker.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+
+# Append a QUERY_LOG_SAMPLE_RATE share of the routing and search requests to
+# this JSON lines file (replayed with manage.py replay_queries). Off when empty.
+QUERY_LOG_PATH = config('QUERY_LOG_PATH', default='')
+QUERY_LOG_SAMPLE_RATE = config('QUERY_LOG_SAMPLE_RATE', default=1.0, cast=float)
+
+# Longest run of the staff-only profiler (POST /api/debug/profile/), in seconds
+PROFILE_MAX_SECONDS = config('PROFILE_MAX_SECONDS', default=10.0, cast=float)
+
+# Per-process budget (MB) for the routing graph, its derived indexes and the
+# route cache; cache entries, then optional indexes, are dropped to stay
+# within it. 0 means unlimited
+MEMORY_BUDGET_MB = config('MEMORY_BUDGET_MB', default=0.0, cast=float)
+
+# Trace allocations with tracemalloc from startup, for GET /api/debug/memory/
+MEMORY_TRACEMALLOC = config('MEMORY_TRACEMALLOC', default=False, cast=bool)
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
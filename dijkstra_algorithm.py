@@ -10,10 +10,11 @@ Purpose: Find shortest path between Nigerian cities using graph theory
 """
 
 import json
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Callable, Dict, List, Tuple, Optional, Set
 
 
-def dijkstra_algorithm(cities: Dict, roads: Dict, start: str, end: str) -> Tuple[Optional[int], Optional[List[str]]]:
+def dijkstra_algorithm(cities: Dict, roads: Dict, start: str, end: str,
+                       on_event: Optional[Callable[[Dict], None]] = None) -> Tuple[Optional[int], Optional[List[str]]]:
     """
     Dijkstra's Algorithm Implementation for Shortest Path Finding
     
@@ -26,6 +27,8 @@ def dijkstra_algorithm(cities: Dict, roads: Dict, start: str, end: str) -> Tuple
         roads: Dictionary of road connections with distances
         start: Starting city name
         end: Destination city name
+        on_event: Optional callback receiving a dictionary for every step
+            ("visit", "relax", "done"); see demonstrate_algorithm
     
     Returns:
         Tuple of (total_distance, path_list) or (None, None) if no path exists
@@ -33,19 +36,15 @@ def dijkstra_algorithm(cities: Dict, roads: Dict, start: str, end: str) -> Tuple
     
     # STEP 1: VALIDATION - Check if start and end cities exist
     if start not in cities or end not in cities:
-        print(f"❌ Error: City not found in the network")
         return None, None
     
     # If start and end are the same city
     if start == end:
-        print(f"✅ Same city: {start} -> {end} (distance: 0)")
+        if on_event:
+            on_event({'event': 'done', 'distance': 0, 'path': [start]})
         return 0, [start]
     
-    print(f"🚀 Starting Dijkstra's Algorithm: {start} -> {end}")
-    print("=" * 50)
-    
     # STEP 2: INITIALIZATION - Set up data structures
-    print("📊 STEP 2: Initializing data structures...")
     
     # distances: Keep track of shortest distance to each city
     # Initially set all distances to infinity (∞)
@@ -61,137 +60,92 @@ def dijkstra_algorithm(cities: Dict, roads: Dict, start: str, end: str) -> Tuple
     # unvisited: Set of cities we haven't processed yet
     unvisited = set(cities.keys())
     
-    print(f"   • Total cities in network: {len(cities)}")
-    print(f"   • Starting distance: {distances[start]}")
-    print(f"   • Unvisited cities: {len(unvisited)}")
-    print()
-    
     # STEP 3: MAIN ALGORITHM LOOP - Process each city
-    print("🔄 STEP 3: Main algorithm loop...")
-    iteration = 0
-    
     while unvisited:
-        iteration += 1
-        print(f"   📍 Iteration {iteration}:")
-        
         # STEP 3A: FIND CLOSEST UNVISITED CITY
         # This is the core of Dijkstra's algorithm - always choose the city
         # with the smallest known distance that we haven't visited yet
         current = min(unvisited, key=lambda city: distances[city])
         current_distance = distances[current]
         
-        print(f"      • Current city: {current} (distance: {current_distance})")
-        
         # STEP 3B: CHECK IF WE'VE REACHED THE DESTINATION
-        # If we've found the shortest path to our destination, we can stop
-        if current == end:
-            print(f"      ✅ Destination reached: {end}")
+        # If we've found the shortest path to our destination, we can stop.
+        # Only unreachable cities are left once the closest one is at infinity.
+        if current == end or current_distance == float('inf'):
             break
         
         # STEP 3C: MARK CURRENT CITY AS VISITED
         # Remove it from unvisited set so we don't process it again
         unvisited.remove(current)
-        print(f"      • Marked {current} as visited")
-        print(f"      • Remaining unvisited: {len(unvisited)}")
+        if on_event:
+            on_event({'event': 'visit', 'city': current, 'distance': current_distance})
         
         # STEP 3D: EXPLORE NEIGHBORS - Check all roads from current city
-        print(f"      🔍 Exploring roads from {current}:")
-        neighbors_found = 0
-        
         for (city1, city2), road_distance in roads.items():
             # Check if this road connects to our current city
+            # (roads are bidirectional, so we check both directions)
             if city1 == current and city2 in unvisited:
-                # Found a road from current city to an unvisited city
-                neighbors_found += 1
                 neighbor = city2
-                
-                # Calculate alternative distance: current distance + road distance
-                alternative_distance = current_distance + road_distance
-                current_neighbor_distance = distances[neighbor]
-                
-                print(f"         • Road: {current} -> {neighbor} (distance: {road_distance})")
-                print(f"           - Current distance to {neighbor}: {current_neighbor_distance}")
-                print(f"           - Alternative distance: {alternative_distance}")
-                
-                # STEP 3E: UPDATE DISTANCE IF WE FOUND A SHORTER PATH
-                if alternative_distance < current_neighbor_distance:
-                    distances[neighbor] = alternative_distance
-                    previous[neighbor] = current
-                    print(f"           ✅ Updated! New distance to {neighbor}: {alternative_distance}")
-                else:
-                    print(f"           ❌ No improvement (current path is shorter)")
-                    
             elif city2 == current and city1 in unvisited:
-                # Found a road from an unvisited city to current city
-                # (roads are bidirectional, so we check both directions)
-                neighbors_found += 1
                 neighbor = city1
-                
-                alternative_distance = current_distance + road_distance
-                current_neighbor_distance = distances[neighbor]
-                
-                print(f"         • Road: {neighbor} -> {current} (distance: {road_distance})")
-                print(f"           - Current distance to {neighbor}: {current_neighbor_distance}")
-                print(f"           - Alternative distance: {alternative_distance}")
-                
-                if alternative_distance < current_neighbor_distance:
-                    distances[neighbor] = alternative_distance
-                    previous[neighbor] = current
-                    print(f"           ✅ Updated! New distance to {neighbor}: {alternative_distance}")
-                else:
-                    print(f"           ❌ No improvement (current path is shorter)")
-        
-        if neighbors_found == 0:
-            print(f"         • No unvisited neighbors found from {current}")
-        
-        print()
+            else:
+                continue
+            
+            # Calculate alternative distance: current distance + road distance
+            alternative_distance = current_distance + road_distance
+            
+            # STEP 3E: UPDATE DISTANCE IF WE FOUND A SHORTER PATH
+            improved = alternative_distance < distances[neighbor]
+            if on_event:
+                on_event({'event': 'relax', 'city': neighbor, 'via': current,
+                          'previous': distances[neighbor], 'alternative': alternative_distance,
+                          'improved': improved})
+            if improved:
+                distances[neighbor] = alternative_distance
+                previous[neighbor] = current
     
     # STEP 4: CHECK IF PATH EXISTS
-    print("🔍 STEP 4: Checking if path exists...")
     final_distance = distances[end]
     
     if final_distance == float('inf'):
-        print(f"❌ No path found from {start} to {end}")
-        print("   This could happen if cities are in disconnected parts of the network")
+        # This could happen if cities are in disconnected parts of the network
+        if on_event:
+            on_event({'event': 'done', 'distance': None, 'path': []})
         return None, None
     
-    print(f"✅ Path exists! Total distance: {final_distance} km")
-    
     # STEP 5: RECONSTRUCT THE PATH
-    print("🛤️  STEP 5: Reconstructing the shortest path...")
-    
     # Start from the destination and work backwards using the 'previous' dictionary
     path = []
     current = end
     
-    print(f"   • Starting from destination: {end}")
-    
     while current is not None:
         path.append(current)
         current = previous[current]
-        if current is not None:
-            print(f"   • Previous city: {current}")
     
     # Reverse the path since we built it backwards
     path.reverse()
     
-    print(f"   • Final path: {' -> '.join(path)}")
-    print(f"   • Total cities in path: {len(path)}")
-    print(f"   • Total distance: {final_distance} km")
-    
     # STEP 6: ALGORITHM COMPLETION
-    print("=" * 50)
-    print("🎉 Dijkstra's Algorithm completed successfully!")
-    print(f"📊 Results:")
-    print(f"   • Start: {start}")
-    print(f"   • End: {end}")
-    print(f"   • Distance: {final_distance} km")
-    print(f"   • Path: {' -> '.join(path)}")
-    print(f"   • Cities visited: {len(path)}")
+    if on_event:
+        on_event({'event': 'done', 'distance': final_distance, 'path': path})
     
     return final_distance, path
 
 
+def narrate(event: Dict):
+    """Print one step of the algorithm for the demonstration."""
+    if event['event'] == 'visit':
+        print(f"   📍 Visiting {event['city']} (distance: {event['distance']})")
+    elif event['event'] == 'relax':
+        outcome = "✅ Updated!" if event['improved'] else "❌ No improvement"
+        print(f"      • Road {event['via']} -> {event['city']}: "
+              f"{event['previous']} vs {event['alternative']} {outcome}")
+    elif event['distance'] is None:
+        print("❌ No path found (the cities are in disconnected parts of the network)")
+    else:
+        print(f"✅ Path found: {' -> '.join(event['path'])} ({event['distance']} km)")
+
+
 def demonstrate_algorithm():
     """
     Demonstration function showing how Dijkstra's algorithm works
@@ -231,7 +185,7 @@ def demonstrate_algorithm():
     print(f"🎯 Finding shortest path: {start_city} -> {end_city}")
     print()
     
-    distance, path = dijkstra_algorithm(sample_cities, sample_roads, start_city, end_city)
+    distance, path = dijkstra_algorithm(sample_cities, sample_roads, start_city, end_city, on_event=narrate)
     
     if distance is not None:
         print()
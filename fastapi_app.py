@@ -2,19 +2,43 @@
 FastAPI application for API documentation and testing.
 This provides a modern API interface alongside Django REST Framework.
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
 import os
+import time
 import django
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'city_distance_calculator.settings')
 django.setup()
 
-from api.dijkstra import calculate_shortest_route
-from cities.models import City, RoadConnection
+from django.conf import settings
+from api import metrics, querylog, timing
+from api.querycount import HEADER as DB_QUERIES_HEADER, count_queries
+from api.spatial import cities_within, nearest_cities
+from api.precomputed import (
+    lookup_route, lookup_versioned_route, start_background_build, wanted as precomputed_wanted,
+)
+from api.http_cache import cache_headers, canonical_route_query, is_not_modified, route_validators
+from api.dijkstra import (
+    calculate_route_from_coordinates,
+    calculate_route_matrix,
+    calculate_routes,
+    calculate_shortest_route,
+    change_check_due,
+    current_graph,
+    get_graph,
+)
 
 # Create FastAPI app
 app = FastAPI(
@@ -34,6 +58,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.DB_QUERY_COUNT_HEADER:
+    @app.middleware("http")
+    async def count_db_queries(request: Request, call_next):
+        """Report the database queries made for each request in a response header."""
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers[DB_QUERIES_HEADER] = str(counter.count)
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware adding a Server-Timing header while timing is enabled.
+    
+    Written against raw ASGI rather than ``@app.middleware`` so that requests
+    pass straight through when timing is off.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not timing.is_enabled():
+            await self.app(scope, receive, send)
+            return
+        
+        with timing.time_request(scope['method'], scope['path']) as request_timing:
+            async def send_with_timing(message):
+                if message['type'] == 'http.response.start':
+                    headers = list(message.get('headers', []))
+                    headers.append((timing.HEADER.encode(), request_timing.header().encode()))
+                    message = {**message, 'headers': headers}
+                await send(message)
+            
+            await self.app(scope, receive, send_with_timing)
+
+
+app.add_middleware(ServerTimingMiddleware)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency and status of every request."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope
+            route = scope.get('route')
+            endpoint = route.path if route is not None else 'unmatched'
+            metrics.request_served('fastapi', endpoint, scope['method'], status_code,
+                                   time.perf_counter() - started)
+
+
+if metrics.ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+class QueryLogMiddleware:
+    """ASGI middleware logging a sample of the routing and search requests."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not querylog.sampled():
+            await self.app(scope, receive, send)
+            return
+        
+        started_at = time.time()
+        started = time.perf_counter()
+        status_code = 500
+        body = []
+        body_size = 0
+        
+        async def receive_body():
+            nonlocal body_size
+            message = await receive()
+            if message['type'] == 'http.request' and body_size <= querylog.MAX_BODY_BYTES:
+                chunk = message.get('body', b'')
+                body_size += len(chunk)
+                body.append(chunk)
+            return message
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+        
+        # Only the logged endpoints' bodies are kept, never e.g. a streamed batch
+        logged = scope['path'] in querylog.FASTAPI_KINDS
+        try:
+            await self.app(scope, receive_body if logged else receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            kind = querylog.FASTAPI_KINDS.get(route.path) if route is not None else None
+            if kind is not None:
+                params = querylog.request_params(scope['query_string'].decode('latin-1'),
+                                                 b''.join(body) if body_size <= querylog.MAX_BODY_BYTES else b'',
+                                                 scope.get('path_params'))
+                querylog.record('fastapi', kind, scope['method'], scope['path'], params, status_code,
+                                started_at, time.perf_counter() - started)
+
+
+if querylog.ENABLED:
+    app.add_middleware(QueryLogMiddleware)
+
+# Blocking work (ORM reads while building the graph, route searches) runs on a
+# bounded thread pool so it never stalls the event loop.
+_blocking_pool = None
+
+
+def set_blocking_pool_size(max_workers: int):
+    """Resize the pool used for blocking work. 0 runs it inline on the event loop."""
+    global _blocking_pool
+    previous = _blocking_pool
+    _blocking_pool = (
+        ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='routing')
+        if max_workers > 0 else None
+    )
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+set_blocking_pool_size(settings.ROUTING_THREADS)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the routing pool and await its result."""
+    if _blocking_pool is None:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # Carry the request's context variables (query counters) into the pool
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_pool, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def run_orm(func, *args):
+    """Run a callable that queries the database off the event loop."""
+    if _blocking_pool is None:
+        # The ORM refuses to run on the event loop
+        return await asyncio.to_thread(func, *args)
+    return await run_blocking(func, *args)
+
+
+async def shared_graph():
+    """Return the in-memory graph, building or refreshing it off the event loop if needed."""
+    graph = current_graph()
+    if graph is None or change_check_due():
+        graph = await run_orm(get_graph)
+    return graph
+
+
+@app.on_event("startup")
+async def warm_graph():
+    """
+    Build the graph before the first request arrives, or in the background
+    while precomputed routes answer requests (PRECOMPUTED_ROUTES).
+    """
+    if settings.PRECOMPUTED_ROUTES == 'always':
+        return
+    if settings.PRECOMPUTED_ROUTES == 'cold':
+        start_background_build()
+        return
+    await shared_graph()
+
 # Pydantic models
 class CityResponse(BaseModel):
     id: int
@@ -48,6 +255,11 @@ class RouteRequest(BaseModel):
     from_city: str
     to_city: str
 
+class RouteCalculationRequest(RouteRequest):
+    geometry: bool = False
+    zoom: Optional[int] = Field(None, ge=0, le=22)
+    trace: bool = False
+
 class RouteResponse(BaseModel):
     success: bool
     total_distance: Optional[float] = None
@@ -55,6 +267,50 @@ class RouteResponse(BaseModel):
     cities: List[Dict[str, Any]] = []
     from_city: Optional[Dict[str, Any]] = None
     to_city: Optional[Dict[str, Any]] = None
+    geometry: Optional[str] = None
+    trace: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class NearbyCityResponse(CityResponse):
+    distance_km: float
+
+class CoordinateRouteRequest(BaseModel):
+    from_lat: float = Field(..., ge=-90, le=90)
+    from_lng: float = Field(..., ge=-180, le=180)
+    to_lat: float = Field(..., ge=-90, le=90)
+    to_lng: float = Field(..., ge=-180, le=180)
+
+class CoordinateRouteResponse(RouteResponse):
+    snapped: Optional[Dict[str, Dict[str, Any]]] = None
+
+class RouteBatchRequest(BaseModel):
+    routes: List[RouteRequest]
+
+class RouteBatchResponse(BaseModel):
+    success: bool
+    results: List[RouteResponse] = []
+    count: int = 0
+
+# Route response fields present only when the request asked for them
+REQUESTED_ROUTE_FIELDS = ('geometry', 'trace')
+
+def route_body(result: Dict[str, Any], model=RouteResponse) -> Dict[str, Any]:
+    """JSON-ready route response, leaving out the optional fields that were not requested."""
+    body = jsonable_encoder(model(**result))
+    for field in REQUESTED_ROUTE_FIELDS:
+        if field not in result:
+            del body[field]
+    return body
+
+class RouteMatrixRequest(BaseModel):
+    sources: List[str]
+    targets: List[str]
+
+class RouteMatrixResponse(BaseModel):
+    success: bool
+    sources: List[Dict[str, Any]] = []
+    targets: List[Dict[str, Any]] = []
+    distances: List[List[Optional[float]]] = []
     error: Optional[str] = None
 
 class HealthResponse(BaseModel):
@@ -82,91 +338,345 @@ async def health_check():
         version="1.0.0"
     )
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint, in the text exposition format."""
+    return Response(await asyncio.to_thread(metrics.exposition), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/cities", response_model=List[CityResponse])
-async def get_cities():
-    """Get all cities in the database."""
-    cities = City.objects.all()
-    return [
-        CityResponse(
-            id=city.id,
-            name=city.name,
-            state=city.state,
-            latitude=float(city.latitude),
-            longitude=float(city.longitude),
-            population=city.population,
-            is_capital=city.is_capital
-        )
-        for city in cities
-    ]
+async def get_cities(
+    after_id: Optional[int] = Query(None, ge=0, description="Return cities with IDs greater than this"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTING_MAX_LIMIT, description="Page size"),
+    stream: bool = Query(False, description="Stream the listing as it is encoded"),
+):
+    """
+    Get all cities in the database.
+    
+    With ``after_id`` and/or ``limit`` the cities are paged in ID order and the
+    ``X-Next-After-Id`` header carries the cursor for the next page.
+    """
+    graph = await shared_graph()
+    
+    if after_id is None and limit is None:
+        city_ids = None
+        next_after_id = None
+    else:
+        ordered_ids = graph.sorted_city_ids()
+        start = bisect.bisect_right(ordered_ids, after_id or 0)
+        end = start + (limit or settings.LISTING_DEFAULT_LIMIT)
+        city_ids = ordered_ids[start:end]
+        next_after_id = city_ids[-1] if end < len(ordered_ids) and city_ids else None
+    
+    cities = graph.cities
+    rows = list(cities.values()) if city_ids is None else [cities[city_id] for city_id in city_ids]
+    headers = {'X-Next-After-Id': str(next_after_id)} if next_after_id is not None else None
+    
+    # Catalog entries already match CityResponse, so skip per-row model validation
+    if stream:
+        def encode():
+            yield b'['
+            for start in range(0, len(rows), settings.LISTING_STREAM_CHUNK_SIZE):
+                chunk = rows[start:start + settings.LISTING_STREAM_CHUNK_SIZE]
+                yield (b',' if start else b'') + b','.join(json.dumps(row).encode() for row in chunk)
+            yield b']'
+        return StreamingResponse(encode(), media_type='application/json', headers=headers)
+    return JSONResponse(rows, headers=headers)
+
+@app.get("/cities/nearest", response_model=List[NearbyCityResponse])
+async def get_nearest_cities(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(1, ge=1, le=settings.SPATIAL_MAX_K, description="Number of cities to return"),
+):
+    """Get the cities nearest to a coordinate, nearest first."""
+    graph = await shared_graph()
+    return nearest_cities(graph, lat, lng, k)
+
+@app.get("/cities/within", response_model=List[CityResponse])
+async def get_cities_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+):
+    """Get the cities inside a bounding box, ordered by name."""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Minimum coordinates must not exceed maximum coordinates")
+    graph = await shared_graph()
+    return cities_within(graph, min_lat, min_lng, max_lat, max_lng)
 
 @app.get("/cities/{city_id}", response_model=CityResponse)
 async def get_city(city_id: int):
     """Get a specific city by ID."""
-    try:
-        city = City.objects.get(id=city_id)
-        return CityResponse(
-            id=city.id,
-            name=city.name,
-            state=city.state,
-            latitude=float(city.latitude),
-            longitude=float(city.longitude),
-            population=city.population,
-            is_capital=city.is_capital
-        )
-    except City.DoesNotExist:
+    graph = await shared_graph()
+    city = graph.cities.get(city_id)
+    if city is None:
         raise HTTPException(status_code=404, detail="City not found")
+    return city
 
 @app.get("/cities/search/{query}", response_model=List[CityResponse])
 async def search_cities(query: str):
     """Search cities by name or state."""
-    cities = City.objects.filter(
-        name__icontains=query
-    ).union(
-        City.objects.filter(state__icontains=query)
-    ).distinct()
-    
+    graph = await shared_graph()
+    needle = query.casefold()
     return [
-        CityResponse(
-            id=city.id,
-            name=city.name,
-            state=city.state,
-            latitude=float(city.latitude),
-            longitude=float(city.longitude),
-            population=city.population,
-            is_capital=city.is_capital
-        )
-        for city in cities
+        city for city in graph.cities.values()
+        if needle in city['name'].casefold() or needle in city['state'].casefold()
     ]
 
 @app.post("/calculate-route", response_model=RouteResponse)
-async def calculate_route(request: RouteRequest):
+async def calculate_route(request: RouteCalculationRequest):
     """
     Calculate the shortest route between two cities using Dijkstra's Algorithm.
     
     This endpoint finds the shortest path between two Nigerian cities using
     Dijkstra's algorithm, considering all available road connections.
+    Set ``geometry`` to include the route shape as an encoded polyline, or
+    ``zoom`` for a shape simplified for that map zoom level.
+    """
+    if precomputed_wanted(request.geometry, request.zoom, request.trace):
+        result = await run_orm(lookup_route, request.from_city, request.to_city)
+        if result is not None:
+            return JSONResponse(route_body(result))
+    await shared_graph()
+    result = await run_blocking(calculate_shortest_route, request.from_city, request.to_city,
+                                request.geometry, request.zoom, request.trace)
+    return JSONResponse(route_body(result))
+
+@app.post("/calculate-route/from-coordinates", response_model=CoordinateRouteResponse)
+async def calculate_route_from_coordinates_endpoint(request: CoordinateRouteRequest):
+    """Calculate the route between two coordinates, snapped onto the nearest roads."""
+    await shared_graph()
+    result = await run_blocking(
+        calculate_route_from_coordinates,
+        request.from_lat, request.from_lng, request.to_lat, request.to_lng,
+    )
+    return JSONResponse(route_body(result, CoordinateRouteResponse))
+
+@app.post("/calculate-routes", response_model=RouteBatchResponse)
+async def calculate_route_batch(request: RouteBatchRequest):
+    """Calculate several routes in one request."""
+    if not request.routes:
+        raise HTTPException(status_code=400, detail="At least one route is required")
+    if len(request.routes) > settings.ROUTE_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.ROUTE_BATCH_MAX_QUERIES} routes can be calculated per request"
+        )
+    
+    await shared_graph()
+    queries = [(route.from_city, route.to_city) for route in request.routes]
+    results = await run_blocking(calculate_routes, queries)
+    return JSONResponse({
+        'success': True,
+        'results': [route_body(result) for result in results],
+        'count': len(results),
+    })
+
+@app.get("/calculate-route", response_model=RouteResponse)
+async def calculate_route_get(request: Request, from_city: str, to_city: str, geometry: bool = False,
+                              zoom: Optional[int] = Query(None, ge=0, le=22), trace: bool = False):
+    """
+    Cacheable GET form of ``POST /calculate-route``.
+    
+    Successful responses carry ETag and Cache-Control headers derived from
+    the graph version and the canonicalized query; conditional requests are
+    answered with 304 before any routing work. Answers from the precomputed
+    table take the graph version of their row, so they need no graph.
+    Traced responses include timings and are never cached.
+    """
+    if trace:
+        result = await run_blocking(calculate_shortest_route, from_city, to_city, geometry, zoom, True)
+        return JSONResponse(route_body(result))
+    
+    answer = None
+    if precomputed_wanted(geometry, zoom):
+        answer = await run_orm(lookup_versioned_route, from_city, to_city)
+    graph_version = answer[1] if answer is not None else (await shared_graph()).version
+    
+    headers = {}
+    if graph_version is not None:
+        validators = route_validators(graph_version, canonical_route_query(request.query_params))
+        headers = cache_headers(validators)
+        if is_not_modified(request.headers.get('if-none-match'), validators):
+            return Response(status_code=304, headers=headers)
+    
+    if answer is not None:
+        result = answer[0]
+    else:
+        result = await run_blocking(calculate_shortest_route, from_city, to_city, geometry, zoom)
+    return JSONResponse(route_body(result), headers=headers if result['success'] else {})
+
+async def read_route_queries(request: Request, queue: asyncio.Queue, chunk_lines: int):
+    """
+    Parse an NDJSON request body into groups of queries sharing a starting city.
+    
+    Lines are read in chunks of ``chunk_lines``; each chunk is split by starting
+    city and every group is put on ``queue`` as a list of
+    ``(line_number, from_city, to_city)`` tuples. Lines that are not valid
+    queries are put on the queue as ready-made error results. Because the
+    queue is bounded, reading the body pauses while the searches catch up.
+    """
+    async def flush(chunk):
+        groups = {}
+        for line_number, from_city, to_city in chunk:
+            groups.setdefault(from_city.strip().casefold(), []).append((line_number, from_city, to_city))
+        for group in groups.values():
+            await queue.put(group)
+    
+    async def parse(line_number, line):
+        try:
+            query = RouteRequest(**json.loads(line))
+        except Exception:
+            await queue.put(
+                {'line': line_number, 'success': False,
+                 'error': 'Invalid route query; expected {"from_city": ..., "to_city": ...}',
+                 'total_distance': None, 'path': [], 'cities': []}
+            )
+            return None
+        return line_number, query.from_city, query.to_city
+    
+    buffer = b''
+    line_number = 0
+    chunk = []
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            query = await parse(line_number, line)
+            if query is not None:
+                chunk.append(query)
+            if len(chunk) >= chunk_lines:
+                await flush(chunk)
+                chunk = []
+    
+    if buffer.strip():
+        query = await parse(line_number + 1, buffer)
+        if query is not None:
+            chunk.append(query)
+    await flush(chunk)
+    await queue.put(None)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that keeps reading the request body while it responds.
+    
+    StreamingResponse normally consumes ``receive`` to watch for disconnects,
+    which would steal the body chunks the generator is still reading. Here the
+    generator owns ``receive``; ``request.stream()`` raises on disconnect.
     """
-    result = calculate_shortest_route(request.from_city, request.to_city)
-    return RouteResponse(**result)
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def stream_line(line_number: int, result: Dict[str, Any]) -> bytes:
+    """Encode one route result as an NDJSON line."""
+    payload = route_body(result)
+    payload['line'] = line_number
+    return (json.dumps(payload) + '\n').encode()
+
+
+@app.post("/calculate-routes/stream")
+async def calculate_route_stream(request: Request):
+    """
+    Calculate routes from a streamed NDJSON body and stream the results back.
+    
+    Each request line is a route query such as ``{"from_city": "Lagos",
+    "to_city": "Kano"}``. Each response line is a RouteResponse plus the
+    ``line`` number of the query it answers. Results are emitted as each group
+    of queries sharing a starting city finishes, so they may arrive out of
+    order. At most ``ROUTE_STREAM_MAX_IN_FLIGHT`` groups are searched at once
+    and reading the body pauses while that window is full.
+    """
+    max_in_flight = settings.ROUTE_STREAM_MAX_IN_FLIGHT
+    await shared_graph()
+    
+    async def results():
+        queue = asyncio.Queue(maxsize=max_in_flight)
+        reader = asyncio.ensure_future(read_route_queries(request, queue, settings.ROUTE_STREAM_CHUNK_LINES))
+        in_flight = {}
+        getter = None
+        reading = True
+        try:
+            while reading or in_flight:
+                waiting = set(in_flight)
+                if reading and len(in_flight) < max_in_flight:
+                    if getter is None:
+                        getter = asyncio.ensure_future(queue.get())
+                    waiting.add(getter)
+                    if not reader.done():
+                        waiting.add(reader)
+                
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                
+                if reader.done() and reader.exception() is not None:
+                    raise reader.exception()
+                
+                if getter is not None and getter.done():
+                    item = getter.result()
+                    getter = None
+                    if item is None:
+                        reading = False
+                    elif isinstance(item, dict):
+                        yield stream_line(item.pop('line'), item)
+                    else:
+                        queries = [(from_city, to_city) for _, from_city, to_city in item]
+                        task = asyncio.ensure_future(run_blocking(calculate_routes, queries))
+                        in_flight[task] = [line_number for line_number, _, _ in item]
+                
+                for task in done:
+                    if task in in_flight:
+                        for line_number, result in zip(in_flight.pop(task), task.result()):
+                            yield stream_line(line_number, result)
+        finally:
+            reader.cancel()
+            if getter is not None:
+                getter.cancel()
+            for task in in_flight:
+                task.cancel()
+    
+    return DuplexStreamingResponse(results(), media_type='application/x-ndjson')
+
+@app.post("/route-matrix", response_model=RouteMatrixResponse)
+async def route_matrix(request: RouteMatrixRequest):
+    """Calculate distances between every source and target city."""
+    if not request.sources or not request.targets:
+        raise HTTPException(status_code=400, detail="Both sources and targets are required")
+    if len(request.sources) * len(request.targets) > settings.ROUTE_MATRIX_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A matrix may contain at most {settings.ROUTE_MATRIX_MAX_CELLS} cells"
+        )
+    
+    await shared_graph()
+    result = await run_blocking(calculate_route_matrix, request.sources, request.targets)
+    return RouteMatrixResponse(**result)
 
 @app.get("/info")
 async def get_api_info():
     """Get information about the API and available data."""
-    total_cities = City.objects.count()
-    total_connections = RoadConnection.objects.count()
+    graph = await shared_graph()
+    stats = graph.stats()
     
-    sample_cities = City.objects.filter(is_capital=True)[:5]
+    sample_cities = [city for city in graph.cities.values() if city['is_capital']][:5]
     
     return {
-        "total_cities": total_cities,
-        "total_road_connections": total_connections,
+        "total_cities": stats['total_cities'],
+        "total_road_connections": stats['total_road_connections'],
         "description": "Nigerian City Distance Calculator using Dijkstra's Algorithm",
         "sample_cities": [
             {
-                "id": city.id,
-                "name": city.name,
-                "state": city.state,
-                "is_capital": city.is_capital
+                "id": city['id'],
+                "name": city['name'],
+                "state": city['state'],
+                "is_capital": city['is_capital']
             }
             for city in sample_cities
         ]
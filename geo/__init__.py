@@ -0,0 +1,6 @@
+"""
+Geographic and graph helpers shared by the ``api`` and ``cities`` apps.
+
+Kept outside both apps, and free of Django imports, so that importing
+cities never pulls in the routing API.
+"""
@@ -0,0 +1,114 @@
+"""
+Static KD-tree over latitude/longitude points.
+
+The tree splits on raw latitude and longitude. Nearest-neighbour pruning
+uses the great-circle distance from the query point to each splitting
+parallel or meridian, which never overestimates, so results are exact
+haversine rankings.
+"""
+import heapq
+import math
+from typing import List, Tuple
+from .distance import EARTH_RADIUS_KM, haversine_km
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+LAT, LNG = 0, 1
+
+
+def _split_distance_km(lat: float, lng: float, axis: int, value: float) -> float:
+    """Lower bound on the distance from a point to anything across a split."""
+    if axis == LAT:
+        return abs(lat - value) * KM_PER_DEGREE
+    # Longitude gap to the other side, which may be reached across the antimeridian
+    if lng < value:
+        gap = min(value - lng, lng + 180)
+    else:
+        gap = min(lng - value, 180 - lng)
+    d_lambda = math.radians(min(gap, 90))
+    return EARTH_RADIUS_KM * math.asin(math.cos(math.radians(lat)) * math.sin(d_lambda))
+
+
+class KDTree:
+    """
+    Static 2-d tree over ``(latitude, longitude, key)`` points.
+
+    The tree is stored implicitly: the median of each slice of ``points``
+    is its root, with the lower and upper halves as subtrees, alternating
+    between the latitude and longitude axes.
+    """
+
+    def __init__(self, points: List[Tuple[float, float, object]]):
+        self.size = len(points)
+        self.points = self._build(list(points), 0)
+
+    def _build(self, points, depth):
+        if len(points) <= 1:
+            return points
+        points.sort(key=lambda p: p[depth % 2])
+        middle = len(points) // 2
+        return (
+            self._build(points[:middle], depth + 1)
+            + [points[middle]]
+            + self._build(points[middle + 1:], depth + 1)
+        )
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> List[Tuple[float, object]]:
+        """
+        The ``k`` points closest to ``(lat, lng)``.
+
+        Returns ``(distance_km, key)`` pairs, nearest first.
+        """
+        if not self.points or k <= 0:
+            return []
+        best = []  # max-heap of (-distance, -index)
+        # Slices with a lower bound on the distance to anything in them
+        stack = [(0, len(self.points), 0, 0.0)]
+        while stack:
+            low, high, depth, bound = stack.pop()
+            # The kth best may have improved since the slice was pushed
+            if low >= high or (len(best) == k and bound >= -best[0][0]):
+                continue
+            middle = (low + high) // 2
+            point = self.points[middle]
+            distance = haversine_km(lat, lng, point[LAT], point[LNG])
+            if len(best) < k:
+                heapq.heappush(best, (-distance, -middle))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, -middle))
+
+            axis = depth % 2
+            value = point[axis]
+            below = (lat, lng)[axis] < value
+            near, far = ((low, middle), (middle + 1, high)) if below else ((middle + 1, high), (low, middle))
+            # The far side is at least as far as the split, and is checked
+            # against the kth best again once the near side has been searched
+            far_bound = max(bound, _split_distance_km(lat, lng, axis, value))
+            if len(best) < k or far_bound < -best[0][0]:
+                stack.append((far[0], far[1], depth + 1, far_bound))
+            stack.append((near[0], near[1], depth + 1, bound))
+
+        results = [(-distance, self.points[-index][2]) for distance, index in best]
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def within(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[object]:
+        """Keys of all points inside the bounding box (edges inclusive)."""
+        low_corner = (min_lat, min_lng)
+        high_corner = (max_lat, max_lng)
+        results = []
+        stack = [(0, len(self.points), 0)]
+        while stack:
+            low, high, depth = stack.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            point = self.points[middle]
+            if min_lat <= point[LAT] <= max_lat and min_lng <= point[LNG] <= max_lng:
+                results.append(point[2])
+            axis = depth % 2
+            if low_corner[axis] <= point[axis]:
+                stack.append((low, middle, depth + 1))
+            if point[axis] <= high_corner[axis]:
+                stack.append((middle + 1, high, depth + 1))
+        return results
@@ -0,0 +1,151 @@
+"""
+Encoded polylines (the Google polyline algorithm format).
+
+Each coordinate is stored as the difference from the previous point,
+scaled to integers and written as base64-like variable-length groups, so
+a road shape costs a few bytes per point. Encoded lines can be joined by
+rewriting only the first point of each following line; the rest of its
+text is copied as-is, never decoded.
+
+This module deliberately avoids importing Django.
+"""
+import math
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+
+PRECISION = 5
+_SCALE = 10 ** PRECISION
+
+Point = Tuple[float, float]
+
+
+class EncodedLine(NamedTuple):
+    """An encoded polyline with the integer coordinates of its ends."""
+    text: str
+    # Length of the text encoding the first point
+    head: int
+    start: Tuple[int, int]
+    end: Tuple[int, int]
+
+
+def _encode_value(value: int, out: List[str]):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def _decode_value(text: str, position: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = ord(text[position]) - 63
+        position += 1
+        result |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            break
+    return (~(result >> 1) if result & 1 else result >> 1), position
+
+
+def quantize(point: Point) -> Tuple[int, int]:
+    """Integer coordinates of a point at the encoding precision."""
+    return round(point[0] * _SCALE), round(point[1] * _SCALE)
+
+
+def encode(points: Sequence[Point]) -> str:
+    """Encode ``(latitude, longitude)`` points."""
+    out = []
+    previous = (0, 0)
+    for point in points:
+        current = quantize(point)
+        _encode_value(current[0] - previous[0], out)
+        _encode_value(current[1] - previous[1], out)
+        previous = current
+    return ''.join(out)
+
+
+def decode(text: str) -> List[Point]:
+    """Decode text produced by :func:`encode` into ``(latitude, longitude)`` points."""
+    points = []
+    position = 0
+    lat = lng = 0
+    while position < len(text):
+        d_lat, position = _decode_value(text, position)
+        d_lng, position = _decode_value(text, position)
+        lat += d_lat
+        lng += d_lng
+        points.append((lat / _SCALE, lng / _SCALE))
+    return points
+
+
+def encoded_line(points: Sequence[Point]) -> EncodedLine:
+    """Encode points, keeping what :func:`join` needs to splice the result."""
+    text = encode(points)
+    head = len(encode(points[:1]))
+    return EncodedLine(text, head, quantize(points[0]), quantize(points[-1]))
+
+
+def join(lines: Iterable[EncodedLine]) -> str:
+    """
+    Concatenate encoded lines into one.
+
+    Only the first point of each following line is re-encoded, relative to
+    the end of the line before it, and dropped entirely when the two
+    coincide.
+    """
+    out = []
+    previous_end = None
+    for line in lines:
+        if previous_end is None:
+            out.append(line.text)
+        else:
+            if line.start != previous_end:
+                delta = []
+                _encode_value(line.start[0] - previous_end[0], delta)
+                _encode_value(line.start[1] - previous_end[1], delta)
+                out.extend(delta)
+            out.append(line.text[line.head:])
+        previous_end = line.end
+    return ''.join(out)
+
+
+def simplify(points: Sequence[Point], tolerance: float) -> List[Point]:
+    """
+    Douglas-Peucker simplification.
+
+    Drops points closer than ``tolerance`` degrees to the line through the
+    points kept around them; longitudes are scaled by the cosine of the
+    latitude so the tolerance means the same distance in both directions.
+    The first and last points are always kept.
+    """
+    if len(points) < 3:
+        return list(points)
+    lng_scale = math.cos(math.radians(points[0][0]))
+    xy = [(lng * lng_scale, lat) for lat, lng in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (ax, ay), (bx, by) = xy[first], xy[last]
+        dx, dy = bx - ax, by - ay
+        length = math.hypot(dx, dy)
+        farthest, farthest_distance = None, tolerance
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length:
+                distance = abs(dy * (px - ax) - dx * (py - ay)) / length
+            else:
+                distance = math.hypot(px - ax, py - ay)
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """Size in degrees of one 256-pixel-tile pixel at a web map zoom level."""
+    return 360 / (256 * 2 ** zoom)
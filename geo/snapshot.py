@@ -0,0 +1,241 @@
+"""
+Compact, shareable snapshots of the routing graph.
+
+A snapshot stores the graph in compressed sparse row (CSR) form: node IDs,
+per-node edge offsets, edge targets and edge weights, each held in a flat
+typed array. The arrays can be copied once into a shared memory block so
+worker processes attach to the same graph instead of receiving a pickled
+copy with every task.
+
+This module deliberately avoids importing Django, so it can be loaded in
+freshly spawned worker processes.
+"""
+import heapq
+import struct
+from array import array
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+INT_TYPE = 'q'
+FLOAT_TYPE = 'd'
+_ITEM_SIZE = 8
+
+# Snapshot files: magic, then node count, edge count and version length as
+# little-endian int64, the version, and the four arrays in native byte order
+FILE_MAGIC = b'CSRSNAP1'
+_FILE_HEADER = struct.Struct('<qqq')
+
+
+class GraphSnapshot:
+    """Graph in CSR form, backed by typed arrays or shared memory views."""
+
+    def __init__(self, node_ids, offsets, targets, weights, version: Optional[str] = None):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.version = version
+        self._index = None
+        self._shm = None
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Dict[int, List[Tuple[int, float]]], version: Optional[str] = None):
+        """
+        Build a snapshot from a ``{node_id: [(neighbor_id, weight), ...]}`` mapping.
+
+        Nodes are stored in ascending ID order and each adjacency list keeps
+        its original order, so searches break ties exactly like
+        ``DijkstraGraph.dijkstra`` does.
+        """
+        node_ids = array(INT_TYPE, sorted(adjacency))
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        offsets = array(INT_TYPE, [0])
+        targets = array(INT_TYPE)
+        weights = array(FLOAT_TYPE)
+        for node_id in node_ids:
+            for neighbor_id, weight in adjacency[node_id]:
+                targets.append(index[neighbor_id])
+                weights.append(weight)
+            offsets.append(len(targets))
+        snapshot = cls(node_ids, offsets, targets, weights, version)
+        snapshot._index = index
+        return snapshot
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    @property
+    def nbytes(self) -> int:
+        return _ITEM_SIZE * (2 * len(self.node_ids) + 1 + 2 * len(self.targets))
+
+    def index_of(self, node_id: int) -> int:
+        """Position of a node ID in the snapshot arrays."""
+        if self._index is None:
+            self._index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        return self._index[node_id]
+
+    def to_shared_memory(self) -> Tuple['GraphSnapshot', Tuple]:
+        """
+        Copy the arrays into a new shared memory block.
+
+        Returns the shared snapshot and a small picklable handle that other
+        processes pass to :meth:`attach`. The caller owns the block and must
+        call :meth:`release` with ``unlink=True`` when done.
+        """
+        n, m = self.node_count, self.edge_count
+        shm = shared_memory.SharedMemory(create=True, size=max(self.nbytes, 1))
+        position = 0
+        for source in (self.node_ids, self.offsets, self.targets, self.weights):
+            raw = source.tobytes()
+            shm.buf[position:position + len(raw)] = raw
+            position += len(raw)
+        handle = (shm.name, n, m, self.version)
+        shared = self._from_buffer(shm, n, m, self.version)
+        shared._index = self._index
+        return shared, handle
+
+    @classmethod
+    def attach(cls, handle: Tuple) -> 'GraphSnapshot':
+        """Attach to a snapshot created by :meth:`to_shared_memory`."""
+        name, n, m, version = handle
+        return cls._from_buffer(shared_memory.SharedMemory(name=name), n, m, version)
+
+    @classmethod
+    def _from_buffer(cls, shm, n, m, version):
+        buf = shm.buf
+        views = []
+        position = 0
+        for count, typecode in ((n, INT_TYPE), (n + 1, INT_TYPE), (m, INT_TYPE), (m, FLOAT_TYPE)):
+            size = count * _ITEM_SIZE
+            views.append(buf[position:position + size].cast(typecode))
+            position += size
+        snapshot = cls(*views, version)
+        snapshot._shm = shm
+        return snapshot
+
+    def save(self, path: str):
+        """Write the snapshot to a file that :meth:`load` reads back."""
+        version = (self.version or '').encode()
+        with open(path, 'wb') as handle:
+            handle.write(FILE_MAGIC)
+            handle.write(_FILE_HEADER.pack(self.node_count, self.edge_count, len(version)))
+            handle.write(version)
+            for values in (self.node_ids, self.offsets, self.targets, self.weights):
+                handle.write(memoryview(values).cast('B'))
+
+    @classmethod
+    def load(cls, path: str) -> 'GraphSnapshot':
+        """Read a snapshot written by :meth:`save`."""
+        with open(path, 'rb') as handle:
+            if handle.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f'{path} is not a graph snapshot file')
+            n, m, version_length = _FILE_HEADER.unpack(handle.read(_FILE_HEADER.size))
+            version = handle.read(version_length).decode() or None
+            arrays = []
+            for count, typecode in ((n, INT_TYPE), (n + 1, INT_TYPE), (m, INT_TYPE), (m, FLOAT_TYPE)):
+                values = array(typecode)
+                values.fromfile(handle, count)
+                arrays.append(values)
+        return cls(*arrays, version)
+
+    def release(self, unlink: bool = False):
+        """Detach from shared memory, optionally destroying the block."""
+        if self._shm is None:
+            return
+        for view in (self.node_ids, self.offsets, self.targets, self.weights):
+            view.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
+
+    def shortest_paths(self, source: int, targets, with_paths: bool = True):
+        """
+        One-to-many Dijkstra search over node indices.
+
+        Stops as soon as every target is settled. Returns
+        ``(distances, previous)`` dictionaries keyed by node index;
+        ``previous`` is None when ``with_paths`` is False.
+        """
+        offsets, edge_targets, weights = self.offsets, self.targets, self.weights
+        distances = {source: 0.0}
+        previous = {source: -1} if with_paths else None
+        remaining = set(targets)
+        remaining.discard(source)
+        settled = set()
+        pq = [(0.0, source)]
+
+        while pq and remaining:
+            current_distance, node = heapq.heappop(pq)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbor = edge_targets[edge]
+                if neighbor in settled:
+                    continue
+                new_distance = current_distance + weights[edge]
+                if new_distance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = new_distance
+                    if with_paths:
+                        previous[neighbor] = node
+                    heapq.heappush(pq, (new_distance, neighbor))
+
+        return distances, previous
+
+
+# Snapshot attached by each worker process in its pool initializer
+_worker_snapshot = None
+
+
+def attach_worker(handle: Tuple):
+    """Process pool initializer: attach this worker to the shared snapshot."""
+    global _worker_snapshot
+    _worker_snapshot = GraphSnapshot.attach(handle)
+
+
+def solve_chunk(chunk, with_paths: bool):
+    """
+    Solve a chunk of one-to-many searches inside a worker process.
+
+    Args:
+        chunk: List of ``(source_index, target_indices)`` pairs, one per source
+        with_paths: Whether to return paths as well as distances
+
+    Returns:
+        One ``(distances, path_nodes, path_offsets)`` tuple per source.
+        ``distances`` is an ``array('d')`` aligned with the targets, with
+        ``inf`` for unreachable ones. When paths are requested, the path to
+        target ``i`` is ``path_nodes[path_offsets[i]:path_offsets[i + 1]]``
+        (node indices); otherwise both are None.
+    """
+    snapshot = _worker_snapshot
+    results = []
+    for source, targets in chunk:
+        distances, previous = snapshot.shortest_paths(source, targets, with_paths)
+        target_distances = array(FLOAT_TYPE, (distances.get(t, float('inf')) for t in targets))
+        if not with_paths:
+            results.append((target_distances, None, None))
+            continue
+
+        path_nodes = array(INT_TYPE)
+        path_offsets = array(INT_TYPE, [0])
+        for target in targets:
+            if target in previous:
+                path = []
+                node = target
+                while node != -1:
+                    path.append(node)
+                    node = previous[node]
+                path.reverse()
+                path_nodes.extend(path)
+            path_offsets.append(len(path_nodes))
+        results.append((target_distances, path_nodes, path_offsets))
+    return results
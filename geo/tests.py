@@ -0,0 +1,115 @@
+"""Tests of the encoded polyline helpers and the KD-tree."""
+import random
+from unittest import TestCase, mock
+from . import kdtree
+from .distance import haversine_km
+from .kdtree import KDTree
+from .polyline import decode, encode, encoded_line, join, quantize, simplify, zoom_tolerance
+
+
+def random_line(rng: random.Random, count: int):
+    lat, lng = rng.uniform(-80, 80), rng.uniform(-179, 179)
+    points = []
+    for _ in range(count):
+        lat = max(-90.0, min(90.0, lat + rng.uniform(-0.5, 0.5)))
+        lng = max(-180.0, min(180.0, lng + rng.uniform(-0.5, 0.5)))
+        points.append((lat, lng))
+    return points
+
+
+class PolylineTests(TestCase):
+
+    def test_known_encoding(self):
+        # The example from the format's documentation
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), points)
+
+    def test_round_trip(self):
+        rng = random.Random(2)
+        for count in (0, 1, 2, 50):
+            points = random_line(rng, count)
+            decoded = decode(encode(points))
+            self.assertEqual(len(decoded), len(points))
+            for point, decoded_point in zip(points, decoded):
+                self.assertEqual(quantize(decoded_point), quantize(point))
+            # Points at the encoding precision survive exactly
+            self.assertEqual(decode(encode(decoded)), decoded)
+
+    def test_extremes(self):
+        points = [(90.0, 180.0), (-90.0, -180.0), (0.0, 0.0), (0.00001, -0.00001)]
+        self.assertEqual(decode(encode(points)), points)
+
+    def test_join(self):
+        rng = random.Random(4)
+        for _ in range(20):
+            lines = [random_line(rng, rng.randint(1, 6)) for _ in range(rng.randint(1, 5))]
+            # Some lines continue exactly where the one before ended
+            for previous, line in zip(lines, lines[1:]):
+                if rng.random() < 0.5:
+                    line[0] = previous[-1]
+            expected = list(lines[0])
+            for line in lines[1:]:
+                if quantize(line[0]) == quantize(expected[-1]):
+                    expected.extend(line[1:])
+                else:
+                    expected.extend(line)
+            self.assertEqual(decode(join(map(encoded_line, lines))), decode(encode(expected)))
+
+    def test_simplify(self):
+        straight = [(0.0, lng / 10) for lng in range(11)]
+        self.assertEqual(simplify(straight, 1e-9), [straight[0], straight[-1]])
+        rng = random.Random(6)
+        points = random_line(rng, 200)
+        for zoom in (0, 8, 16):
+            simplified = simplify(points, zoom_tolerance(zoom))
+            self.assertEqual(simplified[0], points[0])
+            self.assertEqual(simplified[-1], points[-1])
+            # Kept points stay in order
+            positions = [points.index(point) for point in simplified]
+            self.assertEqual(positions, sorted(positions))
+        self.assertEqual(simplify(points, 0), points)
+
+
+class KDTreeTests(TestCase):
+    """The KD-tree must answer exactly like a scan of every point."""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = [(rng.uniform(-60, 60), rng.uniform(-180, 180), key) for key in range(800)]
+        # A cluster on both sides of the antimeridian
+        self.points += [(rng.uniform(-5, 5), rng.choice((-1, 1)) * rng.uniform(178, 180), 800 + key)
+                        for key in range(40)]
+        self.tree = KDTree(list(self.points))
+        self.queries = [(rng.uniform(-70, 70), rng.uniform(-180, 180)) for _ in range(200)]
+        self.queries += [(0.0, 179.95), (1.0, -179.99), (90.0, 0.0), (-90.0, 45.0)]
+
+    def test_nearest(self):
+        for lat, lng in self.queries:
+            for k in (1, 5):
+                expected = sorted((haversine_km(lat, lng, p_lat, p_lng), key) for p_lat, p_lng, key in self.points)[:k]
+                found = self.tree.nearest(lat, lng, k)
+                self.assertEqual([key for _, key in found], [key for _, key in expected])
+                for (distance, _), (expected_distance, _) in zip(found, expected):
+                    self.assertAlmostEqual(distance, expected_distance, places=9)
+
+    def test_nearest_prunes(self):
+        with mock.patch.object(kdtree, 'haversine_km', wraps=haversine_km) as distance:
+            for lat, lng in self.queries:
+                self.tree.nearest(lat, lng)
+        # A few root-to-leaf paths per query, not a scan of every point
+        self.assertLess(distance.call_count / len(self.queries), len(self.points) / 25)
+
+    def test_nearest_more_than_size(self):
+        tree = KDTree([(1.0, 1.0, 'a'), (2.0, 2.0, 'b')])
+        self.assertEqual([key for _, key in tree.nearest(0.0, 0.0, 5)], ['a', 'b'])
+        self.assertEqual(KDTree([]).nearest(0.0, 0.0, 3), [])
+
+    def test_within(self):
+        rng = random.Random(11)
+        for _ in range(100):
+            min_lat, max_lat = sorted(rng.uniform(-70, 70) for _ in range(2))
+            min_lng, max_lng = sorted(rng.uniform(-180, 180) for _ in range(2))
+            expected = {key for lat, lng, key in self.points
+                        if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng}
+            self.assertEqual(set(self.tree.within(min_lat, min_lng, max_lat, max_lng)), expected)